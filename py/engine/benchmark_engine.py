@@ -0,0 +1,240 @@
+import argparse
+import difflib
+import random
+import time
+
+import numpy
+
+import engine
+
+
+def syntheticType(i: int, representations: int = 8, ports: int = 8, attributes: int = 8) -> dict:
+    return {
+        "name": f"Type {i}",
+        "variant": "",
+        "description": f"The synthetic type number {i}.",
+        "representations": [
+            {
+                "url": f"type-{i}/representation-{r}.glb",
+                "tags": [f"lod{r}", "glb"],
+                "attributes": [{"name": f"attribute {a}", "value": str(a)} for a in range(attributes)] + ([{"name": engine.BOUNDS_ATTRIBUTE, "value": f"-0.5,-0.5,-0.5,{ports - 0.5},0.5,0.5"}] if r == 0 else []),
+            }
+            for r in range(representations)
+        ],
+        "ports": [
+            {
+                "id_": f"p{p}",
+                "family": f"family {p % 4}",
+                "compatibleFamilies": [f"family {(p + 1) % 4}"],
+                "point": {"x": float(p), "y": 0.0, "z": 0.0},
+                "direction": {"x": 0.0, "y": 1.0, "z": 0.0},
+                "attributes": [{"name": f"attribute {a}", "value": str(a)} for a in range(attributes)],
+            }
+            for p in range(ports)
+        ],
+        "attributes": [{"name": f"attribute {a}", "value": str(a)} for a in range(attributes)],
+        "concepts": ["synthetic"],
+    }
+
+
+def syntheticDesign(i: int, types: int, pieces: int = 32, branching: int = 1) -> dict:
+    """A tree of pieces where every piece has up to `branching` children. One is a chain."""
+    return {
+        "name": f"Design {i}",
+        "pieces": [{"id_": f"p{p}", "type": {"name": f"Type {(i + p) % types}", "variant": ""}, "plane": None, "center": None} for p in range(pieces)],
+        "connections": [
+            {
+                "connected": {"piece": {"id_": f"p{(p - 1) // branching}"}, "port": {"id_": "p0"}},
+                "connecting": {"piece": {"id_": f"p{p}"}, "port": {"id_": "p1"}},
+                "gap": 0.1,
+                "rotation": (p * 15) % 360,
+                "tilt": (p * 5) % 360,
+            }
+            for p in range(1, pieces)
+        ],
+    }
+
+
+def syntheticKit(types: int, designs: int) -> dict:
+    return {
+        "uri": "synthetic",
+        "name": "Synthetic",
+        "types": [syntheticType(i) for i in range(types)],
+        "designs": [syntheticDesign(i, types) for i in range(designs)],
+    }
+
+
+def benchmarkKitParse(sizes: list[int], processes: int) -> None:
+    """⏱️ Compare sequential and parallel kit parsing for growing kits."""
+    print(f"{'types':>8} {'designs':>8} {'sequential [s]':>16} {f'{processes} processes [s]':>18} {'speedup':>8}")
+    for size in sizes:
+        kit = syntheticKit(size, max(1, size // 4))
+        start = time.perf_counter()
+        engine.Kit.parse(kit)
+        sequential = time.perf_counter() - start
+        start = time.perf_counter()
+        engine.Kit.parse(kit, processes)
+        parallel = time.perf_counter() - start
+        print(f"{size:>8} {max(1, size // 4):>8} {sequential:>16.3f} {parallel:>18.3f} {sequential / parallel:>8.2f}")
+
+
+def placeNaively(scene: engine.Scene) -> numpy.ndarray:
+    """Place the pieces of a scene one by one with the transform of a single connection."""
+    transforms: dict[str, engine.Transform] = {}
+    for piece in sorted(scene.design.pieces, key=lambda p: scene.depths[p.id_]):
+        parentId = scene.parents[piece.id_]
+        if parentId is None:
+            transforms[piece.id_] = engine.Transform(scene.transforms[scene.indices[piece.id_]])
+            continue
+        connection, isReversed = scene.connections[piece.id_]
+        transform = engine.connectionTransform(connection.connectedPort, connection.connectingPort, connection)
+        transforms[piece.id_] = transforms[parentId].after(transform.invert() if isReversed else transform)
+    return numpy.array([transforms[p.id_] for p in scene.design.pieces])
+
+
+def benchmarkScene(sizes: list[int], branching: int, repeats: int) -> None:
+    """⏱️ Compare placing pieces one by one with the batch transform kernel for growing designs."""
+    types = [engine.Type.parse(syntheticType(i)) for i in range(8)]
+    print(f"{'pieces':>8} {'naive [ms]':>12} {'kernel [ms]':>12} {'speedup':>8} {'deviation':>10}")
+    for size in sizes:
+        scene = engine.Scene(engine.Design.parse(syntheticDesign(0, len(types), size, branching), types))
+        start = time.perf_counter()
+        for _ in range(repeats):
+            naive = placeNaively(scene)
+        naiveTime = (time.perf_counter() - start) / repeats
+        start = time.perf_counter()
+        for _ in range(repeats):
+            scene.compose()
+        kernelTime = (time.perf_counter() - start) / repeats
+        deviation = numpy.abs(naive - scene.transforms).max()
+        print(f"{size:>8} {naiveTime * 1000:>12.2f} {kernelTime * 1000:>12.2f} {naiveTime / kernelTime:>8.1f} {deviation:>10.1e}")
+
+
+def benchmarkClashes(sizes: list[int], branching: int, repeats: int) -> None:
+    """⏱️ Compare testing all pairs of oriented boxes with sweeping the world bounds first for growing designs."""
+    types = [engine.Type.parse(syntheticType(i)) for i in range(8)]
+    print(f"{'pieces':>8} {'all pairs [ms]':>16} {'swept [ms]':>12} {'speedup':>8} {'clashes':>8}")
+    for size in sizes:
+        scene = engine.Scene(engine.Design.parse(syntheticDesign(0, len(types), size, branching), types))
+        instance = scene.instance()
+        bounds = numpy.array([engine.typeBounds(t) for t in instance.types])
+        pairs = numpy.array(numpy.triu_indices(len(bounds), 1)).T
+        start = time.perf_counter()
+        for _ in range(repeats):
+            allPairs = pairs[engine.orientedBoxesOverlap(*engine.orientedBoxes(instance.transforms, bounds), pairs)]
+        allPairsTime = (time.perf_counter() - start) / repeats
+        start = time.perf_counter()
+        for _ in range(repeats):
+            swept = engine.clashes(instance.transforms, bounds)
+        sweptTime = (time.perf_counter() - start) / repeats
+        assert numpy.array_equal(allPairs, swept)
+        print(f"{size:>8} {allPairsTime * 1000:>16.2f} {sweptTime * 1000:>12.2f} {allPairsTime / sweptTime:>8.1f} {len(swept):>8}")
+
+
+def perturbedName(name: str, rng: random.Random, edits: int = 2) -> str:
+    """A name with a few random substitutions, deletions and insertions like in a predicted design."""
+    characters = list(name)
+    for _ in range(edits):
+        position = rng.randrange(len(characters))
+        match rng.randrange(3):
+            case 0:
+                characters[position] = rng.choice("abcdefghijklmnopqrstuvwxyz")
+            case 1:
+                del characters[position]
+            case 2:
+                characters.insert(position, rng.choice("abcdefghijklmnopqrstuvwxyz"))
+    return "".join(characters)
+
+
+def benchmarkFuzzy(sizes: list[int], queries: int) -> None:
+    """⏱️ Compare looking up unknown names with difflib over all names with the prebuilt fuzzy index for growing catalogs."""
+    rng = random.Random(0)
+    words = ["column", "beam", "slab", "wall", "window", "door", "roof", "stair", "brace", "joint", "footing", "panel"]
+    print(f"{'names':>8} {'difflib [ms]':>14} {'index [ms]':>12} {'build [ms]':>12} {'speedup':>8} {'agreement':>10}")
+    for size in sizes:
+        names = list(dict.fromkeys(f"{rng.choice(words)} {rng.choice(words)} {i}" for i in range(size)))
+        lookups = [perturbedName(rng.choice(names), rng) for _ in range(queries)]
+        start = time.perf_counter()
+        expected = [next(iter(difflib.get_close_matches(q, names, n=1)), None) for q in lookups]
+        difflibTime = (time.perf_counter() - start) / queries
+        start = time.perf_counter()
+        index = engine.FuzzyIndex(names)
+        buildTime = time.perf_counter() - start
+        start = time.perf_counter()
+        actual = [index.closest(q) for q in lookups]
+        indexTime = (time.perf_counter() - start) / queries
+        agreement = sum(e == a for e, a in zip(expected, actual)) / queries
+        print(f"{len(names):>8} {difflibTime * 1000:>14.3f} {indexTime * 1000:>12.3f} {buildTime * 1000:>12.2f} {difflibTime / indexTime:>8.1f} {agreement:>10.1%}")
+
+
+def benchmarkEmbedding(sizes: list[int], queries: int) -> None:
+    """⏱️ Compare looking up unknown types one by one with difflib with a single query of the type embedding index for growing catalogs."""
+    rng = random.Random(0)
+    print(f"{'types':>8} {'difflib [ms]':>14} {'index [ms]':>12} {'build [ms]':>12} {'speedup':>8}")
+    for size in sizes:
+        types = [engine.TypeContext.model_validate(syntheticType(i)) for i in range(size)]
+        names = [t.name for t in types]
+        lookups = [perturbedName(rng.choice(names), rng) for _ in range(queries)]
+        start = time.perf_counter()
+        [next(iter(difflib.get_close_matches(q, names, n=1)), None) for q in lookups]
+        difflibTime = (time.perf_counter() - start) / queries
+        start = time.perf_counter()
+        index = engine.TypeEmbeddingIndex((t.name, t.variant, t.description) for t in types)
+        buildTime = time.perf_counter() - start
+        start = time.perf_counter()
+        index.nearest(lookups)
+        indexTime = (time.perf_counter() - start) / queries
+        print(f"{size:>8} {difflibTime * 1000:>14.3f} {indexTime * 1000:>12.3f} {buildTime * 1000:>12.2f} {difflibTime / indexTime:>8.1f}")
+
+
+def benchmarkPrompt(sizes: list[int]) -> None:
+    """⏱️ Compare the size of the full and the compact encoding of the types prompt for growing kits."""
+    print(f"{'types':>8} {'full [tokens]':>14} {'compact [tokens]':>17} {'reduction':>10} {'full [ms]':>10} {'compact [ms]':>13}")
+    for size in sizes:
+        types = [engine.TypeContext.model_validate(syntheticType(i)) for i in range(size)]
+        start = time.perf_counter()
+        full = engine.renderTypesPrompt(types, "full")
+        fullTime = time.perf_counter() - start
+        start = time.perf_counter()
+        compact = engine.renderTypesPrompt(types, "compact")
+        compactTime = time.perf_counter() - start
+        fullTokens, compactTokens = engine.estimateTokens(full), engine.estimateTokens(compact)
+        print(f"{size:>8} {fullTokens:>14} {compactTokens:>17} {1 - compactTokens / fullTokens:>10.1%} {fullTime * 1000:>10.2f} {compactTime * 1000:>13.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="semio ⋅ engine benchmarks")
+    benchmarks = parser.add_subparsers(dest="benchmark", required=True)
+    kitParse = benchmarks.add_parser("kit-parse", help="sequential vs parallel kit parsing")
+    kitParse.add_argument("-p", "--processes", type=int, default=4)
+    kitParse.add_argument("-s", "--sizes", type=int, nargs="+", default=[16, 64, 128, engine.TYPES_MAX])
+    scene = benchmarks.add_parser("scene", help="per-piece vs batch placement of pieces")
+    scene.add_argument("-b", "--branching", type=int, default=4)
+    scene.add_argument("-r", "--repeats", type=int, default=10)
+    scene.add_argument("-s", "--sizes", type=int, nargs="+", default=[16, 64, 256, engine.PIECES_MAX])
+    clash = benchmarks.add_parser("clash", help="all pairs vs swept clash detection")
+    clash.add_argument("-b", "--branching", type=int, default=4)
+    clash.add_argument("-r", "--repeats", type=int, default=10)
+    clash.add_argument("-s", "--sizes", type=int, nargs="+", default=[16, 64, 256, engine.PIECES_MAX])
+    fuzzy = benchmarks.add_parser("fuzzy", help="difflib vs prebuilt fuzzy index lookups")
+    fuzzy.add_argument("-q", "--queries", type=int, default=200)
+    fuzzy.add_argument("-s", "--sizes", type=int, nargs="+", default=[64, engine.TYPES_MAX, 4096, 16384])
+    embedding = benchmarks.add_parser("embedding", help="difflib vs type embedding index lookups")
+    embedding.add_argument("-q", "--queries", type=int, default=200)
+    embedding.add_argument("-s", "--sizes", type=int, nargs="+", default=[64, engine.TYPES_MAX, 4096])
+    prompt = benchmarks.add_parser("prompt", help="full vs compact types prompt")
+    prompt.add_argument("-s", "--sizes", type=int, nargs="+", default=[16, 64, engine.TYPES_MAX])
+    args = parser.parse_args()
+    match args.benchmark:
+        case "kit-parse":
+            benchmarkKitParse(args.sizes, args.processes)
+        case "scene":
+            benchmarkScene(args.sizes, args.branching, args.repeats)
+        case "clash":
+            benchmarkClashes(args.sizes, args.branching, args.repeats)
+        case "fuzzy":
+            benchmarkFuzzy(args.sizes, args.queries)
+        case "embedding":
+            benchmarkEmbedding(args.sizes, args.queries)
+        case "prompt":
+            benchmarkPrompt(args.sizes)
@@ -29,7 +29,6 @@ from __future__ import annotations
 # region TODOs
 # TODO: Make loguru work on extra uvicorn engine process.
 # TODO: Replace prototype healing with one that makes more for every single property.
-# TODO: Try closest embedding instead of smallest Levenshtein distance.
 # TODO: Automatic derive from Id model.
 # TODO: Automatic emptying.
 # TODO: Automatic updating based on props.
@@ -43,34 +42,49 @@ from __future__ import annotations
 # region Imports
 import abc
 import argparse
+import asyncio
+import bisect
+import collections
+import concurrent.futures
 import datetime
 import difflib
 import enum
 import functools
+import hashlib
+import heapq
 import inspect
 import io
+import itertools
 import json
 import logging
 import multiprocessing
 import os
 import pathlib
+import random
+import re
 import shutil
 import signal
 import sqlite3
 import sys
+import threading
+import time
 import typing
 import urllib
+import weakref
 import zipfile
+import zlib
 
 import dotenv
 import fastapi
 import fastapi.openapi
+import fastapi.responses
 import graphene
 import graphene_pydantic
 import graphene_sqlalchemy
 import jinja2
 import lark
 import loguru
+import numpy
 import openai
 import pydantic
 import PySide6.QtCore
@@ -118,6 +132,7 @@ REPRESENTATIONS_MAX = 32
 TYPES_MAX = 256
 PIECES_MAX = 512
 DESIGNS_MAX = 128
+DESCRIPTIONS_MAX = 64
 KITS_MAX = 64
 DESCRIPTION_LENGTH_LIMIT = 512
 ENCODING_ALPHABET_REGEX = r"[a-zA-Z0-9\-._~%]"
@@ -127,6 +142,7 @@ KIT_LOCAL_FILENAME = "kit.db"
 KIT_LOCAL_SUFFIX = str(pathlib.Path(KIT_LOCAL_FOLDERNAME) / pathlib.Path(KIT_LOCAL_FILENAME))
 USER_FOLDER = str(pathlib.Path.home() / ".semio")
 CACHE_FOLDER = str(pathlib.Path(USER_FOLDER) / "cache")
+PREDICTION_CACHE_FOLDER = str(pathlib.Path(CACHE_FOLDER) / "predictions")
 LOG_FOLDER = str(pathlib.Path(USER_FOLDER) / "logs")
 DEBUG_LOG_FILE = str(pathlib.Path(LOG_FOLDER) / "debug.log")
 TOLERANCE = 1e-5
@@ -151,8 +167,49 @@ ENCODED_PATH = typing.Annotated[str, fastapi.Path(pattern=ENCODING_REGEX)]
 ENCODED_NAME_AND_VARIANT_PATH = typing.Annotated[str, fastapi.Path(pattern=ENCODING_REGEX + "," + ENCODING_ALPHABET_REGEX + "*")]
 ENCODED_NAME_AND_VARIANT_AND_VIEW_PATH = typing.Annotated[str, fastapi.Path(pattern=ENCODING_REGEX + "," + ENCODING_ALPHABET_REGEX + "*" + "," + ENCODING_ALPHABET_REGEX + "*")]
 MAX_REQUEST_BODY_SIZE = 50 * 1024 * 1024  # 50MB
+COLLECTION_LIMITS = {
+    "types": TYPES_MAX,
+    "designs": DESIGNS_MAX,
+    "pieces": PIECES_MAX,
+    "attributes": ATTRIBUTES_MAX,
+    "representations": REPRESENTATIONS_MAX,
+    "descriptions": DESCRIPTIONS_MAX,
+}
+STREAM_BATCH_SIZE = 32
+BOUNDS_ATTRIBUTE = "bounds"
+FUZZY_CUTOFF = 0.6
+FUZZY_CANDIDATES = 8
+HEALING_INDICES_MAX = 16
+EMBEDDING_DIMENSIONS = 1024
+EMBEDDING_CUTOFF = 0.1
+TYPES_PROMPTS_MAX = 16
+DISCONNECT_POLL_INTERVAL = 0.5
+DURATION_BOUNDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100)
+TOKEN_BOUNDS = tuple(2**i for i in range(6, 18))
+COUNT_BOUNDS = (0, 1, 2, 4, 8, 16, 32, 64, 128, 256)
 dotenv.load_dotenv()
 ENVS = {key: value for key, value in os.environ.items() if key.startswith("SEMIO_")}
+try:
+    PARSE_PROCESSES = int(ENVS.get("SEMIO_PARSE_PROCESSES", "1"))
+    if PARSE_PROCESSES < 1:
+        raise ValueError()
+except ValueError:
+    loguru.logger.warning(f"🏭 SEMIO_PARSE_PROCESSES has to be a positive integer but is {ENVS['SEMIO_PARSE_PROCESSES']!r}. Kits are parsed in one process.")
+    PARSE_PROCESSES = 1
+PREDICTION_PROVIDER = ENVS.get("SEMIO_PREDICTION_PROVIDER", "openai")
+PREDICTION_MODEL = ENVS.get("SEMIO_PREDICTION_MODEL", "gpt-4o")
+PREDICTION_LOCAL_URL = ENVS.get("SEMIO_PREDICTION_LOCAL_URL", "http://127.0.0.1:8080/v1")
+PREDICTION_REPLAY_FILE = ENVS.get("SEMIO_PREDICTION_REPLAY_FILE", str(pathlib.Path(USER_FOLDER) / "predictions.jsonl"))
+PREDICTION_RECORD_FILE = ENVS.get("SEMIO_PREDICTION_RECORD_FILE", "")
+PREDICTION_PROMPT_ENCODING = ENVS.get("SEMIO_PREDICTION_PROMPT_ENCODING", "full")
+PREDICTION_TYPE_FILTER = ENVS.get("SEMIO_PREDICTION_TYPE_FILTER", "false").lower() in ("1", "true", "yes")
+PREDICTION_LARGEST_COMPONENT = ENVS.get("SEMIO_PREDICTION_LARGEST_COMPONENT", "false").lower() in ("1", "true", "yes")
+PREDICTION_TIMEOUT = float(ENVS.get("SEMIO_PREDICTION_TIMEOUT", "120"))
+PREDICTION_CONCURRENCY = int(ENVS.get("SEMIO_PREDICTION_CONCURRENCY", "4"))
+PREDICTION_RETRIES = int(ENVS.get("SEMIO_PREDICTION_RETRIES", "3"))
+PREDICTION_BACKOFF = float(ENVS.get("SEMIO_PREDICTION_BACKOFF", "1"))
+PREDICTION_CACHE_TTL = float(ENVS.get("SEMIO_PREDICTION_CACHE_TTL", str(7 * 24 * 60 * 60)))
+PREDICTION_CACHE_SIZE_MAX = int(ENVS.get("SEMIO_PREDICTION_CACHE_SIZE_MAX", str(64 * 1024 * 1024)))
 
 
 # endregion Constants
@@ -304,15 +361,32 @@ class TypeNotFound(NotFound):
         return f"🔍 Couldn't find the type ({self.id.name}{variant})."
 
 
-# class DesignNotFound(NotFound):
+class DesignNotFound(NotFound):
+    def __init__(self, name: str, variant: str = "", view: str = "") -> None:
+        self.name = name
+        self.variant = variant
+        self.view = view
+
+    def __str__(self):
+        variant = f", {self.variant}" if self.variant else ""
+        view = f", {self.view}" if self.view else ""
+        return f"🔍 Couldn't find the design ({self.name}{variant}{view})."
+
+
+class PortsNotFound(NotFound):
+    def __init__(self, ids: list[tuple[str, str, str]]) -> None:
+        self.ids = ids
+
+    def __str__(self):
+        return f"🔍 Couldn't find the following ports (type name, type variant, port id): {', '.join(str(id) for id in self.ids)}."
+
 
-#     def __init__(self, name: str, variant: str = "") -> None:
-#         self.name = name
-#         self.variant = variant
+class PiecesNotFound(NotFound):
+    def __init__(self, ids: list[str]) -> None:
+        self.ids = ids
 
-#     def __str__(self):
-#         variant = f", {self.variant}" if self.variant else ""
-#         return f"🔍 Couldn't find the design ({self.name}{variant})."
+    def __str__(self):
+        return f"🔍 Couldn't find the following pieces: {', '.join(self.ids)}."
 
 
 class KitNotFound(NotFound):
@@ -347,6 +421,11 @@ class OnlyRemoteKitsCanBeCached(ClientError):
         return f"🔍 Only remote kits can be cached. The uri ({self.nonRemoteUri}) doesn't start with http and ends with .zip"
 
 
+class ClientDisconnected(ClientError):
+    def __str__(self):
+        return "🔌 The client disconnected before the request was done."
+
+
 class KitUriNotValid(ClientError, abc.ABC):
     """🆔 The base for all kit uri not valid errors."""
 
@@ -421,6 +500,78 @@ class KitAlreadyExists(AlreadyExists, abc.ABC):
         return f"♊ A kit under uri ({self.uri}) already exists."
 
 
+class ArrayShapeNotValid(SpecificationError):
+    def __init__(self, expected: tuple[int, ...], actual: tuple[int, ...]) -> None:
+        self.expected = expected
+        self.actual = actual
+
+    def __str__(self) -> str:
+        return f"🚫 The array has the shape {self.actual} but the shape {self.expected} is expected."
+
+
+class VectorNotNormalized(SpecificationError):
+    def __init__(self, vector: "Vector") -> None:
+        self.vector = vector
+
+    def __str__(self) -> str:
+        return f"🚫 The vector {self.vector} is not normalized."
+
+
+class DesignNestingCycle(SpecificationError):
+    def __init__(self, design: "Design | DesignId") -> None:
+        self.design = design
+
+    def __str__(self) -> str:
+        variant = f", {self.design.variant}" if self.design.variant else ""
+        view = f", {self.design.view}" if self.design.view else ""
+        return f"🚫 The design ({self.design.name}{variant}{view}) contains itself through its design pieces."
+
+
+class BoundsNotValid(SpecificationError):
+    def __init__(self, value: str) -> None:
+        self.value = value
+
+    def __str__(self) -> str:
+        return f"🚫 The bounds ({self.value}) are not six comma separated numbers (minX,minY,minZ,maxX,maxY,maxZ)."
+
+
+class SpatialQueryNotValid(SpecificationError):
+    def __init__(self, reason: str) -> None:
+        self.reason = reason
+
+    def __str__(self) -> str:
+        return f"🚫 The spatial query is not valid: {self.reason}"
+
+
+class RequestTooLarge(ClientError, abc.ABC):
+    """📦 The base for all request too large errors."""
+
+
+class RequestBodyTooLarge(RequestTooLarge):
+    def __init__(self, maxSize: int) -> None:
+        self.maxSize = maxSize
+
+    def __str__(self) -> str:
+        return f"📦 The request body is larger than the maximum of {self.maxSize} bytes."
+
+
+class CollectionTooLarge(RequestTooLarge):
+    def __init__(self, key: str, limit: int) -> None:
+        self.key = key
+        self.limit = limit
+
+    def __str__(self) -> str:
+        return f"📦 The request contains more than the maximum of {self.limit} {self.key}."
+
+
+class StreamNotValid(SpecificationError):
+    def __init__(self, reason: str) -> None:
+        self.reason = reason
+
+    def __str__(self) -> str:
+        return f"🚫 The streamed body is not valid: {self.reason}"
+
+
 class TypeHasNotAllUsedPorts(SpecificationError):
     def __init__(self, missingPorts: set[str]) -> None:
         self.missingPorts = missingPorts
@@ -564,6 +715,39 @@ class TableEntity(Entity, Table, abc.ABC):
     """📛 The lowercase name of the table in the database."""
 
 
+def orderedNames(table: Table, relationship: str) -> list[str]:
+    """🔢 The names of the children of a relationship sorted by their order. Cached on the table until the relationship changes."""
+    info = sqlalchemy.inspect(table).info
+    if relationship not in info:
+        info[relationship] = [child.name for child in sorted(getattr(table, relationship), key=lambda x: x.order)]
+    return list(info[relationship])
+
+
+def invalidateOrderedNames(table: Table, relationship: str) -> None:
+    """🧹 Invalidate the cached ordered names of a relationship."""
+    sqlalchemy.inspect(table).info.pop(relationship, None)
+
+
+def cacheOrderedNames(parent: type[Table], relationship: str, child: type[Table], backReferences: tuple[str, ...]) -> None:
+    """🔗 Invalidate the cached ordered names of a parent when its relationship is mutated, it is expired or the name or order of a child changes."""
+
+    def invalidateParent(target, *args, **kwargs):
+        invalidateOrderedNames(target, relationship)
+
+    def invalidateParentOfChild(target, *args, **kwargs):
+        for backReference in backReferences:
+            parentTable = getattr(target, backReference)
+            if parentTable is not None:
+                invalidateOrderedNames(parentTable, relationship)
+
+    for event in ("append", "remove", "bulk_replace"):
+        sqlalchemy.event.listen(getattr(parent, relationship), event, invalidateParent)
+    for event in ("expire", "refresh"):
+        sqlalchemy.event.listen(parent, event, invalidateParent)
+    for field in ("name", "order"):
+        sqlalchemy.event.listen(getattr(child, field), "set", invalidateParentOfChild)
+
+
 # endregion Primitives
 
 # region Domain
@@ -784,7 +968,7 @@ class Representation(RepresentationDescriptionField, RepresentationUrlField, Tab
 
     @property
     def tags(self: "Representation") -> list[str]:
-        return [tag.name for tag in sorted(self.tags_, key=lambda x: x.order)]
+        return orderedNames(self, "tags_")
 
     @tags.setter
     def tags(self: "Representation", tags: list[str]):
@@ -888,8 +1072,8 @@ class Point(Model):
     y: float = sqlmodel.Field()
     z: float = sqlmodel.Field()
 
-    # def __init__(self, x: float = 0.0, y: float = 0.0, z: float = 0.0):
-    #     super().__init__(x=x, y=y, z=z)
+    def __init__(self, x: float = 0.0, y: float = 0.0, z: float = 0.0):
+        super().__init__(x=x, y=y, z=z)
 
     def __str__(self) -> str:
         return f"[{pretty(self.x)}, {pretty(self.y)}, {pretty(self.z)}]"
@@ -913,18 +1097,14 @@ class Point(Model):
     # def __iter__(self):
     #     return iter((self.x, self.y, self.z))
 
-    # def isCloseTo(self, other: "Point", tol: float = TOLERANCE) -> bool:
-    #     return (
-    #         abs(self.x - other.x) < tol
-    #         and abs(self.y - other.y) < tol
-    #         and abs(self.z - other.z) < tol
-    #     )
+    def isClose(self, other: "Point", tol: float = TOLERANCE) -> bool:
+        return abs(self.x - other.x) < tol and abs(self.y - other.y) < tol and abs(self.z - other.z) < tol
 
-    # def transform(self, transform: "Transform") -> "Point":
-    #     return Transform.transformPoint(transform, self)
+    def transform(self, transform: "Transform") -> "Point":
+        return Transform.transformPoint(transform, self)
 
-    # def toVector(self) -> "Vector":
-    #     return Vector(self.x, self.y, self.z)
+    def toVector(self) -> "Vector":
+        return Vector(self.x, self.y, self.z)
 
 
 class PointInput(Point, Input):
@@ -950,8 +1130,8 @@ class Vector(Model):
     y: float = sqlmodel.Field()
     z: float = sqlmodel.Field()
 
-    # def __init__(self, x: float = 0.0, y: float = 0.0, z: float = 0.0):
-    #     super().__init__(x=x, y=y, z=z)
+    def __init__(self, x: float = 0.0, y: float = 0.0, z: float = 0.0):
+        super().__init__(x=x, y=y, z=z)
 
     def __str__(self) -> str:
         return f"[{pretty(self.x)}, {pretty(self.y)}, {pretty(self.z)}]"
@@ -975,56 +1155,56 @@ class Vector(Model):
     # def __iter__(self):
     #     return iter((self.x, self.y, self.z))
 
-    # def __add__(self, other):
-    #     return Vector(self.x + other.x, self.y + other.y, self.z + other.z)
+    def __add__(self, other):
+        return Vector(self.x + other.x, self.y + other.y, self.z + other.z)
 
-    # @property
-    # def length(self) -> float:
-    #     return (self.x**2 + self.y**2 + self.z**2) ** 0.5
+    @property
+    def length(self) -> float:
+        return (self.x**2 + self.y**2 + self.z**2) ** 0.5
 
-    # def revert(self) -> "Vector":
-    #     return Vector(-self.x, -self.y, -self.z)
+    def revert(self) -> "Vector":
+        return Vector(-self.x, -self.y, -self.z)
 
-    # def amplify(self, factor: float) -> "Vector":
-    #     return Vector(self.x * factor, self.y * factor, self.z * factor)
+    def amplify(self, factor: float) -> "Vector":
+        return Vector(self.x * factor, self.y * factor, self.z * factor)
 
-    # def isCloseTo(self, other: "Vector", tol: float = TOLERANCE) -> bool:
-    #     return (
-    #         abs(self.x - other.x) < tol
-    #         and abs(self.y - other.y) < tol
-    #         and abs(self.z - other.z) < tol
-    #     )
+    def isClose(self, other: "Vector", tol: float = TOLERANCE) -> bool:
+        return abs(self.x - other.x) < tol and abs(self.y - other.y) < tol and abs(self.z - other.z) < tol
 
-    # def normalize(self) -> "Vector":
-    #     length = self.length
-    #     return Vector(x=self.x / length, y=self.y / length, z=self.z / length)
+    def normalize(self) -> "Vector":
+        length = self.length
+        return Vector(x=self.x / length, y=self.y / length, z=self.z / length)
 
-    # def dot(self, other: "Vector") -> float:
-    #     return numpy.dot(self, other)
+    def dot(self, other: "Vector") -> float:
+        return self.x * other.x + self.y * other.y + self.z * other.z
 
-    # def cross(self, other: "Vector") -> "Vector":
-    #     return Vector(*numpy.cross(self, other))
+    def cross(self, other: "Vector") -> "Vector":
+        return Vector(
+            self.y * other.z - self.z * other.y,
+            self.z * other.x - self.x * other.z,
+            self.x * other.y - self.y * other.x,
+        )
 
-    # def transform(self, transform: "Transform") -> "Vector":
-    #     return Transform.transformVector(transform, self)
+    def transform(self, transform: "Transform") -> "Vector":
+        return Transform.transformVector(transform, self)
 
-    # def toPoint(self) -> "Point":
-    #     return Point(self.x, self.y, self.z)
+    def toPoint(self) -> "Point":
+        return Point(self.x, self.y, self.z)
 
-    # def toTransform(self) -> "Transform":
-    #     return Transform.fromTranslation(self)
+    def toTransform(self) -> "Transform":
+        return Transform.fromTranslation(self)
 
-    # @staticmethod
-    # def X() -> "Vector":
-    #     return Vector(x=1)
+    @staticmethod
+    def X() -> "Vector":
+        return Vector(x=1)
 
-    # @staticmethod
-    # def Y() -> "Vector":
-    #     return Vector(y=1)
+    @staticmethod
+    def Y() -> "Vector":
+        return Vector(y=1)
 
-    # @staticmethod
-    # def Z() -> "Vector":
-    #     return Vector(z=1)
+    @staticmethod
+    def Z() -> "Vector":
+        return Vector(z=1)
 
 
 class VectorInput(Vector, Input):
@@ -1087,25 +1267,14 @@ class Plane(Table, table=True):
     yAxisZ: float = sqlmodel.Field(sa_column=sqlmodel.Column("y_axis_z", sqlalchemy.Float()), exclude=True)
     piece: typing.Optional["Piece"] = sqlmodel.Relationship(back_populates="plane")
 
-    # def __init__(
-    #     self, origin: Point = None, xAxis: Vector = None, yAxis: Vector = None
-    # ):
-    #     if origin is None:
-    #         origin = Point()
-    #     if xAxis is None and yAxis is None:
-    #         xAxis = Vector.X()
-    #         yAxis = Vector.Y()
-    #     if xAxis is None:
-    #         xAxis = Vector()
-    #     if yAxis is None:
-    #         yAxis = Vector()
-    #     if abs(xAxis.length - 1) > TOLERANCE:
-    #         raise ValidationError("The x-axis must be normalized.")
-    #     if abs(yAxis.length - 1) > TOLERANCE:
-    #         raise ValidationError("The y-axis must be normalized.")
-    #     if abs(xAxis.dot(yAxis)) > TOLERANCE:
-    #         raise ValidationError("The x-axis and y-axis must be orthogonal.")
-    #     super().__init__(origin=origin, xAxis=xAxis, yAxis=yAxis)
+    def __init__(self, origin: typing.Optional[Point] = None, xAxis: typing.Optional[Vector] = None, yAxis: typing.Optional[Vector] = None, **kwargs):
+        super().__init__(**kwargs)
+        if origin is not None:
+            self.origin = origin
+        if xAxis is not None:
+            self.xAxis = xAxis
+        if yAxis is not None:
+            self.yAxis = yAxis
 
     @property
     def origin(self) -> Point:
@@ -1149,37 +1318,34 @@ class Plane(Table, table=True):
         self.yAxisY = yAxis.y
         self.yAxisZ = yAxis.z
 
-    # def isCloseTo(self, other: "Plane", tol: float = TOLERANCE) -> bool:
-    #     return (
-    #         self.origin.isCloseTo(other.origin, tol)
-    #         and self.xAxis.isCloseTo(other.xAxis, tol)
-    #         and self.yAxis.isCloseTo(other.yAxis, tol)
-    #     )
-
-    # def transform(self, transform: "Transform") -> "Plane":
-    #     return Transform.transformPlane(transform, self)
-
-    # def toTransform(self) -> "Transform":
-    #     return Transform.fromPlane(self)
-
-    # @staticmethod
-    # def XY() -> "Plane":
-    #     return Plane(
-    #         origin=Point(),
-    #         xAxis=Vector.X(),
-    #         yAxis=Vector.Y(),
-    #     )
-
-    # @staticmethod
-    # def fromYAxis(yAxis: Vector, theta: float = 0.0, origin: Point = None) -> "Plane":
-    #     if abs(yAxis.length - 1) > TOLERANCE:
-    #         raise SpecificationError("The yAxis must be normalized.")
-    #     if origin is None:
-    #         origin = Point()
-    #     orientation = Transform.fromDirections(Vector.Y(), yAxis)
-    #     rotation = Transform.fromAngle(yAxis, theta)
-    #     xAxis = Vector.X().transform(rotation.after(orientation))
-    #     return Plane(origin=origin, xAxis=xAxis, yAxis=yAxis)
+    def isClose(self, other: "Plane", tol: float = TOLERANCE) -> bool:
+        return self.origin.isClose(other.origin, tol) and self.xAxis.isClose(other.xAxis, tol) and self.yAxis.isClose(other.yAxis, tol)
+
+    def transform(self, transform: "Transform") -> "Plane":
+        return Transform.transformPlane(transform, self)
+
+    def toTransform(self) -> "Transform":
+        return Transform.fromPlane(self)
+
+    @staticmethod
+    def XY() -> "Plane":
+        return Plane(
+            origin=Point(),
+            xAxis=Vector.X(),
+            yAxis=Vector.Y(),
+        )
+
+    @staticmethod
+    def fromYAxis(yAxis: Vector, theta: float = 0.0, origin: typing.Optional[Point] = None) -> "Plane":
+        """🧭 The plane with the y-axis whose x-axis is the x-axis turned onto the y-axis and then rotated by theta degrees around it."""
+        if abs(yAxis.length - 1) > TOLERANCE:
+            raise VectorNotNormalized(yAxis)
+        if origin is None:
+            origin = Point()
+        orientation = Transform.fromDirections(Vector.Y(), yAxis)
+        rotation = Transform.fromAngle(yAxis, theta)
+        xAxis = Vector.X().transform(rotation.after(orientation))
+        return Plane(origin=origin, xAxis=xAxis, yAxis=yAxis)
 
     # TODO: Automatic nested parsing (https://github.com/fastapi/sqlmodel/issues/293)
     @classmethod
@@ -1204,8 +1370,134 @@ class Plane(Table, table=True):
         return PlaneOutput(**entity)
 
 
+def planesFromYAxes(yAxes: numpy.ndarray, thetas: typing.Optional[numpy.ndarray] = None, origins: typing.Optional[numpy.ndarray] = None) -> numpy.ndarray:
+    """🧭 The (N, 3, 3) planes (origin, x-axis, y-axis) of (N, 3) normalized y-axes with (N,) angles in degrees and (N, 3) origins. Same as `Plane.fromYAxis`."""
+    yAxes = numpy.asarray(yAxes, dtype=numpy.float64).reshape(-1, 3)
+    count = len(yAxes)
+    lengths = numpy.linalg.norm(yAxes, axis=-1)
+    notNormalized = numpy.flatnonzero(numpy.abs(lengths - 1) > TOLERANCE)
+    if len(notNormalized) > 0:
+        raise VectorNotNormalized(Vector(*yAxes[notNormalized[0]].tolist()))
+    thetas = numpy.zeros(count) if thetas is None else numpy.broadcast_to(numpy.asarray(thetas, dtype=numpy.float64), (count,))
+    origins = numpy.zeros((count, 3)) if origins is None else numpy.broadcast_to(numpy.asarray(origins, dtype=numpy.float64), (count, 3))
+    orientations = alignmentMatrices(numpy.broadcast_to((0.0, 1.0, 0.0), (count, 3)), yAxes)
+    xAxes = (rotationMatrices(yAxes, thetas) @ orientations)[:, :, 0]
+    return numpy.stack([origins, xAxes, yAxes], axis=1)
+
+
+def arePlanesClose(planes: numpy.ndarray, otherPlanes: numpy.ndarray, tol: float = TOLERANCE) -> numpy.ndarray:
+    """🟰 Whether the origins and axes of (N, 3, 3) planes are all closer than the tolerance to the ones of other planes. Same as `Plane.isClose`."""
+    return (numpy.abs(numpy.asarray(planes) - numpy.asarray(otherPlanes)) < tol).all(axis=(-2, -1))
+
+
+def portPlanes(frames: numpy.ndarray) -> numpy.ndarray:
+    """📍 The (N, 3, 3) planes of ports from their (N, 2, 3) frames (point, direction) like the ones of `getPortFrames`.
+    The origin is the point, the y-axis is the direction and the x-axis is the x-axis turned onto the direction."""
+    frames = numpy.asarray(frames, dtype=numpy.float64).reshape(-1, 2, 3)
+    return planesFromYAxes(normalizeVectors(frames[:, 1]), origins=frames[:, 0])
+
+
 # endregion Plane
 
+# region Transform
+
+
+class Transform(numpy.ndarray):
+    """▦ A 4x4 transformation matrix with rotation and translation but no scaling. Angles are in degrees."""
+
+    def __new__(cls, matrix: typing.Optional[numpy.ndarray] = None) -> "Transform":
+        if matrix is None:
+            matrix = numpy.eye(4)
+        return numpy.asarray(matrix, dtype=numpy.float64).view(cls)
+
+    @property
+    def rotation(self) -> numpy.ndarray:
+        return numpy.asarray(self)[:3, :3]
+
+    @property
+    def translation(self) -> numpy.ndarray:
+        return numpy.asarray(self)[:3, 3]
+
+    def after(self, before: "Transform") -> "Transform":
+        """🔗 The transform that applies before and then this transform."""
+        return Transform(numpy.asarray(self) @ numpy.asarray(before))
+
+    def invert(self) -> "Transform":
+        inverse = numpy.eye(4)
+        inverse[:3, :3] = self.rotation.T
+        inverse[:3, 3] = -self.rotation.T @ self.translation
+        return Transform(inverse)
+
+    def transformPoint(self, point: Point) -> Point:
+        return Point(*(self.rotation @ (point.x, point.y, point.z) + self.translation).tolist())
+
+    def transformVector(self, vector: Vector) -> Vector:
+        return Vector(*(self.rotation @ (vector.x, vector.y, vector.z)).tolist())
+
+    def transformPlane(self, plane: "Plane") -> "Plane":
+        return Transform(numpy.asarray(self) @ numpy.asarray(Transform.fromPlane(plane))).toPlane()
+
+    def toPlane(self) -> "Plane":
+        return Plane(
+            origin=Point(*self.translation.tolist()),
+            xAxis=Vector(*self.rotation[:, 0].tolist()),
+            yAxis=Vector(*self.rotation[:, 1].tolist()),
+        )
+
+    @staticmethod
+    def fromTranslation(vector: Vector) -> "Transform":
+        transform = numpy.eye(4)
+        transform[:3, 3] = (vector.x, vector.y, vector.z)
+        return Transform(transform)
+
+    @staticmethod
+    def fromAngle(axis: Vector, angle: float) -> "Transform":
+        """🔄 The right-handed rotation around the axis."""
+        unit = axis.normalize()
+        x, y, z = unit.x, unit.y, unit.z
+        cross = numpy.array([[0.0, -z, y], [z, 0.0, -x], [-y, x, 0.0]])
+        radians = numpy.radians(angle)
+        transform = numpy.eye(4)
+        transform[:3, :3] = numpy.eye(3) + numpy.sin(radians) * cross + (1 - numpy.cos(radians)) * (cross @ cross)
+        return Transform(transform)
+
+    @staticmethod
+    def fromDirections(startDirection: Vector, endDirection: Vector) -> "Transform":
+        """🧭 The shortest rotation that turns the start direction onto the end direction."""
+        start = startDirection.normalize()
+        end = endDirection.normalize()
+        axis = start.cross(end)
+        cos = start.dot(end)
+        if axis.length < TOLERANCE:
+            if cos > 0:
+                return Transform()
+            # Opposite directions: Half a turn around z, around x if the directions are along z or else around the vector that is orthogonal to z and the end direction.
+            # Idea taken from: https://github.com/dfki-ric/pytransform3d/blob/143943b028fc776adfc6939b1d7c2c6edeaa2d90/pytransform3d/rotations/_utils.py#L253
+            if abs(end.z) < TOLERANCE:
+                axis = Vector.Z()
+            elif abs(abs(end.z) - 1) < TOLERANCE:
+                axis = Vector.X()
+            else:
+                axis = Vector.Z().cross(end)
+            return Transform.fromAngle(axis, 180)
+        return Transform.fromAngle(axis, numpy.degrees(numpy.arctan2(axis.length, cos)))
+
+    @staticmethod
+    def fromPlane(plane: "Plane") -> "Transform":
+        """🌐 The transform from the world to the plane. The axes are orthonormalized."""
+        xAxis = plane.xAxis.normalize()
+        zAxis = xAxis.cross(plane.yAxis).normalize()
+        yAxis = zAxis.cross(xAxis)
+        transform = numpy.eye(4)
+        transform[:3, 0] = (xAxis.x, xAxis.y, xAxis.z)
+        transform[:3, 1] = (yAxis.x, yAxis.y, yAxis.z)
+        transform[:3, 2] = (zAxis.x, zAxis.y, zAxis.z)
+        transform[:3, 3] = (plane.originX, plane.originY, plane.originZ)
+        return Transform(transform)
+
+
+# endregion Transform
+
 # region CompatibleFamily
 # https://github.com/usalu/semio-compatiblefamily-
 
@@ -1313,7 +1605,7 @@ class Port(PortTField, PortFamilyField, PortMandatoryField, PortDescriptionField
 
     @property
     def compatibleFamilies(self) -> list[str]:
-        return sorted([cf.name for cf in self.compatibleFamilies_], key=lambda cf: cf.order)
+        return orderedNames(self, "compatibleFamilies_")
 
     @compatibleFamilies.setter
     def compatibleFamilies(self, compatibleFamilies: list[str]):
@@ -1662,7 +1954,7 @@ class Type(TypeUpdatedField, TypeCreatedField, TypeUnitField, TypeMirrborableFie
 
     @property
     def concepts(self: "Type") -> list[str]:
-        return [concept.name for concept in sorted(self.concepts_, key=lambda x: x.order)]
+        return orderedNames(self, "concepts_")
 
     @concepts.setter
     def concepts(self: "Type", concepts: list[str]):
@@ -1901,7 +2193,7 @@ class Piece(PieceIdField, PieceTypeField, PieceDesignField, PiecePlaneField, Pie
             try:
                 entity.designPiece = designs[designId.name][designId.variant][designId.view]
             except KeyError:
-                raise FeatureNotYetSupported()
+                raise DesignNotFound(designId.name, designId.variant, designId.view)
         try:
             if obj["plane"] is not None:
                 plane = Plane.parse(obj["plane"])
@@ -1989,6 +2281,18 @@ class SidePrediction(Side, Prediction):
     pass
 
 
+def designPieceOfSide(piece: "Piece", side: Side) -> typing.Optional["Piece"]:
+    """🪆 The piece inside the design of a piece that a side refers to or None if the side refers to the piece itself."""
+    if side.designPiece is None:
+        return None
+    if piece.designPiece is None:
+        raise FeatureNotYetSupported()
+    try:
+        return next(p for p in piece.designPiece.pieces if p.id_ == side.designPiece.id_)
+    except StopIteration:
+        raise PiecesNotFound([side.designPiece.id_])
+
+
 # endregion Side
 
 # region Connection
@@ -2147,7 +2451,8 @@ class Connection(ConnectionYField, ConnectionXField, ConnectionTiltField, Connec
         connected = Side.parse(obj["connected"])
         connecting = Side.parse(obj["connecting"])
         connectedPiece = piecesDict[connected.piece.id_]
-        connectedType = connectedPiece.type
+        connectedDesignPiece = designPieceOfSide(connectedPiece, connected)
+        connectedType = connectedDesignPiece.type if connectedDesignPiece is not None else connectedPiece.type
         if connectedType is None:
             raise FeatureNotYetSupported()
         connectedPort = [p for p in connectedType.ports if p.id_ == connected.port.id_]
@@ -2156,7 +2461,8 @@ class Connection(ConnectionYField, ConnectionXField, ConnectionTiltField, Connec
         else:
             connectedPort = connectedPort[0]
         connectingPiece = piecesDict[connecting.piece.id_]
-        connectingType = connectingPiece.type
+        connectingDesignPiece = designPieceOfSide(connectingPiece, connecting)
+        connectingType = connectingDesignPiece.type if connectingDesignPiece is not None else connectingPiece.type
         if connectingType is None:
             raise FeatureNotYetSupported()
         connectingPort = [p for p in connectingType.ports if p.id_ == connecting.port.id_]
@@ -2170,31 +2476,10 @@ class Connection(ConnectionYField, ConnectionXField, ConnectionTiltField, Connec
             connectingPiece=connectingPiece,
             connectingPort=connectingPort,
         )
-        if connected.designPiece is not None:
-            if connectedPiece.refDesign is None and designsById is None:
-                raise FeatureNotYetSupported()
-            refDesign = connectedPiece.refDesign if connectedPiece.refDesign is not None else None
-            if refDesign is None and designsById is not None:
-                # best-effort lookup by connected piece's type/design is not possible; require refDesign
-                raise FeatureNotYetSupported()
-            if refDesign is not None:
-                try:
-                    designPiece = next(p for p in refDesign.pieces if p.id_ == connected.designPiece.id_)
-                except StopIteration:
-                    raise ValueError("Design piece not found in referenced design")
-                entity.connectedDesignPiece = designPiece
-        if connecting.designPiece is not None:
-            if connectingPiece.refDesign is None and designsById is None:
-                raise FeatureNotYetSupported()
-            refDesign = connectingPiece.refDesign if connectingPiece.refDesign is not None else None
-            if refDesign is None and designsById is not None:
-                raise FeatureNotYetSupported()
-            if refDesign is not None:
-                try:
-                    designPiece = next(p for p in refDesign.pieces if p.id_ == connecting.designPiece.id_)
-                except StopIteration:
-                    raise ValueError("Design piece not found in referenced design")
-                entity.connectingDesignPiece = designPiece
+        if connectedDesignPiece is not None:
+            entity.connectedDesignPiece = connectedDesignPiece
+        if connectingDesignPiece is not None:
+            entity.connectingDesignPiece = connectingDesignPiece
         try:
             entity.description = obj["description"]
         except KeyError:
@@ -2319,7 +2604,7 @@ class DesignUpdatedField(RealField, abc.ABC):
     updated_at: datetime.datetime = sqlmodel.Field(default_factory=datetime.datetime.now)
 
 
-class DesignId(DesignNameField, DesignVariantField, Id):
+class DesignId(DesignNameField, DesignVariantField, DesignViewField, Id):
     pass
 
 
@@ -2415,7 +2700,7 @@ class Design(
 
     @property
     def concepts(self: "Design") -> list[str]:
-        return [concept.name for concept in sorted(self.concepts_, key=lambda x: x.order)]
+        return orderedNames(self, "concepts_")
 
     @concepts.setter
     def concepts(self: "Design", concepts: list[str]):
@@ -2503,6 +2788,65 @@ class Design(
         return [self.name, self.variant]
 
 
+def designIdOf(input: str | dict | DesignInput | typing.Any) -> tuple[str, str, str]:
+    """🆔 The name, variant and view of a design input."""
+    obj = json.loads(input) if isinstance(input, str) else input if isinstance(input, dict) else input.__dict__
+    designId = DesignId.parse(obj)
+    return designId.name, designId.variant, designId.view
+
+
+def usedDesignIds(input: str | dict | DesignInput | typing.Any) -> set[tuple[str, str, str]]:
+    """🪆 The name, variant and view of every design that the pieces of a design input use."""
+    obj = json.loads(input) if isinstance(input, str) else input if isinstance(input, dict) else input.__dict__
+    ids = set()
+    for piece in obj.get("pieces") or []:
+        designObj = (piece if isinstance(piece, dict) else piece.__dict__).get("designPiece")
+        if designObj is not None:
+            designId = DesignId.parse(designObj)
+            ids.add((designId.name, designId.variant, designId.view))
+    return ids
+
+
+def designNestingOrder(designInputs: list) -> list[int]:
+    """🪆 The indices of design inputs in an order where every design comes after the designs that its pieces use. Used designs that are not part of the inputs are left to parsing."""
+    ids = [designIdOf(d) for d in designInputs]
+    indices = {id: i for i, id in enumerate(ids)}
+    uses = [[indices[id] for id in sorted(usedDesignIds(d)) if id in indices] for d in designInputs]
+    order = []
+    visited = [False] * len(designInputs)
+    visiting = [False] * len(designInputs)
+
+    def visit(i: int) -> None:
+        if visited[i]:
+            return
+        if visiting[i]:
+            name, variant, view = ids[i]
+            raise DesignNestingCycle(DesignId(name=name, variant=variant, view=view))
+        visiting[i] = True
+        for j in uses[i]:
+            visit(j)
+        visiting[i] = False
+        visited[i] = True
+        order.append(i)
+
+    for i in range(len(designInputs)):
+        visit(i)
+    return order
+
+
+def parseDesigns(designInputs: list, types: list[Type], designs: typing.Optional[list[typing.Optional[Design]]] = None) -> list[Design]:
+    """⚒️ Parse the designs of a kit in their nesting order so that design pieces can use the designs of the same kit. The designs keep the order of the inputs.
+    Designs that are already parsed (e.g. in a worker process) are only used by the others."""
+    designs = list(designs) if designs is not None else [None] * len(designInputs)
+    designsById: dict[str, dict[str, dict[str, Design]]] = {}
+    for i in designNestingOrder(designInputs):
+        if designs[i] is None:
+            designs[i] = Design.parse(designInputs[i], types, designsById)
+        design = designs[i]
+        designsById.setdefault(design.name, {}).setdefault(design.variant, {})[design.view] = design
+    return designs
+
+
 # endregion Design
 
 # region Quality
@@ -3028,7 +3372,7 @@ class Kit(KitNameField, KitVersionField, KitDescriptionField, KitIconField, KitI
 
     @property
     def concepts(self: "Kit") -> list[str]:
-        return [concept.name for concept in sorted(self.concepts_, key=lambda x: x.order)]
+        return orderedNames(self, "concepts_")
 
     @concepts.setter
     def concepts(self: "Kit", concepts: list[str]):
@@ -3038,22 +3382,27 @@ class Kit(KitNameField, KitVersionField, KitDescriptionField, KitIconField, KitI
 
     # TODO: Automatic nested parsing (https://github.com/fastapi/sqlmodel/issues/293)
     @classmethod
-    def parse(cls: "Kit", input: str | dict | KitInput | typing.Any | None) -> "Kit":
+    def parse(cls: "Kit", input: str | dict | KitInput | typing.Any | None, processes: int = 1) -> "Kit":
+        """⚒️ Parse the kit from an input. With more than one process, types and then designs without design pieces are parsed in a process pool."""
         if input is None:
             return cls()
         obj = json.loads(input) if isinstance(input, str) else input if isinstance(input, dict) else input.__dict__
         props = KitProps.model_validate(obj)
         entity = cls(**props.model_dump())
-        try:
-            types = [Type.parse(t) for t in obj["types"]]
-            entity.types = types
-        except KeyError:
-            pass
-        try:
-            designs = [Design.parse(d, types) for d in obj["designs"]]
-            entity.designs = designs
-        except KeyError:
-            pass
+        if processes > 1:
+            entity.types, entity.designs = parseTypesAndDesignsInParallel(obj.get("types", []), obj.get("designs", []), processes)
+        else:
+            types = []
+            try:
+                types = [Type.parse(t) for t in obj["types"]]
+                entity.types = types
+            except KeyError:
+                pass
+            try:
+                designs = parseDesigns(obj["designs"], types)
+                entity.designs = designs
+            except KeyError:
+                pass
         try:
             concepts = obj["concepts"]
             entity.concepts = concepts
@@ -3096,6 +3445,1203 @@ class Kit(KitNameField, KitVersionField, KitDescriptionField, KitIconField, KitI
 
 # endregion Models
 
+# region Ordered Names
+
+cacheOrderedNames(Representation, "tags_", Tag, ("representation",))
+cacheOrderedNames(Port, "compatibleFamilies_", CompatibleFamily, ("port",))
+cacheOrderedNames(Type, "concepts_", Concept, ("type",))
+cacheOrderedNames(Design, "concepts_", Concept, ("design",))
+cacheOrderedNames(Kit, "concepts_", Concept, ("kit",))
+
+# endregion Ordered Names
+
+# region Parallel Parsing
+
+
+def parseType(input: dict | TypeInput) -> Type:
+    """⚒️ Parse a type inside a worker process."""
+    return Type.parse(input)
+
+
+@functools.lru_cache(maxsize=1)
+def typeStubs(typeIds: tuple[tuple[str, str, tuple[str, ...]], ...]) -> list[Type]:
+    """🧩 Types that only have a name, a variant and the ids of their ports. A worker process creates them once and parses all designs against them."""
+    stubs = []
+    for name, variant, portIds in typeIds:
+        stub = Type(name=name, variant=variant)
+        stub.ports = [Port(id_=portId) for portId in portIds]
+        stubs.append(stub)
+    return stubs
+
+
+def parseDesign(input: dict | DesignInput, typeIds: tuple[tuple[str, str, tuple[str, ...]], ...]) -> Design:
+    """⚒️ Parse a design against type stubs inside a worker process."""
+    design = Design.parse(input, typeStubs(typeIds))
+    # The stubs are shared by all designs of the worker. Without detaching them, every pickled design would carry all previously parsed designs.
+    for piece in design.pieces:
+        if piece.type is not None:
+            sqlalchemy.orm.attributes.set_committed_value(piece.type, "pieces", [])
+    for connection in design.connections:
+        sqlalchemy.orm.attributes.set_committed_value(connection.connectedPort, "connecteds", [])
+        sqlalchemy.orm.attributes.set_committed_value(connection.connectingPort, "connectings", [])
+    return design
+
+
+def resolveTypeStubs(design: Design, typesById: dict[tuple[str, str], Type], portsById: dict[tuple[str, str, str], Port]) -> Design:
+    """🔗 Replace the type and port stubs of a design that was parsed in a worker process with the real types and ports."""
+    for piece in design.pieces:
+        if piece.type is not None:
+            piece.type = typesById[(piece.type.name, piece.type.variant)]
+    for connection in design.connections:
+        # The ports of sides inside a design piece belong to the pieces of the other design which doesn't use stubs.
+        if connection.connectedDesignPiece is None:
+            connectedType = connection.connectedPiece.type
+            connection.connectedPort = portsById[(connectedType.name, connectedType.variant, connection.connectedPort.id_)]
+        if connection.connectingDesignPiece is None:
+            connectingType = connection.connectingPiece.type
+            connection.connectingPort = portsById[(connectingType.name, connectingType.variant, connection.connectingPort.id_)]
+    return design
+
+
+parsePools: dict[int, concurrent.futures.ProcessPoolExecutor] = {}
+"""🏭 The process pools for parsing kits by their number of processes. A pool is started on the first parse and reused by all later ones."""
+parsePoolsLock = threading.Lock()
+"""🔒 Guards the process pools because kits are uploaded from several threads."""
+
+
+def parsePool(processes: int) -> concurrent.futures.ProcessPoolExecutor:
+    """🏭 The process pool for parsing kits with a number of processes. It is only started once."""
+    with parsePoolsLock:
+        pool = parsePools.get(processes)
+        if pool is None:
+            pool = parsePools[processes] = concurrent.futures.ProcessPoolExecutor(max_workers=processes)
+        return pool
+
+
+def dropParsePool(processes: int, pool: concurrent.futures.ProcessPoolExecutor) -> None:
+    """🗑️ Forget a broken process pool so that the next parse starts a new one."""
+    with parsePoolsLock:
+        if parsePools.get(processes) is pool:
+            del parsePools[processes]
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def parseTypesAndDesignsInParallel(typeInputs: list, designInputs: list, processes: int) -> tuple[list[Type], list[Design]]:
+    """🏭 Parse independent types and then independent designs in the process pool and merge the results into the types and designs of one kit.
+    Designs with design pieces need the other designs of the kit and are parsed afterwards in this process."""
+    flatIndices = [i for i, d in enumerate(designInputs) if not usedDesignIds(d)]
+    executor = parsePool(processes)
+    try:
+        types = list(executor.map(parseType, typeInputs, chunksize=max(1, len(typeInputs) // (processes * 4))))
+        typeIds = tuple((t.name, t.variant, tuple(p.id_ for p in t.ports)) for t in types)
+        flatDesigns = list(executor.map(parseDesign, [designInputs[i] for i in flatIndices], [typeIds] * len(flatIndices), chunksize=max(1, len(flatIndices) // (processes * 4))))
+    except concurrent.futures.BrokenExecutor:
+        dropParsePool(processes, executor)
+        raise
+    typesById = {(t.name, t.variant): t for t in types}
+    portsById = {(t.name, t.variant, p.id_): p for t in types for p in t.ports}
+    designs: list[typing.Optional[Design]] = [None] * len(designInputs)
+    for i, design in zip(flatIndices, flatDesigns):
+        designs[i] = resolveTypeStubs(design, typesById, portsById)
+    return types, parseDesigns(designInputs, types, designs)
+
+
+# endregion Parallel Parsing
+
+# region Port Compatibility
+
+
+class CompatiblePortOutput(Output):
+    type: TypeId = sqlmodel.Field()
+    port: PortId = sqlmodel.Field()
+
+
+class CompatiblePortsOutput(Output):
+    ports: list[CompatiblePortOutput] = sqlmodel.Field(default_factory=list)
+
+
+class PortCompatibilityIndex:
+    """🧲 The ports of the types of a kit by their family and by the families that they list as compatible.
+    Two ports are compatible if one of them has no family or if one of them lists the family of the other one.
+    Ports are identified by (type name, type variant, port id)."""
+
+    def __init__(self, types: typing.Iterable[Type] = ()) -> None:
+        self.types: dict[tuple[str, str], list[tuple[str, str, str]]] = {}
+        """🧩 The ports of every type."""
+        self.families: dict[tuple[str, str, str], tuple[str, tuple[str, ...]]] = {}
+        """👪 The family and the compatible families of every port."""
+        self.familyPorts: dict[str, set[tuple[str, str, str]]] = {}
+        """👪 The ports of every family. Ports without a family are listed under the empty family."""
+        self.listingPorts: dict[str, set[tuple[str, str, str]]] = {}
+        """📃 The ports that list a family as compatible."""
+        for type in types:
+            self.update(type)
+
+    def update(self, type: Type) -> None:
+        """🔄 Replace the ports of a type."""
+        typeId = (type.name, type.variant)
+        self.remove(typeId)
+        self.types[typeId] = []
+        for port in type.ports:
+            key = (type.name, type.variant, port.id_)
+            family, compatibleFamilies = port.family, tuple(f for f in port.compatibleFamilies if f != "")
+            self.types[typeId].append(key)
+            self.families[key] = (family, compatibleFamilies)
+            self.familyPorts.setdefault(family, set()).add(key)
+            for compatibleFamily in compatibleFamilies:
+                self.listingPorts.setdefault(compatibleFamily, set()).add(key)
+
+    def remove(self, typeId: tuple[str, str]) -> None:
+        for key in self.types.pop(typeId, []):
+            family, compatibleFamilies = self.families.pop(key)
+            self.familyPorts[family].discard(key)
+            for compatibleFamily in compatibleFamilies:
+                self.listingPorts[compatibleFamily].discard(key)
+
+    def compatibles(self, key: tuple[str, str, str]) -> list[tuple[str, str, str]]:
+        """🧲 All ports that can connect to a port in the order of their ids.
+        The keys are ports of types and not of pieces, so a port is compatible to itself when two pieces of its type can connect through it."""
+        family, compatibleFamilies = self.families[key]
+        if family == "":
+            return sorted(self.families)
+        ports = self.familyPorts.get("", set()) | self.listingPorts.get(family, set())
+        for compatibleFamily in compatibleFamilies:
+            ports |= self.familyPorts.get(compatibleFamily, set())
+        return sorted(ports)
+
+    def areCompatible(self, key: tuple[str, str, str], otherKey: tuple[str, str, str]) -> bool:
+        family, compatibleFamilies = self.families[key]
+        otherFamily, otherCompatibleFamilies = self.families[otherKey]
+        return family == "" or otherFamily == "" or otherFamily in compatibleFamilies or family in otherCompatibleFamilies
+
+
+class PortCompatibilityCache:
+    """🗃️ The port compatibility indices of the kits of a session. A flush that touches a type, a port or a compatible family only reindexes that type."""
+
+    def __init__(self, session: sqlalchemy.orm.Session) -> None:
+        self.indices: dict[int, PortCompatibilityIndex] = {}
+        self.staleTypes: set[int] = set()
+        sqlalchemy.event.listen(session, "after_flush", self.invalidate)
+
+    def get(self, kit: Kit) -> PortCompatibilityIndex:
+        index = self.indices.get(kit.pk)
+        if index is None:
+            index = self.indices[kit.pk] = PortCompatibilityIndex(kit.types)
+        else:
+            types = {(t.name, t.variant): t for t in kit.types}
+            for typeId in set(index.types) - set(types):
+                index.remove(typeId)
+            for typeId, type in types.items():
+                if typeId not in index.types or type.pk in self.staleTypes:
+                    index.update(type)
+        self.staleTypes -= {t.pk for t in kit.types}
+        return index
+
+    def invalidate(self, session: sqlalchemy.orm.Session, flushContext) -> None:
+        """🥀 Mark the types that are touched by a flush. Only loaded values are read to not load anything while flushing."""
+        if not self.indices:
+            return
+        for entity in itertools.chain(session.new, session.dirty, session.deleted):
+            values = sqlalchemy.inspect(entity).dict
+            match entity:
+                case Type():
+                    self.staleTypes.add(values.get("pk"))
+                case Port():
+                    self.staleTypes.add(values.get("typePk"))
+                case CompatibleFamily():
+                    port = values.get("port")
+                    if port is None:
+                        self.indices.clear()
+                    else:
+                        self.staleTypes.add(sqlalchemy.inspect(port).dict.get("typePk"))
+
+
+# endregion Port Compatibility
+
+# region Representation Selection
+
+
+class RepresentationUrlOutput(Output):
+    type: TypeId = sqlmodel.Field()
+    url: str = sqlmodel.Field()
+
+
+class RepresentationUrlsOutput(Output):
+    representations: list[RepresentationUrlOutput] = sqlmodel.Field(default_factory=list)
+
+
+def jaccard(tags: typing.Iterable[str], otherTags: typing.Iterable[str]) -> float:
+    """🏷️ The size of the intersection of two tag sets divided by the size of their union. Two empty sets are equal."""
+    tags, otherTags = set(tags), set(otherTags)
+    if not tags and not otherTags:
+        return 1.0
+    return len(tags & otherTags) / len(tags | otherTags)
+
+
+def findRepresentation(representations: typing.Sequence[Representation], tags: typing.Iterable[str]) -> typing.Optional[Representation]:
+    """🔍 The representation whose tags are the most similar to the given tags. The first one wins a tie."""
+    tags = frozenset(tags)
+    best, bestScore = None, -1.0
+    for representation in representations:
+        score = jaccard(representation.tags, tags)
+        if score > bestScore:
+            best, bestScore = representation, score
+    return best
+
+
+def designTypes(design: Design) -> list[Type]:
+    """🧩 The types of the pieces of a design and of the designs inside it in the order of their first appearance."""
+    types: dict[tuple[str, str], Type] = {}
+    visited: set[int] = set()
+    stack = [design]
+    while stack:
+        current = stack.pop()
+        if id(current) in visited:
+            continue
+        visited.add(id(current))
+        for piece in current.pieces:
+            if piece.type is not None:
+                types.setdefault((piece.type.name, piece.type.variant), piece.type)
+        stack.extend(reversed([p.designPiece for p in current.pieces if p.designPiece is not None]))
+    return list(types.values())
+
+
+class RepresentationCache:
+    """🗃️ The selected representation urls of the types of a session by their tag query. A flush that touches a type, a representation or a tag only forgets that type."""
+
+    def __init__(self, session: sqlalchemy.orm.Session) -> None:
+        self.urls: dict[int, dict[frozenset[str], typing.Optional[str]]] = {}
+        sqlalchemy.event.listen(session, "after_flush", self.invalidate)
+
+    def get(self, type: Type, tags: typing.Iterable[str]) -> typing.Optional[str]:
+        """🔗 The url of the best matching representation of a type or `None` if it has no representations."""
+        urls = self.urls.setdefault(type.pk, {})
+        key = frozenset(tags)
+        if key not in urls:
+            representation = findRepresentation(type.representations, key)
+            urls[key] = representation.url if representation is not None else None
+        return urls[key]
+
+    def invalidate(self, session: sqlalchemy.orm.Session, flushContext) -> None:
+        """🥀 Forget the types that are touched by a flush. Only loaded values are read to not load anything while flushing."""
+        if not self.urls:
+            return
+        for entity in itertools.chain(session.new, session.dirty, session.deleted):
+            values = sqlalchemy.inspect(entity).dict
+            match entity:
+                case Type():
+                    self.urls.pop(values.get("pk"), None)
+                case Representation():
+                    self.urls.pop(values.get("typePk"), None)
+                case Tag():
+                    representation = values.get("representation")
+                    if representation is None:
+                        self.urls.clear()
+                    else:
+                        self.urls.pop(sqlalchemy.inspect(representation).dict.get("typePk"), None)
+
+
+# endregion Representation Selection
+
+# region Graph
+
+
+class UnionFind:
+    """🔗 Disjoint sets of the numbers below a size with path halving and union by size."""
+
+    def __init__(self, size: int) -> None:
+        self.parents = list(range(size))
+        self.sizes = [1] * size
+
+    def find(self, i: int) -> int:
+        parents = self.parents
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    def union(self, i: int, j: int) -> bool:
+        """🔗 Join the sets of two numbers and return if they were disjoint before."""
+        i, j = self.find(i), self.find(j)
+        if i == j:
+            return False
+        if self.sizes[i] < self.sizes[j]:
+            i, j = j, i
+        self.parents[j] = i
+        self.sizes[i] += self.sizes[j]
+        return True
+
+
+class SpanningForest:
+    """🌲 The trees that reach every piece of a design over a subset of its connections.
+    All arrays are indexed by the index of the piece in the design and -1 stands for none."""
+
+    def __init__(self, roots: list[int], order: list[int], parents: numpy.ndarray, parentEdges: numpy.ndarray, depths: numpy.ndarray, redundantEdges: list[int]) -> None:
+        self.roots = roots
+        self.order = order
+        """🚶 The pieces in the breadth-first order of the walk. Parents always come before their children."""
+        self.parents = parents
+        self.parentEdges = parentEdges
+        """🔗 The index of the connection that reached a piece from its parent."""
+        self.depths = depths
+        self.redundantEdges = redundantEdges
+        """♻️ The indices of the connections that are not part of the forest because they close a cycle or join two roots."""
+
+
+class DesignGraph:
+    """🕸️ The pieces of a design as nodes and its connections as edges in compressed adjacency arrays.
+    The neighbors of a piece are ordered like the connections of the design which makes all walks deterministic."""
+
+    def __init__(self, design: Design) -> None:
+        self.design = design
+        self.indices: dict[str, int] = {p.id_: i for i, p in enumerate(design.pieces)}
+        self.edges = numpy.array(
+            [(self.indices[c.connectedPiece.id_], self.indices[c.connectingPiece.id_]) for c in design.connections],
+            dtype=numpy.int64,
+        ).reshape(len(design.connections), 2)
+        """🔗 The (C, 2) indices of the connected and the connecting piece of every connection."""
+        ends = self.edges.T.reshape(-1)
+        self.offsets = numpy.zeros(len(design.pieces) + 1, dtype=numpy.int64)
+        self.offsets[1:] = numpy.cumsum(numpy.bincount(ends, minlength=len(design.pieces)))
+        """📇 The neighbors of piece i and the connections to them are at offsets[i]:offsets[i + 1]."""
+        # A counting sort of both ends of all connections by their piece in O(P + C) that keeps the order of the connections.
+        cursors = self.offsets[:-1].tolist()
+        neighbors = [0] * len(ends)
+        neighborEdges = [0] * len(ends)
+        for k, (connected, connecting) in enumerate(self.edges.tolist()):
+            for end, neighbor in ((connected, connecting), (connecting, connected)):
+                position = cursors[end]
+                cursors[end] += 1
+                neighbors[position] = neighbor
+                neighborEdges[position] = k
+        self.neighbors = numpy.array(neighbors, dtype=numpy.int64)
+        self.neighborEdges = numpy.array(neighborEdges, dtype=numpy.int64)
+
+    def components(self) -> numpy.ndarray:
+        """🧩 The component of every piece. Components are numbered in the order of their first piece."""
+        sets = UnionFind(len(self.indices))
+        for connected, connecting in self.edges.tolist():
+            sets.union(connected, connecting)
+        numbers: dict[int, int] = {}
+        return numpy.array([numbers.setdefault(sets.find(i), len(numbers)) for i in range(len(self.indices))], dtype=numpy.int64)
+
+    def roots(self) -> list[int]:
+        """🌱 All fixed pieces and the first piece of every component without a fixed piece."""
+        fixedPieces = [i for i, p in enumerate(self.design.pieces) if p.plane is not None]
+        components = self.components()
+        fixedComponents = set(components[fixedPieces].tolist())
+        firstPieces = {}
+        for i, component in enumerate(components.tolist()):
+            if component not in fixedComponents:
+                firstPieces.setdefault(component, i)
+        return fixedPieces + list(firstPieces.values())
+
+    def spanningForest(self, roots: typing.Optional[list[int]] = None) -> SpanningForest:
+        """🌲 Walk breadth-first from all roots (by default fixed pieces first) at once in O(P + C).
+        Pieces that can not be reached from the roots become roots of their own in the order of the design."""
+        if roots is None:
+            roots = self.roots()
+        pieceCount = len(self.indices)
+        offsets, neighbors, neighborEdges = self.offsets.tolist(), self.neighbors.tolist(), self.neighborEdges.tolist()
+        parents = [-1] * pieceCount
+        parentEdges = [-1] * pieceCount
+        depths = [-1] * pieceCount
+        roots = list(dict.fromkeys(roots))
+        order = []
+
+        def walk(starts: list[int]) -> None:
+            for start in starts:
+                depths[start] = 0
+            order.extend(starts)
+            queue = collections.deque(starts)
+            while queue:
+                parent = queue.popleft()
+                for k in range(offsets[parent], offsets[parent + 1]):
+                    child = neighbors[k]
+                    if depths[child] != -1:
+                        continue
+                    depths[child] = depths[parent] + 1
+                    parents[child] = parent
+                    parentEdges[child] = neighborEdges[k]
+                    order.append(child)
+                    queue.append(child)
+
+        walk(roots)
+        for i in range(pieceCount):
+            if depths[i] == -1:
+                roots.append(i)
+                walk([i])
+        isTreeEdge = numpy.zeros(len(self.edges), dtype=bool)
+        isTreeEdge[[e for e in parentEdges if e != -1]] = True
+        return SpanningForest(
+            roots,
+            order,
+            numpy.array(parents, dtype=numpy.int64),
+            numpy.array(parentEdges, dtype=numpy.int64),
+            numpy.array(depths, dtype=numpy.int64),
+            numpy.flatnonzero(~isTreeEdge).tolist(),
+        )
+
+
+# endregion Graph
+
+# region Spatial Index
+
+
+def typeBounds(type: Type) -> numpy.ndarray:
+    """📦 The (2, 3) local minimum and maximum of a type.
+    Representations are files that the engine does not read, so the bounds come from the first representation with a bounds attribute (minX,minY,minZ,maxX,maxY,maxZ).
+    Without one the points of the ports span the extent of the type."""
+    for representation in type.representations:
+        for attribute in representation.attributes:
+            if attribute.name == BOUNDS_ATTRIBUTE:
+                try:
+                    values = [float(v) for v in attribute.value.split(",")]
+                except ValueError:
+                    raise BoundsNotValid(attribute.value)
+                if len(values) != 6:
+                    raise BoundsNotValid(attribute.value)
+                return numpy.array(values, dtype=numpy.float64).reshape(2, 3)
+    points = numpy.array([(p.point.x, p.point.y, p.point.z) for p in type.ports], dtype=numpy.float64).reshape(-1, 3)
+    if len(points) == 0:
+        return numpy.zeros((2, 3))
+    return numpy.stack([points.min(axis=0), points.max(axis=0)])
+
+
+def transformBounds(transforms: numpy.ndarray, bounds: numpy.ndarray) -> numpy.ndarray:
+    """📦 The (N, 2, 3) world bounds of the (N, 2, 3) local bounds that are moved by (N, 4, 4) transforms."""
+    corners = numpy.stack(numpy.meshgrid([0, 1], [0, 1], [0, 1], indexing="ij"), axis=-1).reshape(8, 3)
+    points = bounds[:, corners, [0, 1, 2]]
+    points = numpy.einsum("nij,nkj->nki", transforms[:, :3, :3], points) + transforms[:, None, :3, 3]
+    return numpy.stack([points.min(axis=1), points.max(axis=1)], axis=1)
+
+
+def boundsDistances(bounds: numpy.ndarray, point: numpy.ndarray) -> numpy.ndarray:
+    """📏 The distances of a point to (N, 2, 3) bounds. Points inside have a distance of zero."""
+    return numpy.linalg.norm(numpy.maximum(numpy.maximum(bounds[:, 0] - point, point - bounds[:, 1]), 0.0), axis=1)
+
+
+class SpatialIndex:
+    """🗺️ A uniform grid over the (N, 2, 3) world bounds of the pieces of a scene.
+    Every piece is listed in all cells that its bounds overlap and pieces that would overlap too many cells are checked by every query.
+    Moving pieces only updates their own cells."""
+
+    CELLS_PER_PIECE_MAX = 64
+
+    def __init__(self, bounds: numpy.ndarray, cellSize: typing.Optional[float] = None) -> None:
+        self.bounds = numpy.array(bounds, dtype=numpy.float64).reshape(-1, 2, 3)
+        self.cellSize = cellSize if cellSize is not None else self.estimateCellSize()
+        self.cells: dict[tuple[int, int, int], set[int]] = {}
+        self.pieceCells: list[list[tuple[int, int, int]]] = [[] for _ in range(len(self.bounds))]
+        self.oversized: set[int] = set()
+        """🐘 The pieces that are checked by every query because they overlap more than CELLS_PER_PIECE_MAX cells."""
+        for i in range(len(self.bounds)):
+            self.insert(i)
+        self.occupied = self.occupiedCells()
+        """🧊 The (M, 3) cells that contain at least one piece. They limit how far a nearest query has to search."""
+
+    def estimateCellSize(self) -> float:
+        """📐 The median size of a piece but at least the size that spreads all pieces over as many cells as there are pieces."""
+        if len(self.bounds) == 0:
+            return 1.0
+        pieceSize = float(numpy.median((self.bounds[:, 1] - self.bounds[:, 0]).max(axis=1)))
+        sceneSize = float((self.bounds[:, 1].max(axis=0) - self.bounds[:, 0].min(axis=0)).max()) / numpy.cbrt(len(self.bounds))
+        return max(pieceSize, sceneSize, TOLERANCE)
+
+    def cellRange(self, minimum: numpy.ndarray, maximum: numpy.ndarray) -> tuple[numpy.ndarray, numpy.ndarray]:
+        return numpy.floor(minimum / self.cellSize).astype(numpy.int64), numpy.floor(maximum / self.cellSize).astype(numpy.int64)
+
+    def insert(self, i: int) -> None:
+        lower, upper = self.cellRange(self.bounds[i, 0] - TOLERANCE, self.bounds[i, 1] + TOLERANCE)
+        if numpy.prod(upper - lower + 1) > self.CELLS_PER_PIECE_MAX:
+            self.oversized.add(i)
+            return
+        cells = list(itertools.product(*(range(lo, hi + 1) for lo, hi in zip(lower.tolist(), upper.tolist()))))
+        for cell in cells:
+            self.cells.setdefault(cell, set()).add(i)
+        self.pieceCells[i] = cells
+
+    def remove(self, i: int) -> None:
+        self.oversized.discard(i)
+        for cell in self.pieceCells[i]:
+            pieces = self.cells[cell]
+            pieces.discard(i)
+            if not pieces:
+                del self.cells[cell]
+        self.pieceCells[i] = []
+
+    def occupiedCells(self) -> numpy.ndarray:
+        return numpy.array(list(self.cells), dtype=numpy.int64).reshape(-1, 3)
+
+    def move(self, indices: list[int], bounds: numpy.ndarray) -> None:
+        """🚚 Replace the bounds of some pieces."""
+        for i, pieceBounds in zip(indices, bounds):
+            self.remove(i)
+            self.bounds[i] = pieceBounds
+            self.insert(i)
+        self.occupied = self.occupiedCells()
+
+    def candidates(self, minimum: numpy.ndarray, maximum: numpy.ndarray) -> numpy.ndarray:
+        lower, upper = self.cellRange(minimum, maximum)
+        if numpy.prod(upper - lower + 1) > len(self.cells):
+            return numpy.arange(len(self.bounds))
+        pieces = set(self.oversized)
+        for cell in itertools.product(*(range(lo, hi + 1) for lo, hi in zip(lower.tolist(), upper.tolist()))):
+            pieces.update(self.cells.get(cell, ()))
+        return numpy.array(sorted(pieces), dtype=numpy.int64)
+
+    def box(self, minimum: numpy.ndarray, maximum: numpy.ndarray) -> list[int]:
+        """📦 The pieces whose bounds overlap a box in the order of the design."""
+        minimum, maximum = numpy.asarray(minimum, dtype=numpy.float64), numpy.asarray(maximum, dtype=numpy.float64)
+        candidates = self.candidates(minimum, maximum)
+        bounds = self.bounds[candidates]
+        overlaps = ((bounds[:, 0] <= maximum + TOLERANCE) & (bounds[:, 1] >= minimum - TOLERANCE)).all(axis=1)
+        return candidates[overlaps].tolist()
+
+    def rank(self, candidates: numpy.ndarray, point: numpy.ndarray) -> tuple[numpy.ndarray, numpy.ndarray]:
+        """📏 The candidates and their distances to a point from the closest to the farthest. Ties keep the order of the design."""
+        distances = boundsDistances(self.bounds[candidates], point)
+        order = numpy.lexsort((candidates, distances))
+        return candidates[order], distances[order]
+
+    def radius(self, point: numpy.ndarray, radius: float) -> list[int]:
+        """⭕ The pieces whose bounds are within a radius around a point from the closest to the farthest."""
+        point = numpy.asarray(point, dtype=numpy.float64)
+        candidates, distances = self.rank(self.candidates(point - radius, point + radius), point)
+        return candidates[distances <= radius + TOLERANCE].tolist()
+
+    def nearest(self, point: numpy.ndarray, count: int = 1) -> list[int]:
+        """🎯 The pieces whose bounds are the closest to a point from the closest to the farthest.
+        The cells are searched in growing shells around the point until no unseen cell can be closer than the last found piece.
+        The search starts at the first shell with an occupied cell and all pieces are ranked once a shell has more cells than are occupied."""
+        point = numpy.asarray(point, dtype=numpy.float64)
+        count = min(count, len(self.bounds))
+        if count <= 0:
+            return []
+        center = numpy.floor(point / self.cellSize).astype(numpy.int64)
+        shells = numpy.abs(self.occupied - center).max(axis=1) if len(self.occupied) else numpy.zeros(1, dtype=numpy.int64)
+        pieces = set(self.oversized)
+        for shell in range(int(shells.min()), int(shells.max()) + 1):
+            if shellSize(shell) > len(self.occupied):
+                pieces = set(range(len(self.bounds)))
+                break
+            for cell in shellCells(center, shell):
+                pieces.update(self.cells.get(cell, ()))
+            if len(pieces) >= count:
+                _, distances = self.rank(numpy.array(sorted(pieces), dtype=numpy.int64), point)
+                if distances[count - 1] <= shell * self.cellSize:
+                    break
+        candidates, _ = self.rank(numpy.array(sorted(pieces), dtype=numpy.int64), point)
+        return candidates[:count].tolist()
+
+
+def shellSize(shell: int) -> int:
+    """🐚 The number of cells on the surface of the cube of cells that reach a number of cells around a center cell."""
+    return 24 * shell**2 + 2 if shell > 0 else 1
+
+
+def shellCells(center: numpy.ndarray, shell: int) -> typing.Iterator[tuple[int, int, int]]:
+    """🐚 The cells on the surface of the cube of cells that reach a number of cells around a center cell."""
+    x, y, z = center.tolist()
+    for dx in range(-shell, shell + 1):
+        for dy in range(-shell, shell + 1):
+            if abs(dx) == shell or abs(dy) == shell:
+                dzs = range(-shell, shell + 1)
+            else:
+                dzs = (-shell, shell) if shell > 0 else (0,)
+            for dz in dzs:
+                yield (x + dx, y + dy, z + dz)
+
+
+# endregion Spatial Index
+
+# region Clash
+
+
+def sweepAndPrune(bounds: numpy.ndarray) -> numpy.ndarray:
+    """🧹 The sorted (M, 2) index pairs (i < j) of (N, 2, 3) axis-aligned bounds that overlap by more than the tolerance.
+    The bounds are sorted along x and every box is only compared with the boxes that start before it ends."""
+    bounds = numpy.asarray(bounds, dtype=numpy.float64).reshape(-1, 2, 3)
+    order = numpy.argsort(bounds[:, 0, 0], kind="stable")
+    starts = bounds[order, 0, 0]
+    ends = numpy.searchsorted(starts, bounds[order, 1, 0] - TOLERANCE, side="left")
+    positions = numpy.arange(len(order))
+    counts = numpy.maximum(ends - positions - 1, 0)
+    first = numpy.repeat(positions, counts)
+    second = first + 1 + (numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts) - counts, counts))
+    pairs = numpy.stack([order[first], order[second]], axis=1)
+    overlaps = ((bounds[pairs[:, 0], 0] < bounds[pairs[:, 1], 1] - TOLERANCE) & (bounds[pairs[:, 1], 0] < bounds[pairs[:, 0], 1] - TOLERANCE)).all(axis=1)
+    pairs = numpy.sort(pairs[overlaps], axis=1).reshape(-1, 2)
+    return pairs[numpy.lexsort((pairs[:, 1], pairs[:, 0]))]
+
+
+def orientedBoxes(transforms: numpy.ndarray, bounds: numpy.ndarray) -> tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+    """📦 The (N, 3) centers, (N, 3, 3) axes as columns and (N, 3) half extents of (N, 2, 3) local bounds that are moved by (N, 4, 4) transforms."""
+    centers = numpy.einsum("nij,nj->ni", transforms[:, :3, :3], bounds.mean(axis=1)) + transforms[:, :3, 3]
+    return centers, transforms[:, :3, :3], (bounds[:, 1] - bounds[:, 0]) / 2
+
+
+def orientedBoxesOverlap(centers: numpy.ndarray, axes: numpy.ndarray, halfExtents: numpy.ndarray, pairs: numpy.ndarray) -> numpy.ndarray:
+    """🧱 Whether the oriented boxes of (M, 2) index pairs overlap by more than the tolerance.
+    The boxes are projected on the 15 separating axes: the 3 axes of each box and the 9 cross products of them."""
+    a, b = pairs[:, 0], pairs[:, 1]
+    axesA, axesB = axes[a].transpose(0, 2, 1), axes[b].transpose(0, 2, 1)
+    crosses = numpy.cross(axesA[:, :, None, :], axesB[:, None, :, :]).reshape(-1, 9, 3)
+    separatingAxes = numpy.concatenate([axesA, axesB, crosses], axis=1)
+    lengths = numpy.linalg.norm(separatingAxes, axis=-1)
+    radiiA = numpy.einsum("mk,mlk->ml", halfExtents[a], numpy.abs(numpy.einsum("mlj,mkj->mlk", separatingAxes, axesA)))
+    radiiB = numpy.einsum("mk,mlk->ml", halfExtents[b], numpy.abs(numpy.einsum("mlj,mkj->mlk", separatingAxes, axesB)))
+    distances = numpy.abs(numpy.einsum("mlj,mj->ml", separatingAxes, centers[b] - centers[a]))
+    overlaps = (distances < radiiA + radiiB - TOLERANCE * lengths) | (lengths < TOLERANCE)
+    return overlaps.all(axis=1)
+
+
+def clashes(transforms: numpy.ndarray, bounds: numpy.ndarray) -> numpy.ndarray:
+    """💥 The (M, 2) index pairs of (N, 2, 3) local bounds moved by (N, 4, 4) transforms whose oriented boxes overlap.
+    The axis-aligned world bounds are swept first and only their overlaps are tested as oriented boxes."""
+    pairs = sweepAndPrune(transformBounds(transforms, bounds))
+    if len(pairs) == 0:
+        return pairs
+    return pairs[orientedBoxesOverlap(*orientedBoxes(transforms, bounds), pairs)]
+
+
+# endregion Clash
+
+# region Scene
+
+
+class ScenePieceOutput(PieceIdField, Output):
+    plane: PlaneOutput = sqlmodel.Field()
+    fixedPiece: PieceId = sqlmodel.Field()
+    """📌 The fixed piece that the piece was placed from."""
+    parent: typing.Optional[PieceId] = sqlmodel.Field(default=None)
+    """👪 The piece that the piece was placed from directly. None for fixed pieces."""
+    depth: int = sqlmodel.Field(default=0)
+    """🪜 The number of connections between the piece and its fixed piece."""
+
+
+class SceneOutput(Output):
+    pieces: list[ScenePieceOutput] = sqlmodel.Field(default_factory=list)
+
+
+class FlatScenePieceOutput(Output):
+    path: list[str] = sqlmodel.Field(default_factory=list)
+    """🪆 The ids of the piece from the outermost to the innermost design."""
+    type: TypeId = sqlmodel.Field()
+    plane: PlaneOutput = sqlmodel.Field()
+
+
+class FlatSceneOutput(Output):
+    pieces: list[FlatScenePieceOutput] = sqlmodel.Field(default_factory=list)
+
+
+class ClashOutput(Output):
+    piece: list[str] = sqlmodel.Field(default_factory=list)
+    """🪆 The ids of the first piece from the outermost to the innermost design."""
+    otherPiece: list[str] = sqlmodel.Field(default_factory=list)
+    """🪆 The ids of the second piece from the outermost to the innermost design."""
+
+
+class ClashesOutput(Output):
+    clashes: list[ClashOutput] = sqlmodel.Field(default_factory=list)
+
+
+class SpatialQueryOutput(Output):
+    pieces: list[PieceId] = sqlmodel.Field(default_factory=list)
+
+
+def connectionTransform(connectedPort: Port, connectingPort: Port, connection: Connection) -> Transform:
+    """🔗 The transform from the frame of the connecting piece to the frame of the connected piece.
+    The connecting port is turned against the connected port, rotated around it and then turned and tilted.
+    Afterwards it is moved along the gap, shift and rise directions of the connected port."""
+    connectedDirection = connectedPort.direction.normalize()
+    connectingDirection = connectingPort.direction.normalize()
+    orientation = Transform.fromDirections(connectingDirection.revert(), connectedDirection)
+    portRotation = Transform.fromDirections(Vector.Y(), connectedDirection)
+    rotation = Transform.fromAngle(connectedDirection, -connection.rotation)
+    turnAxis = Vector.Z().transform(rotation.after(portRotation))
+    tiltAxis = Vector.X().transform(rotation.after(portRotation))
+    orientation = Transform.fromAngle(tiltAxis, connection.tilt).after(Transform.fromAngle(turnAxis, connection.turn)).after(rotation).after(orientation)
+    translation = connectedPort.point.toVector() + Vector.Y().transform(portRotation).amplify(connection.gap) + Vector.X().transform(portRotation).amplify(connection.shift) + Vector.Z().transform(portRotation).amplify(connection.rise)
+    return Transform.fromTranslation(translation).after(orientation).after(connectingPort.point.toVector().revert().toTransform())
+
+
+def normalizeVectors(vectors: numpy.ndarray) -> numpy.ndarray:
+    """📏 Normalize (N, 3) vectors. Zero vectors stay zero."""
+    lengths = numpy.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / numpy.where(lengths < TOLERANCE, 1.0, lengths)
+
+
+def rotationMatrices(axes: numpy.ndarray, angles: numpy.ndarray) -> numpy.ndarray:
+    """🔄 The (N, 3, 3) right-handed rotations around (N, 3) axes by (N,) angles in degrees."""
+    x, y, z = normalizeVectors(axes).T
+    zero = numpy.zeros_like(x)
+    cross = numpy.stack([zero, -z, y, z, zero, -x, -y, x, zero], axis=-1).reshape(-1, 3, 3)
+    radians = numpy.radians(angles)[:, None, None]
+    return numpy.eye(3) + numpy.sin(radians) * cross + (1 - numpy.cos(radians)) * (cross @ cross)
+
+
+def alignmentMatrices(startDirections: numpy.ndarray, endDirections: numpy.ndarray) -> numpy.ndarray:
+    """🧭 The (N, 3, 3) shortest rotations that turn (N, 3) start directions onto (N, 3) end directions. Same as `Transform.fromDirections`."""
+    starts = normalizeVectors(startDirections)
+    ends = normalizeVectors(endDirections)
+    axes = numpy.cross(starts, ends)
+    sines = numpy.linalg.norm(axes, axis=-1)
+    cosines = numpy.einsum("ij,ij->i", starts, ends)
+    angles = numpy.degrees(numpy.arctan2(sines, cosines))
+    parallel = sines < TOLERANCE
+    opposite = parallel & (cosines <= 0)
+    zAxes = numpy.broadcast_to((0.0, 0.0, 1.0), ends.shape)
+    xAxes = numpy.broadcast_to((1.0, 0.0, 0.0), ends.shape)
+    halfTurnAxes = numpy.where((numpy.abs(numpy.abs(ends[:, 2]) - 1) < TOLERANCE)[:, None], xAxes, numpy.cross(zAxes, ends))
+    halfTurnAxes = numpy.where((numpy.abs(ends[:, 2]) < TOLERANCE)[:, None], zAxes, halfTurnAxes)
+    axes = numpy.where(opposite[:, None], halfTurnAxes, axes)
+    angles = numpy.where(opposite, 180.0, numpy.where(parallel, 0.0, angles))
+    return rotationMatrices(axes, angles)
+
+
+def connectionTransforms(
+    connectedPoints: numpy.ndarray,
+    connectedDirections: numpy.ndarray,
+    connectingPoints: numpy.ndarray,
+    connectingDirections: numpy.ndarray,
+    gaps: numpy.ndarray,
+    shifts: numpy.ndarray,
+    rises: numpy.ndarray,
+    rotations: numpy.ndarray,
+    turns: numpy.ndarray,
+    tilts: numpy.ndarray,
+) -> numpy.ndarray:
+    """🔗 The (N, 4, 4) transforms of N connections at once. Same as `connectionTransform` for every connection."""
+    count = len(gaps)
+    connectedDirections = normalizeVectors(connectedDirections)
+    orientations = alignmentMatrices(-connectingDirections, connectedDirections)
+    portRotations = alignmentMatrices(numpy.broadcast_to((0.0, 1.0, 0.0), (count, 3)), connectedDirections)
+    rotated = rotationMatrices(connectedDirections, -rotations)
+    rotatedPortRotations = rotated @ portRotations
+    turned = rotationMatrices(rotatedPortRotations[:, :, 2], turns)
+    tilted = rotationMatrices(rotatedPortRotations[:, :, 0], tilts)
+    orientations = tilted @ turned @ rotated @ orientations
+    translations = connectedPoints + portRotations[:, :, 1] * gaps[:, None] + portRotations[:, :, 0] * shifts[:, None] + portRotations[:, :, 2] * rises[:, None]
+    transforms = numpy.zeros((count, 4, 4))
+    transforms[:, :3, :3] = orientations
+    transforms[:, :3, 3] = translations - numpy.einsum("nij,nj->ni", orientations, connectingPoints)
+    transforms[:, 3, 3] = 1.0
+    return transforms
+
+
+def invertTransforms(transforms: numpy.ndarray) -> numpy.ndarray:
+    """↩️ The inverses of (N, 4, 4) transforms with rotation and translation only."""
+    rotations = transforms[:, :3, :3].transpose(0, 2, 1)
+    inverses = numpy.zeros_like(transforms)
+    inverses[:, :3, :3] = rotations
+    inverses[:, :3, 3] = -numpy.einsum("nij,nj->ni", rotations, transforms[:, :3, 3])
+    inverses[:, 3, 3] = 1.0
+    return inverses
+
+
+def connectionArrays(connections: list[Connection]) -> tuple[numpy.ndarray, ...]:
+    """🧮 The arguments of `connectionTransforms` for connections."""
+    values = numpy.array(
+        [
+            (
+                c.connectedPort.pointX,
+                c.connectedPort.pointY,
+                c.connectedPort.pointZ,
+                c.connectedPort.directionX,
+                c.connectedPort.directionY,
+                c.connectedPort.directionZ,
+                c.connectingPort.pointX,
+                c.connectingPort.pointY,
+                c.connectingPort.pointZ,
+                c.connectingPort.directionX,
+                c.connectingPort.directionY,
+                c.connectingPort.directionZ,
+                c.gap,
+                c.shift,
+                c.rise,
+                c.rotation,
+                c.turn,
+                c.tilt,
+            )
+            for c in connections
+        ],
+        dtype=numpy.float64,
+    ).reshape(-1, 18)
+    return (values[:, 0:3], values[:, 3:6], values[:, 6:9], values[:, 9:12], *values[:, 12:18].T)
+
+
+class Scene:
+    """🎬 The planes of all pieces of a design.
+    Pieces with a plane are fixed and all other pieces are placed breadth-first along the spanning forest of the design graph.
+    Connected pieces without any fixed piece start from their first piece on the world plane.
+    A connection that is walked from the connecting to the connected piece uses the inverse transform,
+    so the placement does not depend on which piece is fixed.
+    The transforms of all connections are computed at once and composed level by level of the walk.
+    After a change only the pieces below the changed piece, connection or port are placed again.
+    A piece of a design is placed as a whole and connects through the ports of the pieces inside it."""
+
+    def __init__(self, design: Design, flattener: typing.Optional["DesignFlattener"] = None) -> None:
+        self.design = design
+        self.flattener = flattener if flattener is not None else DesignFlattener()
+        self.instances: dict[str, DesignInstance] = {}
+        """🪆 The solved designs of the pieces of designs."""
+        self.indices: dict[str, int] = {p.id_: i for i, p in enumerate(design.pieces)}
+        self.parents: dict[str, typing.Optional[str]] = {}
+        self.fixedPieces: dict[str, str] = {}
+        self.depths: dict[str, int] = {}
+        self.connections: dict[str, tuple[Connection, bool]] = {}
+        """🔗 The connection that placed a piece and whether it was walked from the connecting to the connected piece."""
+        self.children: dict[str, list[str]] = {p.id_: [] for p in design.pieces}
+        self.transforms = numpy.tile(numpy.eye(4), (len(design.pieces), 1, 1))
+        """▦ The (N, 4, 4) transforms of the pieces in the order of the design."""
+        self.connectionPieces: dict[int, str] = {}
+        """🔑 The primary keys of the walked connections and the pieces that they placed."""
+        self.portPieces: dict[int, list[str]] = {}
+        """🔑 The primary keys of the ports of the walked connections and the pieces that they placed."""
+        self.planePieces: dict[int, str] = {}
+        """🔑 The primary keys of the planes of the fixed pieces and the fixed pieces."""
+        self.stale: set[str] = set()
+        """🥀 The pieces that have to be placed again together with all pieces below them."""
+        self.solve()
+
+    def solve(self) -> None:
+        if id(self.design) in self.flattener.visiting:
+            raise DesignNestingCycle(self.design)
+        self.flattener.visiting.add(id(self.design))
+        try:
+            for piece in self.design.pieces:
+                if piece.designPiece is not None:
+                    self.instances[piece.id_] = self.flattener.flatten(piece.designPiece)
+                elif piece.type is None:
+                    raise FeatureNotYetSupported()
+        finally:
+            self.flattener.visiting.discard(id(self.design))
+        self.graph = DesignGraph(self.design)
+        self.forest = self.graph.spanningForest()
+        pieces, connections, edges = self.design.pieces, self.design.connections, self.graph.edges.tolist()
+        parents, parentEdges = self.forest.parents.tolist(), self.forest.parentEdges.tolist()
+        for i in self.forest.order:
+            piece = pieces[i]
+            if parents[i] == -1:
+                self.fix(piece.id_, Transform.fromPlane(piece.plane) if piece.plane is not None else Transform())
+                if piece.plane is not None and piece.plane.pk is not None:
+                    self.planePieces[piece.plane.pk] = piece.id_
+            else:
+                edge = parentEdges[i]
+                self.connect(piece.id_, pieces[parents[i]].id_, connections[edge], edges[edge][0] != parents[i])
+        self.compose()
+
+    def fix(self, pieceId: str, transform: Transform) -> None:
+        self.transforms[self.indices[pieceId]] = transform
+        self.parents[pieceId] = None
+        self.fixedPieces[pieceId] = pieceId
+        self.depths[pieceId] = 0
+
+    def connect(self, childId: str, parentId: str, connection: Connection, isReversed: bool) -> None:
+        self.parents[childId] = parentId
+        self.children[parentId].append(childId)
+        self.connections[childId] = (connection, isReversed)
+        self.fixedPieces[childId] = self.fixedPieces[parentId]
+        self.depths[childId] = self.depths[parentId] + 1
+        if connection.pk is not None:
+            self.connectionPieces[connection.pk] = childId
+        for portPk in {connection.connectedPortPk, connection.connectingPortPk} - {None}:
+            self.portPieces.setdefault(portPk, []).append(childId)
+
+    def compose(self, children: typing.Optional[list[str]] = None) -> None:
+        """🧱 Compute the transforms of the walked connections that placed the children (by default all) at once and chain them from the fixed pieces outwards."""
+        if children is None:
+            children = list(self.connections)
+        if not children:
+            return
+        connections = [self.connections[c][0] for c in children]
+        arrays = connectionArrays(connections)
+        if self.instances:
+            self.placeNestedPorts(connections, arrays)
+        transforms = connectionTransforms(*arrays)
+        isReversed = numpy.array([self.connections[c][1] for c in children])
+        if isReversed.any():
+            transforms[isReversed] = invertTransforms(transforms[isReversed])
+        childIndices = numpy.array([self.indices[c] for c in children])
+        parentIndices = numpy.array([self.indices[self.parents[c]] for c in children])
+        depths = numpy.array([self.depths[c] for c in children])
+        for depth in numpy.unique(depths):
+            level = depths == depth
+            self.transforms[childIndices[level]] = self.transforms[parentIndices[level]] @ transforms[level]
+
+    def placeNestedPorts(self, connections: list[Connection], arrays: tuple[numpy.ndarray, ...]) -> None:
+        """🪆 Move the points and directions of the ports of pieces inside designs into the frame of the piece of the design."""
+        for k, connection in enumerate(connections):
+            for piece, designPiece, points, directions in (
+                (connection.connectedPiece, connection.connectedDesignPiece, arrays[0], arrays[1]),
+                (connection.connectingPiece, connection.connectingDesignPiece, arrays[2], arrays[3]),
+            ):
+                if designPiece is None:
+                    continue
+                transform = self.instances[piece.id_].pieceTransforms[designPiece.id_]
+                points[k] = transform[:3, :3] @ points[k] + transform[:3, 3]
+                directions[k] = transform[:3, :3] @ directions[k]
+
+    def invalidate(self, pieceId: str) -> None:
+        """🥀 Mark a piece to be placed again together with all pieces below it."""
+        self.stale.add(pieceId)
+
+    def invalidateConnection(self, connectionPk: int) -> None:
+        if connectionPk in self.connectionPieces:
+            self.invalidate(self.connectionPieces[connectionPk])
+
+    def invalidatePort(self, portPk: int) -> None:
+        for pieceId in self.portPieces.get(portPk, []):
+            self.invalidate(pieceId)
+
+    def invalidatePlane(self, planePk: int) -> None:
+        if planePk in self.planePieces:
+            self.invalidate(self.planePieces[planePk])
+
+    def update(self) -> None:
+        """🔄 Place the stale pieces and all pieces below them again."""
+        if not self.stale:
+            return
+        pieces = []
+        queue = collections.deque(self.stale)
+        visited = set(self.stale)
+        while queue:
+            pieceId = queue.popleft()
+            pieces.append(pieceId)
+            for childId in self.children[pieceId]:
+                if childId not in visited:
+                    visited.add(childId)
+                    queue.append(childId)
+        for pieceId in pieces:
+            if self.parents[pieceId] is None:
+                piece = self.design.pieces[self.indices[pieceId]]
+                self.transforms[self.indices[pieceId]] = Transform.fromPlane(piece.plane) if piece.plane is not None else Transform()
+        self.compose([p for p in pieces if self.parents[p] is not None])
+        self.stale.clear()
+        if "spatialIndex" in self.__dict__:
+            self.spatialIndex.move([self.indices[p] for p in pieces], self.bounds(pieces))
+
+    def bounds(self, pieceIds: typing.Optional[list[str]] = None) -> numpy.ndarray:
+        """📦 The (N, 2, 3) world bounds of some (by default all) pieces."""
+        if pieceIds is None:
+            pieceIds = list(self.indices)
+        indices = [self.indices[p] for p in pieceIds]
+        localBounds: dict[int, numpy.ndarray] = {}
+        bounds = []
+        for i in indices:
+            piece = self.design.pieces[i]
+            if piece.id_ in self.instances:
+                bounds.append(self.instances[piece.id_].bounds)
+                continue
+            if id(piece.type) not in localBounds:
+                localBounds[id(piece.type)] = typeBounds(piece.type)
+            bounds.append(localBounds[id(piece.type)])
+        return transformBounds(self.transforms[indices], numpy.array(bounds).reshape(len(indices), 2, 3))
+
+    @functools.cached_property
+    def spatialIndex(self) -> SpatialIndex:
+        return SpatialIndex(self.bounds())
+
+    def nearest(self, point: Point, count: int = 1) -> list[str]:
+        if count < 1:
+            raise SpatialQueryNotValid("The count has to be at least 1.")
+        return [self.design.pieces[i].id_ for i in self.spatialIndex.nearest((point.x, point.y, point.z), count)]
+
+    def radius(self, point: Point, radius: float) -> list[str]:
+        if radius < 0:
+            raise SpatialQueryNotValid("The radius can not be negative.")
+        return [self.design.pieces[i].id_ for i in self.spatialIndex.radius((point.x, point.y, point.z), radius)]
+
+    def box(self, minimum: Point, maximum: Point) -> list[str]:
+        if maximum.x < minimum.x or maximum.y < minimum.y or maximum.z < minimum.z:
+            raise SpatialQueryNotValid("The maximum of the box has to be above its minimum.")
+        return [self.design.pieces[i].id_ for i in self.spatialIndex.box((minimum.x, minimum.y, minimum.z), (maximum.x, maximum.y, maximum.z))]
+
+    def plane(self, pieceId: str) -> Plane:
+        return Transform(self.transforms[self.indices[pieceId]]).toPlane()
+
+    def planes(self) -> numpy.ndarray:
+        """📐 The planes (origin, x-axis, y-axis) of all pieces in the order of the design as an (N, 3, 3) array."""
+        return numpy.stack([self.transforms[:, :3, 3], self.transforms[:, :3, 0], self.transforms[:, :3, 1]], axis=1)
+
+    def dump(self) -> SceneOutput:
+        return SceneOutput(
+            pieces=[
+                ScenePieceOutput(
+                    id_=p.id_,
+                    plane=self.plane(p.id_).dump(),
+                    fixedPiece=PieceId(id_=self.fixedPieces[p.id_]),
+                    parent=PieceId(id_=self.parents[p.id_]) if self.parents[p.id_] is not None else None,
+                    depth=self.depths[p.id_],
+                )
+                for p in self.design.pieces
+            ]
+        )
+
+    def clashes(self) -> list[tuple[tuple[str, ...], tuple[str, ...]]]:
+        """💥 The pairs of paths of all pieces of types inside the design and its nested designs whose oriented bounds overlap."""
+        instance = self.instance()
+        localBounds: dict[int, numpy.ndarray] = {}
+        for type in instance.types:
+            if id(type) not in localBounds:
+                localBounds[id(type)] = typeBounds(type)
+        bounds = numpy.array([localBounds[id(type)] for type in instance.types]).reshape(len(instance.types), 2, 3)
+        return [(instance.paths[i], instance.paths[j]) for i, j in clashes(instance.transforms, bounds).tolist()]
+
+    def instance(self) -> "DesignInstance":
+        """🪆 All pieces of types inside the design and inside its nested designs with their transforms in the frame of the design."""
+        paths: list[tuple[str, ...]] = []
+        types: list[Type] = []
+        transforms = []
+        for piece in self.design.pieces:
+            transform = self.transforms[self.indices[piece.id_]]
+            if piece.id_ in self.instances:
+                nested = self.instances[piece.id_]
+                paths += [(piece.id_, *path) for path in nested.paths]
+                types += nested.types
+                transforms.append(transform @ nested.transforms)
+            else:
+                paths.append((piece.id_,))
+                types.append(piece.type)
+                transforms.append(transform[None])
+        pieceBounds = self.bounds()
+        bounds = numpy.stack([pieceBounds[:, 0].min(axis=0), pieceBounds[:, 1].max(axis=0)]) if len(pieceBounds) else numpy.zeros((2, 3))
+        return DesignInstance(
+            paths,
+            types,
+            numpy.concatenate(transforms) if transforms else numpy.zeros((0, 4, 4)),
+            {p.id_: self.transforms[i] for i, p in enumerate(self.design.pieces)},
+            bounds,
+        )
+
+    def dumpFlat(self) -> "FlatSceneOutput":
+        instance = self.instance()
+        return FlatSceneOutput(
+            pieces=[
+                FlatScenePieceOutput(path=list(path), type=TypeId(name=type.name, variant=type.variant), plane=Transform(transform).toPlane().dump())
+                for path, type, transform in zip(instance.paths, instance.types, instance.transforms)
+            ]
+        )
+
+
+class DesignInstance:
+    """🪆 A solved design that is placed as a whole by the pieces of other designs."""
+
+    def __init__(self, paths: list[tuple[str, ...]], types: list[Type], transforms: numpy.ndarray, pieceTransforms: dict[str, numpy.ndarray], bounds: numpy.ndarray) -> None:
+        self.paths = paths
+        """🪆 The ids of the pieces from the outermost to the innermost design."""
+        self.types = types
+        self.transforms = transforms
+        """▦ The (N, 4, 4) transforms of all pieces of types in the frame of the design."""
+        self.pieceTransforms = pieceTransforms
+        """▦ The transforms of the direct pieces of the design which connections to pieces inside the design go through."""
+        self.bounds = bounds
+
+
+class DesignFlattener:
+    """🪆 Solves every design that is used by pieces of designs once and hands out the same instance for every use."""
+
+    def __init__(self) -> None:
+        self.instances: dict[int, tuple[Design, DesignInstance]] = {}
+        self.visiting: set[int] = set()
+        """🔁 The designs that are solved right now. Meeting one of them again means that a design contains itself."""
+
+    def flatten(self, design: Design) -> DesignInstance:
+        if id(design) not in self.instances:
+            self.instances[id(design)] = (design, Scene(design, self).instance())
+        return self.instances[id(design)][1]
+
+
+class SceneCache:
+    """🗃️ The scenes of the designs of a session. They are kept until a flush changes their design.
+    A change of the values of a connection, a port or the plane of a fixed piece only marks the pieces below as stale.
+    Everything else that touches a design drops its scene.
+    Because a design can be used inside any other design, every change also drops the solved designs of pieces of designs and the scenes that use them."""
+
+    CONNECTION_VALUES = ("gap", "shift", "rise", "rotation", "turn", "tilt")
+    PORT_VALUES = ("pointX", "pointY", "pointZ", "directionX", "directionY", "directionZ")
+    PLANE_VALUES = ("originX", "originY", "originZ", "xAxisX", "xAxisY", "xAxisZ", "yAxisX", "yAxisY", "yAxisZ")
+
+    def __init__(self, session: sqlalchemy.orm.Session) -> None:
+        self.scenes: dict[int, Scene] = {}
+        self.flattener = DesignFlattener()
+        sqlalchemy.event.listen(session, "after_flush", self.invalidate)
+
+    def get(self, design: Design) -> Scene:
+        scene = self.scenes.get(design.pk)
+        if scene is None or scene.design is not design:
+            scene = Scene(design, self.flattener)
+            self.scenes[design.pk] = scene
+        else:
+            scene.update()
+        return scene
+
+    def drop(self, designPk: typing.Optional[int]) -> None:
+        if designPk is None:
+            self.scenes.clear()
+        else:
+            self.scenes.pop(designPk, None)
+        self.dropNested()
+
+    def dropNested(self) -> None:
+        if not self.flattener.instances:
+            return
+        self.flattener.instances.clear()
+        self.scenes = {pk: scene for pk, scene in self.scenes.items() if not scene.instances}
+
+    def invalidatePorts(self, portPks: list[int]) -> None:
+        for scene in self.scenes.values():
+            for portPk in portPks:
+                scene.invalidatePort(portPk)
+        self.dropNested()
+
+    def invalidatePlanes(self, planePks: list[int]) -> None:
+        for scene in self.scenes.values():
+            for planePk in planePks:
+                scene.invalidatePlane(planePk)
+        self.dropNested()
+
+    def invalidate(self, session: sqlalchemy.orm.Session, flushContext) -> None:
+        """🥀 Drop or mark the scenes that are touched by a flush. Only loaded values are read to not load anything while flushing."""
+        if not self.scenes:
+            return
+        for entity in list(session.new) + list(session.deleted):
+            self.dropDesignOf(entity)
+        for entity in session.dirty:
+            state = sqlalchemy.inspect(entity)
+            changes = {attribute.key for attribute in state.attrs if attribute.history.has_changes()}
+            if not changes:
+                continue
+            match entity:
+                case Kit() | Type():
+                    continue
+                case Piece() if changes <= {"centerX", "centerY"}:
+                    continue
+                case Connection() if changes <= set(self.CONNECTION_VALUES):
+                    for scene in self.scenes.values():
+                        scene.invalidateConnection(state.dict.get("pk"))
+                    self.dropNested()
+                case Port() if changes <= set(self.PORT_VALUES):
+                    self.invalidatePorts([state.dict.get("pk")])
+                case Plane() if changes <= set(self.PLANE_VALUES):
+                    self.invalidatePlanes([state.dict.get("pk")])
+                case _:
+                    self.dropDesignOf(entity)
+
+    def dropDesignOf(self, entity: typing.Any) -> None:
+        values = sqlalchemy.inspect(entity).dict
+        match entity:
+            case Design():
+                self.drop(values.get("pk"))
+            case Piece() | Connection():
+                self.drop(values.get("designPk"))
+            case Kit() | Type() | Port() | Plane():
+                self.drop(None)
+
+
+# endregion Scene
+
 # endregion Domain
 
 # endregion Modeling
@@ -3262,6 +4808,18 @@ class DatabaseStore(Store, abc.ABC):
     def session(self: "DatabaseStore") -> sqlalchemy.orm.Session:
         return sqlalchemy.orm.sessionmaker(bind=self.engine)()
 
+    @functools.cached_property
+    def scenes(self: "DatabaseStore") -> SceneCache:
+        return SceneCache(self.session)
+
+    @functools.cached_property
+    def portCompatibilities(self: "DatabaseStore") -> PortCompatibilityCache:
+        return PortCompatibilityCache(self.session)
+
+    @functools.cached_property
+    def representations(self: "DatabaseStore") -> RepresentationCache:
+        return RepresentationCache(self.session)
+
     def initialized(self: "DatabaseStore") -> bool:
         try:
             inspector = sqlalchemy.inspect(self.engine)
@@ -3310,7 +4868,7 @@ class DatabaseStore(Store, abc.ABC):
             self.initialize()
             dump = input.model_dump()
             dump["uri"] = kitUri
-            kit = Kit.parse(dump)
+            kit = Kit.parse(dump, PARSE_PROCESSES)
             existingKit = self.session.query(Kit).filter(Kit.uri == kitUri).one_or_none()
             if existingKit is not None:
                 raise KitAlreadyExists(kitUri)
@@ -3501,15 +5059,479 @@ class DatabaseStore(Store, abc.ABC):
             case _:
                 raise FeatureNotYetSupported()
 
+    def kitOrNotFound(self: "DatabaseStore", kitUri: str) -> Kit:
+        try:
+            kit = self.session.query(Kit).filter(Kit.uri == kitUri).one_or_none()
+        except sqlalchemy.exc.OperationalError:
+            raise KitNotFound(kitUri)
+        if kit is None:
+            raise KitNotFound(kitUri)
+        return kit
 
-class SSLMode(enum.Enum):
-    """🔒 The security level of the session"""
-
-    DISABLE = "disable"
-    ALLOW = "allow"
-    PREFER = "prefer"
-    REQUIRE = "require"
-    VERIFY_CA = "verify-ca"
+    def designOrNotFound(self: "DatabaseStore", operation: dict) -> Design:
+        kit = self.kitOrNotFound(operation["kitUri"])
+        design = (
+            self.session.query(Design)
+            .filter(
+                Design.kitPk == kit.pk,
+                Design.name == operation["designName"],
+                Design.variant == operation["designVariant"],
+                Design.view == operation["designView"],
+            )
+            .one_or_none()
+        )
+        if design is None:
+            raise DesignNotFound(operation["designName"], operation["designVariant"], operation["designView"])
+        return design
+
+    def getPortFrames(self: "DatabaseStore", operation: dict) -> tuple[list[tuple[str, str, str]], numpy.ndarray]:
+        """📐 Get the ids (type name, type variant, port id) and the frames (point, direction) of all ports of a kit as an (N, 2, 3) array."""
+        kit = self.kitOrNotFound(operation["kitUri"])
+        rows = self.session.execute(
+            sqlalchemy.select(Type.name, Type.variant, Port.id_, Port.pointX, Port.pointY, Port.pointZ, Port.directionX, Port.directionY, Port.directionZ)
+            .select_from(Port)
+            .join(Type, Port.typePk == Type.pk)
+            .where(Type.kitPk == kit.pk)
+            .order_by(Port.pk)
+        ).all()
+        ids = [(row[0], row[1], row[2]) for row in rows]
+        frames = numpy.array([row[3:] for row in rows], dtype=numpy.float64).reshape(len(rows), 2, 3)
+        return ids, frames
+
+    def putPortFrames(self: "DatabaseStore", operation: dict, ids: list[tuple[str, str, str]], frames: numpy.ndarray) -> None:
+        """📐 Write the frames (point, direction) of ports of a kit from an (N, 2, 3) array in one batch."""
+        frames = numpy.asarray(frames, dtype=numpy.float64)
+        if frames.shape != (len(ids), 2, 3):
+            raise ArrayShapeNotValid((len(ids), 2, 3), frames.shape)
+        kit = self.kitOrNotFound(operation["kitUri"])
+        portPks = {
+            (name, variant, portId): pk
+            for pk, name, variant, portId in self.session.execute(
+                sqlalchemy.select(Port.pk, Type.name, Type.variant, Port.id_).select_from(Port).join(Type, Port.typePk == Type.pk).where(Type.kitPk == kit.pk)
+            ).all()
+        }
+        missingIds = [tuple(id) for id in ids if tuple(id) not in portPks]
+        if missingIds:
+            raise PortsNotFound(missingIds)
+        if len(ids) == 0:
+            return
+        values = frames.reshape(len(ids), 6).tolist()
+        try:
+            self.session.execute(
+                sqlalchemy.update(Port),
+                [
+                    {"pk": portPks[tuple(id)], "pointX": v[0], "pointY": v[1], "pointZ": v[2], "directionX": v[3], "directionY": v[4], "directionZ": v[5]}
+                    for id, v in zip(ids, values)
+                ],
+            )
+            self.session.commit()
+        except Exception as e:
+            self.session.rollback()
+            raise e
+        self.scenes.invalidatePorts([portPks[tuple(id)] for id in ids])
+
+    def getPiecePlanes(self: "DatabaseStore", operation: dict) -> tuple[list[str], numpy.ndarray, numpy.ndarray]:
+        """📐 Get the ids, the planes (origin, x-axis, y-axis) as an (N, 3, 3) array and the centers as an (N, 2) array of all pieces of a design. Missing planes and centers are NaN."""
+        design = self.designOrNotFound(operation)
+        rows = self.session.execute(
+            sqlalchemy.select(
+                Piece.id_, Plane.originX, Plane.originY, Plane.originZ, Plane.xAxisX, Plane.xAxisY, Plane.xAxisZ, Plane.yAxisX, Plane.yAxisY, Plane.yAxisZ, Piece.centerX, Piece.centerY
+            )
+            .select_from(Piece)
+            .outerjoin(Plane, Piece.planePk == Plane.pk)
+            .where(Piece.designPk == design.pk)
+            .order_by(Piece.pk)
+        ).all()
+        ids = [row[0] for row in rows]
+        values = numpy.array([row[1:] for row in rows], dtype=numpy.float64).reshape(len(rows), 11)
+        planes = numpy.ascontiguousarray(values[:, :9].reshape(len(rows), 3, 3))
+        centers = numpy.ascontiguousarray(values[:, 9:])
+        return ids, planes, centers
+
+    def putPiecePlanes(self: "DatabaseStore", operation: dict, ids: list[str], planes: numpy.ndarray, centers: typing.Optional[numpy.ndarray] = None) -> None:
+        """📐 Write the planes (origin, x-axis, y-axis) from an (N, 3, 3) array and optionally the centers from an (N, 2) array of pieces of a design in one batch. Rows that contain NaN are skipped."""
+        planes = numpy.asarray(planes, dtype=numpy.float64)
+        if planes.shape != (len(ids), 3, 3):
+            raise ArrayShapeNotValid((len(ids), 3, 3), planes.shape)
+        if centers is not None:
+            centers = numpy.asarray(centers, dtype=numpy.float64)
+            if centers.shape != (len(ids), 2):
+                raise ArrayShapeNotValid((len(ids), 2), centers.shape)
+        design = self.designOrNotFound(operation)
+        piecePks = {id_: (pk, planePk) for pk, id_, planePk in self.session.execute(sqlalchemy.select(Piece.pk, Piece.id_, Piece.planePk).where(Piece.designPk == design.pk)).all()}
+        missingIds = [id for id in ids if id not in piecePks]
+        if missingIds:
+            raise PiecesNotFound(missingIds)
+        planeValues = planes.reshape(len(ids), 9)
+        hasPlane = numpy.isfinite(planeValues).all(axis=1)
+        planeFields = ("originX", "originY", "originZ", "xAxisX", "xAxisY", "xAxisZ", "yAxisX", "yAxisY", "yAxisZ")
+        planeUpdates = []
+        planeInserts = []
+        for id, values, valid in zip(ids, planeValues.tolist(), hasPlane.tolist()):
+            if not valid:
+                continue
+            piecePk, planePk = piecePks[id]
+            if planePk is not None:
+                planeUpdates.append({"pk": planePk, **dict(zip(planeFields, values))})
+            else:
+                planeInserts.append((piecePk, dict(zip(planeFields, values))))
+        centerUpdates = []
+        if centers is not None:
+            hasCenter = numpy.isfinite(centers).all(axis=1)
+            for id, center, valid in zip(ids, centers.tolist(), hasCenter.tolist()):
+                if valid:
+                    centerUpdates.append({"pk": piecePks[id][0], "centerX": center[0], "centerY": center[1]})
+        try:
+            if planeUpdates:
+                self.session.execute(sqlalchemy.update(Plane), planeUpdates)
+            if planeInserts:
+                newPlanePks = self.session.scalars(sqlalchemy.insert(Plane).returning(Plane.pk, sort_by_parameter_order=True), [values for _, values in planeInserts]).all()
+                self.session.execute(sqlalchemy.update(Piece), [{"pk": piecePk, "planePk": planePk} for (piecePk, _), planePk in zip(planeInserts, newPlanePks)])
+            if centerUpdates:
+                self.session.execute(sqlalchemy.update(Piece), centerUpdates)
+            self.session.commit()
+        except Exception as e:
+            self.session.rollback()
+            raise e
+        if planeInserts:
+            self.scenes.drop(design.pk)
+        else:
+            self.scenes.invalidatePlanes([update["pk"] for update in planeUpdates])
+
+    def getScene(self: "DatabaseStore", operation: dict) -> SceneOutput:
+        """🎬 Place all pieces of a design."""
+        return self.scenes.get(self.designOrNotFound(operation)).dump()
+
+    def getFlatScene(self: "DatabaseStore", operation: dict) -> FlatSceneOutput:
+        """🪆 Place all pieces of a design and of the designs inside it."""
+        return self.scenes.get(self.designOrNotFound(operation)).dumpFlat()
+
+    def getClashes(self: "DatabaseStore", operation: dict) -> ClashesOutput:
+        """💥 Find the pieces of a design whose bounds overlap."""
+        scene = self.scenes.get(self.designOrNotFound(operation))
+        return ClashesOutput(clashes=[ClashOutput(piece=list(piece), otherPiece=list(otherPiece)) for piece, otherPiece in scene.clashes()])
+
+    def getRepresentationUrls(self: "DatabaseStore", operation: dict, tags: list[str]) -> RepresentationUrlsOutput:
+        """🖼️ Get the url of the best matching representation of every type in a design."""
+        design = self.designOrNotFound(operation)
+        urls = [(type, self.representations.get(type, tags)) for type in designTypes(design)]
+        return RepresentationUrlsOutput(
+            representations=[RepresentationUrlOutput(type=TypeId(name=type.name, variant=type.variant), url=url) for type, url in urls if url is not None]
+        )
+
+    def getCompatiblePorts(self: "DatabaseStore", operation: dict, portId: str) -> CompatiblePortsOutput:
+        """🧲 Get all ports of a kit that can connect to a port of a type."""
+        if operation["kind"] != "type":
+            raise FeatureNotYetSupported()
+        kit = self.kitOrNotFound(operation["kitUri"])
+        index = self.portCompatibilities.get(kit)
+        typeId = (operation["typeName"], operation["typeVariant"])
+        if typeId not in index.types:
+            raise TypeNotFound(TypeId(name=typeId[0], variant=typeId[1]))
+        key = (*typeId, portId)
+        if key not in index.families:
+            raise PortNotFound(TypeId(name=typeId[0], variant=typeId[1]), PortId(id_=portId))
+        return CompatiblePortsOutput(
+            ports=[CompatiblePortOutput(type=TypeId(name=name, variant=variant), port=PortId(id_=id_)) for name, variant, id_ in index.compatibles(key)]
+        )
+
+    def getNearestPieces(self: "DatabaseStore", operation: dict, point: Point, count: int = 1) -> SpatialQueryOutput:
+        """🎯 Get the placed pieces of a design that are the closest to a point."""
+        scene = self.scenes.get(self.designOrNotFound(operation))
+        return SpatialQueryOutput(pieces=[PieceId(id_=id_) for id_ in scene.nearest(point, count)])
+
+    def getPiecesInRadius(self: "DatabaseStore", operation: dict, point: Point, radius: float) -> SpatialQueryOutput:
+        """⭕ Get the placed pieces of a design that are within a radius around a point."""
+        scene = self.scenes.get(self.designOrNotFound(operation))
+        return SpatialQueryOutput(pieces=[PieceId(id_=id_) for id_ in scene.radius(point, radius)])
+
+    def getPiecesInBox(self: "DatabaseStore", operation: dict, minimum: Point, maximum: Point) -> SpatialQueryOutput:
+        """📦 Get the placed pieces of a design that overlap a box."""
+        scene = self.scenes.get(self.designOrNotFound(operation))
+        return SpatialQueryOutput(pieces=[PieceId(id_=id_) for id_ in scene.box(minimum, maximum)])
+
+    def putStream(self: "DatabaseStore", operation: dict) -> "KitStream":
+        """🌊 Start to put a kit from a streamed body."""
+        if operation["kind"] != "kit":
+            raise FeatureNotYetSupported()
+        return KitStream(self, operation["kitUri"])
+
+
+class JsonTokenizer:
+    """🔣 Find the structural tokens of a JSON document chunk by chunk while skipping strings and remembering the last key."""
+
+    TOKEN = re.compile(rb'[\\"\[\]{},:]')
+
+    def __init__(self) -> None:
+        self.inString = False
+        self.isKey = False
+        """🔑 If the current string is a key. The consumer decides this when it gets the opening quote."""
+        self.escaped = False
+        self.key = b""
+        self.lastKey = b""
+
+    def tokens(self, chunk: bytes) -> typing.Iterator[tuple[int, int]]:
+        """🔣 The positions and bytes of the quotes that open strings and of the brackets, braces, colons and commas outside of strings."""
+        skipUntil = 0
+        if self.escaped and chunk:
+            self.escaped = False
+            skipUntil = 1
+        keyStart = 0
+        for match in self.TOKEN.finditer(chunk):
+            i = match.start()
+            if i < skipUntil:
+                continue
+            token = chunk[i]
+            if self.inString:
+                if token == 0x5C:  # \
+                    skipUntil = i + 2
+                    if skipUntil > len(chunk):
+                        self.escaped = True
+                elif token == 0x22:  # "
+                    self.inString = False
+                    if self.isKey:
+                        self.lastKey = (self.key + chunk[keyStart:i])[:NAME_LENGTH_LIMIT]
+                continue
+            if token == 0x22:  # "
+                self.inString = True
+                self.key = b""
+                keyStart = i + 1
+            yield i, token
+        if self.inString and self.isKey:
+            self.key = (self.key + chunk[keyStart:])[:NAME_LENGTH_LIMIT]
+
+
+class JsonArrayStreamSplitter(JsonTokenizer):
+    """✂️ Split a JSON object chunk by chunk into the items of some of its top-level arrays and the rest of the object."""
+
+    SEPARATORS = b" \t\r\n,"
+
+    def __init__(self, keys: tuple[str, ...]) -> None:
+        super().__init__()
+        self.keys = {key.encode(): key for key in keys}
+        self.depth = 0
+        self.expectsKey = False
+        self.arrayKey: typing.Optional[str] = None
+        """🔑 The key of the array that is currently split."""
+        self.inItem = False
+        self.item = bytearray()
+        self.rest = bytearray()
+        """🧾 The object without the items of the split arrays."""
+        self.closedKeys: set[str] = set()
+
+    def separate(self, segment: bytes) -> None:
+        if segment.strip(self.SEPARATORS):
+            raise StreamNotValid(f"The items of {self.arrayKey} have to be objects.")
+
+    def feed(self, chunk: bytes) -> list[tuple[str, bytes]]:
+        """🍽️ Split the next chunk of the document and return the items which are complete."""
+        items = []
+        start = 0  # The first byte of the chunk that is not yet copied to the rest or the item.
+        for i, token in self.tokens(chunk):
+            match token:
+                case 0x22:  # "
+                    self.isKey = self.depth == 1 and self.expectsKey
+                    if self.arrayKey is not None and self.depth == 2:
+                        raise StreamNotValid(f"The items of {self.arrayKey} have to be objects.")
+                case 0x7B | 0x5B:  # { [
+                    if self.depth == 1 and token == 0x5B and not self.expectsKey and self.lastKey in self.keys:
+                        self.rest += chunk[start : i + 1]
+                        self.arrayKey = self.keys[self.lastKey]
+                        start = i + 1
+                    elif self.arrayKey is not None and self.depth == 2:
+                        self.separate(chunk[start:i])
+                        self.inItem = True
+                        start = i
+                    self.depth += 1
+                    if self.depth == 1:
+                        self.expectsKey = token == 0x7B
+                case 0x5D | 0x7D:  # ] }
+                    self.depth -= 1
+                    if self.arrayKey is not None and self.depth == 2:
+                        self.item += chunk[start : i + 1]
+                        items.append((self.arrayKey, bytes(self.item)))
+                        self.item.clear()
+                        self.inItem = False
+                        start = i + 1
+                    elif self.arrayKey is not None and self.depth == 1:
+                        self.separate(chunk[start:i])
+                        self.closedKeys.add(self.arrayKey)
+                        self.arrayKey = None
+                        start = i
+                case 0x3A:  # :
+                    if self.depth == 1:
+                        self.expectsKey = False
+                case 0x2C:  # ,
+                    if self.depth == 1:
+                        self.expectsKey = True
+        if self.arrayKey is None:
+            self.rest += chunk[start:]
+        elif self.inItem:
+            self.item += chunk[start:]
+        else:
+            self.separate(chunk[start:])
+        return items
+
+    def close(self) -> dict:
+        """🔚 Check that the document is complete and return the rest of the object."""
+        if self.depth != 0 or self.inString:
+            raise StreamNotValid("The body ended before the document was complete.")
+        try:
+            rest = json.loads(self.rest)
+        except json.JSONDecodeError as e:
+            raise StreamNotValid(str(e))
+        if not isinstance(rest, dict):
+            raise StreamNotValid("The body has to be an object.")
+        return rest
+
+
+class KitStream:
+    """🌊 Put a kit from a body that arrives chunk by chunk. Types and designs are validated and staged one by one as soon as they are complete and flushed in batches. Only the types stay in memory because designs refer to them. Designs that arrive before all types are kept as raw bytes until the types are complete.
+    Designs whose pieces use designs that are not staged yet wait until these are staged and the used designs are loaded again from the session."""
+
+    def __init__(self, store: "DatabaseStore", kitUri: str, batchSize: int = STREAM_BATCH_SIZE) -> None:
+        store.initialize()
+        if store.session.query(Kit).filter(Kit.uri == kitUri).one_or_none() is not None:
+            raise KitAlreadyExists(kitUri)
+        self.store = store
+        self.batchSize = batchSize
+        self.splitter = JsonArrayStreamSplitter(("types", "designs"))
+        # The props are only known at the end. The name is a placeholder until then.
+        self.kit = Kit(uri=kitUri, name="")
+        store.session.add(self.kit)
+        self.types: list[Type] = []
+        self.pendingDesigns: list[bytes] = []
+        self.designIds: set[tuple[str, str, str]] = set()
+        """🆔 The name, variant and view of all staged designs."""
+        self.nestedDesigns: list[dict] = []
+        """🪆 The designs that wait for designs that their pieces use."""
+        self.batch: list[Design] = []
+        self.staged = 0
+
+    def stage(self, key: str, item: bytes) -> None:
+        try:
+            match key:
+                case "types":
+                    type = Type.parse(TypeInput.model_validate_json(item).model_dump())
+                    type.kit = self.kit
+                    self.types.append(type)
+                    self.count()
+                case "designs":
+                    self.stageDesign(DesignInput.model_validate_json(item).model_dump())
+        except pydantic.ValidationError as e:
+            raise StreamNotValid(str(e))
+
+    def count(self) -> None:
+        self.staged += 1
+        if self.staged % self.batchSize == 0:
+            self.flush()
+
+    def stageDesign(self, input: dict) -> None:
+        if not usedDesignIds(input) <= self.designIds:
+            self.nestedDesigns.append(input)
+            return
+        design = Design.parse(input, self.types, self.usedDesigns(input))
+        design.kit = self.kit
+        self.batch.append(design)
+        self.designIds.add((design.name, design.variant, design.view))
+        self.count()
+        ready = [d for d in self.nestedDesigns if usedDesignIds(d) <= self.designIds]
+        if ready:
+            self.nestedDesigns = [d for d in self.nestedDesigns if not usedDesignIds(d) <= self.designIds]
+            for nestedDesign in ready:
+                self.stageDesign(nestedDesign)
+
+    def usedDesigns(self, input: dict) -> dict[str, dict[str, dict[str, Design]]]:
+        """🪆 The staged designs that the pieces of a design use. They are queried because flushed designs are released."""
+        designsById: dict[str, dict[str, dict[str, Design]]] = {}
+        for name, variant, view in usedDesignIds(input):
+            design = self.store.session.query(Design).filter(Design.kit == self.kit, Design.name == name, Design.variant == variant, Design.view == view).one()
+            designsById.setdefault(name, {}).setdefault(variant, {})[view] = design
+        return designsById
+
+    def checkNestedDesigns(self) -> None:
+        """🪆 Fail for the designs that still wait because a design that they use is missing or because they use each other."""
+        if not self.nestedDesigns:
+            return
+        waitingIds = {designIdOf(d) for d in self.nestedDesigns}
+        missingIds = set().union(*(usedDesignIds(d) for d in self.nestedDesigns)) - self.designIds - waitingIds
+        if missingIds:
+            raise DesignNotFound(*min(missingIds))
+        designNestingOrder(self.nestedDesigns)
+        raise CodeUnreachable()
+
+    def flush(self) -> None:
+        """🚽 Write the staged entities and release the designs from the back references of the kit, the types and the ports."""
+        session = self.store.session
+        session.flush()
+        if not self.batch:
+            return
+        session.expire(self.kit, ["designs"])
+        for design in self.batch:
+            for piece in design.pieces:
+                if piece.type is not None:
+                    session.expire(piece.type, ["pieces"])
+            for connection in design.connections:
+                session.expire(connection.connectedPort, ["connecteds"])
+                session.expire(connection.connectingPort, ["connectings"])
+        self.batch = []
+
+    def feed(self, chunk: bytes) -> None:
+        """🍽️ Stage all entities that are completed by the next chunk of the body."""
+        try:
+            for key, item in self.splitter.feed(chunk):
+                if key == "designs" and "types" not in self.splitter.closedKeys:
+                    self.pendingDesigns.append(item)
+                    continue
+                self.stage(key, item)
+            if self.pendingDesigns and "types" in self.splitter.closedKeys:
+                self.stagePendingDesigns()
+        except Exception as e:
+            self.abort()
+            raise e
+
+    def stagePendingDesigns(self) -> None:
+        while self.pendingDesigns:
+            self.stage("designs", self.pendingDesigns.pop(0))
+
+    def close(self) -> Kit:
+        """🔚 Stage the remaining entities, set the props of the kit and commit everything."""
+        try:
+            self.stagePendingDesigns()
+            self.checkNestedDesigns()
+            rest = self.splitter.close()
+            try:
+                input = KitInput.model_validate(rest)
+            except pydantic.ValidationError as e:
+                raise StreamNotValid(str(e))
+            dump = input.model_dump()
+            props = KitProps.model_validate({**dump, "uri": self.kit.uri})
+            for key, value in props.model_dump().items():
+                setattr(self.kit, key, value)
+            self.kit.concepts = dump["concepts"]
+            self.flush()
+            self.store.session.commit()
+            return self.kit
+        except Exception as e:
+            self.abort()
+            raise e
+
+    def abort(self) -> None:
+        """🛑 Discard everything that was staged."""
+        self.store.session.rollback()
+        self.pendingDesigns = []
+        self.nestedDesigns = []
+        self.batch = []
+
+
+class SSLMode(enum.Enum):
+    """🔒 The security level of the session"""
+
+    DISABLE = "disable"
+    ALLOW = "allow"
+    PREFER = "prefer"
+    REQUIRE = "require"
+    VERIFY_CA = "verify-ca"
     VERIFY_FULL = "verify-full"
 
 
@@ -3644,7 +5666,8 @@ class PostgresStore(DatabaseStore):
 # An other option would be to eager load the relationships.
 @functools.lru_cache
 def StoreFactory(uri: str) -> Store:
-    """🏭 Get a store from the uri. This store doesn't need to exist yet as long as it can be created."""
+    """🏭 Get a store from the uri. This store doesn't need to exist yet as long as it can be created.
+    There is one store per uri for the whole process, so its session and its scene, port compatibility and representation caches are shared by all requests."""
     if os.path.isabs(uri):
         return SqliteStore.fromUri(uri)
     if uri.startswith("http"):
@@ -3682,6 +5705,84 @@ def delete(code: str) -> typing.Any:
     return store.delete(operation)
 
 
+def getPortFrames(code: str) -> tuple[list[tuple[str, str, str]], numpy.ndarray]:
+    """📐 Get the frames of all ports of a kit as an (N, 2, 3) array."""
+    store, operation = storeAndOperationFromCode(code)
+    return store.getPortFrames(operation)
+
+
+def putPortFrames(code: str, ids: list[tuple[str, str, str]], frames: numpy.ndarray) -> None:
+    """📐 Write the frames of ports of a kit from an (N, 2, 3) array."""
+    store, operation = storeAndOperationFromCode(code)
+    return store.putPortFrames(operation, ids, frames)
+
+
+def getPiecePlanes(code: str) -> tuple[list[str], numpy.ndarray, numpy.ndarray]:
+    """📐 Get the planes of all pieces of a design as an (N, 3, 3) array and their centers as an (N, 2) array."""
+    store, operation = storeAndOperationFromCode(code)
+    return store.getPiecePlanes(operation)
+
+
+def putPiecePlanes(code: str, ids: list[str], planes: numpy.ndarray, centers: typing.Optional[numpy.ndarray] = None) -> None:
+    """📐 Write the planes and optionally the centers of pieces of a design."""
+    store, operation = storeAndOperationFromCode(code)
+    return store.putPiecePlanes(operation, ids, planes, centers)
+
+
+def getScene(code: str) -> SceneOutput:
+    """🎬 Get the planes of all pieces of a design."""
+    store, operation = storeAndOperationFromCode(code)
+    return store.getScene(operation)
+
+
+def getFlatScene(code: str) -> FlatSceneOutput:
+    """🪆 Get the planes of all pieces of a design and of the designs inside it."""
+    store, operation = storeAndOperationFromCode(code)
+    return store.getFlatScene(operation)
+
+
+def getClashes(code: str) -> ClashesOutput:
+    """💥 Get the pieces of a design whose bounds overlap."""
+    store, operation = storeAndOperationFromCode(code)
+    return store.getClashes(operation)
+
+
+def getRepresentationUrls(code: str, tags: list[str]) -> RepresentationUrlsOutput:
+    """🖼️ Get the url of the best matching representation of every type in a design."""
+    store, operation = storeAndOperationFromCode(code)
+    return store.getRepresentationUrls(operation, tags)
+
+
+def getCompatiblePorts(code: str, portId: str) -> CompatiblePortsOutput:
+    """🧲 Get all ports of a kit that can connect to a port of a type."""
+    store, operation = storeAndOperationFromCode(code)
+    return store.getCompatiblePorts(operation, portId)
+
+
+def getNearestPieces(code: str, point: Point, count: int = 1) -> SpatialQueryOutput:
+    """🎯 Get the placed pieces of a design that are the closest to a point."""
+    store, operation = storeAndOperationFromCode(code)
+    return store.getNearestPieces(operation, point, count)
+
+
+def getPiecesInRadius(code: str, point: Point, radius: float) -> SpatialQueryOutput:
+    """⭕ Get the placed pieces of a design that are within a radius around a point."""
+    store, operation = storeAndOperationFromCode(code)
+    return store.getPiecesInRadius(operation, point, radius)
+
+
+def getPiecesInBox(code: str, minimum: Point, maximum: Point) -> SpatialQueryOutput:
+    """📦 Get the placed pieces of a design that overlap a box."""
+    store, operation = storeAndOperationFromCode(code)
+    return store.getPiecesInBox(operation, minimum, maximum)
+
+
+def putStream(code: str) -> KitStream:
+    """🌊 Start to put a kit from a streamed body."""
+    store, operation = storeAndOperationFromCode(code)
+    return store.putStream(operation)
+
+
 # endregion Store
 
 # region Assistant
@@ -3708,122 +5809,641 @@ def encodeType(type: TypeContext):
     return typeClone
 
 
+def decodePiece(piece: dict) -> dict:
+    return {
+        "id_": piece["id"] if piece["id"] != "DEFAULT" else "",
+        "type": {
+            "name": piece["typeName"],
+            "variant": (piece["typeVariant"] if piece["typeVariant"] != "DEFAULT" else ""),
+        },
+    }
+
+
+def decodeConnection(connection: dict) -> dict:
+    return {
+        "connected": {
+            "piece": {
+                "id_": (connection["connectedPieceId"] if connection["connectedPieceId"] != "DEFAULT" else ""),
+            },
+            "port": {
+                "id_": (connection["connectedPieceTypePortId"] if connection["connectedPieceTypePortId"] != "DEFAULT" else ""),
+            },
+        },
+        "connecting": {
+            "piece": {
+                "id_": (connection["connectingPieceId"] if connection["connectingPieceId"] != "DEFAULT" else ""),
+            },
+            "port": {
+                "id_": (connection["connectingPieceTypePortId"] if connection["connectingPieceTypePortId"] != "DEFAULT" else ""),
+            },
+        },
+        "gap": connection["gap"],
+        "shift": connection["shift"],
+        "rise": connection["rise"],
+        "rotation": normalizeAngle(connection["rotation"]),
+        "turn": normalizeAngle(connection["turn"]),
+        "tilt": normalizeAngle(connection["tilt"]),
+        "x": connection["x"],
+        "y": connection["y"],
+    }
+
+
 def decodeDesign(design: dict):
     decodedDesign = {
-        "pieces": [
-            {
-                "id_": p["id"] if p["id"] != "DEFAULT" else "",
-                "type": {
-                    "name": p["typeName"],
-                    "variant": (p["typeVariant"] if p["typeVariant"] != "DEFAULT" else ""),
-                },
-            }
-            for p in design["pieces"]
-        ],
-        "connections": [
-            {
-                "connected": {
-                    "piece": {
-                        "id_": (c["connectedPieceId"] if c["connectedPieceId"] != "DEFAULT" else ""),
-                    },
-                    "port": {
-                        "id_": (c["connectedPieceTypePortId"] if c["connectedPieceTypePortId"] != "DEFAULT" else ""),
-                    },
-                },
-                "connecting": {
-                    "piece": {
-                        "id_": (c["connectingPieceId"] if c["connectingPieceId"] != "DEFAULT" else ""),
-                    },
-                    "port": {
-                        "id_": (c["connectingPieceTypePortId"] if c["connectingPieceTypePortId"] != "DEFAULT" else ""),
-                    },
-                },
-                "gap": c["gap"],
-                "shift": c["shift"],
-                "rise": c["rise"],
-                "rotation": normalizeAngle(c["rotation"]),
-                "turn": normalizeAngle(c["turn"]),
-                "tilt": normalizeAngle(c["tilt"]),
-                "x": c["x"],
-                "y": c["y"],
-            }
-            for c in design["connections"]
-        ],
+        "pieces": [decodePiece(p) for p in design["pieces"]],
+        "connections": [decodeConnection(c) for c in design["connections"]],
     }
     return DesignPrediction.parse(decodedDesign)
 
 
+class FuzzyIndex:
+    """🔎 The closest of a fixed set of strings to a query.
+    Candidates share at least one padded trigram with the query. The ones with the most similar trigrams are compared with `difflib` and the most similar one above the cutoff wins."""
+
+    def __init__(self, keys: typing.Iterable[str], size: int = 3) -> None:
+        self.keys: list[str] = list(dict.fromkeys(keys))
+        self.size = size
+        self.indices: dict[str, int] = {key: i for i, key in enumerate(self.keys)}
+        self.postings: dict[str, list[int]] = {}
+        """📇 The keys that contain a trigram."""
+        self.gramCounts: list[int] = []
+        for i, key in enumerate(self.keys):
+            grams = self.grams(key)
+            self.gramCounts.append(len(grams))
+            for gram in grams:
+                self.postings.setdefault(gram, []).append(i)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.indices
+
+    def grams(self, value: str) -> set[str]:
+        padding = " " * (self.size - 1)
+        padded = padding + value.lower() + padding
+        return {padded[i : i + self.size] for i in range(len(padded) - self.size + 1)}
+
+    def closest(self, query: str, cutoff: float = FUZZY_CUTOFF, candidates: int = FUZZY_CANDIDATES) -> typing.Optional[str]:
+        """🎯 The most similar key or `None` if no key is similar enough."""
+        if query in self.indices:
+            return query
+        grams = self.grams(query)
+        shared = collections.Counter(i for gram in grams for i in self.postings.get(gram, ()))
+        ranked = heapq.nlargest(candidates, shared, key=lambda i: (shared[i] / (len(grams) + self.gramCounts[i]), -i))
+        matcher = difflib.SequenceMatcher()
+        matcher.set_seq2(query)
+        best, bestRatio = None, cutoff
+        for i in ranked:
+            matcher.set_seq1(self.keys[i])
+            if matcher.real_quick_ratio() < bestRatio or matcher.quick_ratio() < bestRatio:
+                continue
+            ratio = matcher.ratio()
+            if ratio > bestRatio or (best is None and ratio == bestRatio):
+                best, bestRatio = self.keys[i], ratio
+        return best
+
+
+class HealingIndex:
+    """🗂️ Fuzzy indices over the names, the variants and the port ids of a set of types."""
+
+    def __init__(self, types: typing.Iterable[tuple[str, str, tuple[str, ...]]]) -> None:
+        variants: dict[str, list[str]] = {}
+        self.ports: dict[tuple[str, str], FuzzyIndex] = {}
+        for name, variant, portIds in types:
+            variants.setdefault(name, []).append(variant)
+            self.ports[(name, variant)] = FuzzyIndex(portIds)
+        self.names = FuzzyIndex(variants)
+        self.variants = {name: FuzzyIndex(v) for name, v in variants.items()}
+
+
+@functools.lru_cache(maxsize=HEALING_INDICES_MAX)
+def cachedHealingIndex(typeIds: tuple[tuple[str, str, tuple[str, ...]], ...]) -> HealingIndex:
+    return HealingIndex(typeIds)
+
+
+def healingIndex(types: list[TypeContext]) -> HealingIndex:
+    """🗂️ The healing index of a set of types. It is built once and reused as long as the names, variants and port ids stay the same."""
+    return cachedHealingIndex(tuple((t.name, t.variant, tuple(p.id_ for p in t.ports)) for t in types))
+
+
+class TypeEmbeddingIndex:
+    """🧭 Local embeddings of the names, variants and descriptions of types in a matrix.
+    Words and character trigrams of words are hashed into a fixed number of dimensions and weighted by their inverse document frequency over the types.
+    A type is found by the largest cosine similarity above a cutoff."""
+
+    def __init__(self, types: typing.Iterable[tuple[str, str, str]], dimensions: int = EMBEDDING_DIMENSIONS) -> None:
+        types = list(types)
+        self.types = [(name, variant) for name, variant, _ in types]
+        self.dimensions = dimensions
+        documents = [f"{name} {name} {variant} {description}" for name, variant, description in types]
+        frequencies = self.frequencies(documents)
+        documentFrequencies = numpy.count_nonzero(frequencies, axis=0)
+        self.idf = (numpy.log((1 + len(documents)) / (1 + documentFrequencies)) + 1).astype(numpy.float32)
+        self.matrix = self.normalize(frequencies * self.idf)
+        """🧮 The normalized embedding of every type as a row."""
+
+    def features(self, text: str) -> list[str]:
+        features = []
+        for word in re.findall(r"[a-z0-9]+", text.lower()):
+            padded = f"<{word}>"
+            features.append(word)
+            features.extend(padded[i : i + 3] for i in range(len(padded) - 2))
+        return features
+
+    def frequencies(self, texts: list[str]) -> numpy.ndarray:
+        """🔢 The hashed feature counts of every text as a row."""
+        frequencies = numpy.zeros((len(texts), self.dimensions), dtype=numpy.float32)
+        for row, text in enumerate(texts):
+            columns = [zlib.crc32(feature.encode()) % self.dimensions for feature in self.features(text)]
+            numpy.add.at(frequencies[row], columns, 1.0)
+        return frequencies
+
+    @staticmethod
+    def normalize(vectors: numpy.ndarray) -> numpy.ndarray:
+        norms = numpy.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / numpy.where(norms == 0, 1, norms)
+
+    def embed(self, texts: list[str]) -> numpy.ndarray:
+        """🧭 The normalized embeddings of texts as rows."""
+        return self.normalize(self.frequencies(texts) * self.idf)
+
+    def nearest(self, texts: list[str], cutoff: float = EMBEDDING_CUTOFF) -> list[typing.Optional[tuple[str, str]]]:
+        """🎯 The name and variant of the most similar type for every text with a single matrix product or `None` if no type is similar enough."""
+        if not self.types:
+            return [None] * len(texts)
+        if not texts:
+            return []
+        similarities = self.embed(texts) @ self.matrix.T
+        indices = numpy.argmax(similarities, axis=1)
+        best = similarities[numpy.arange(len(texts)), indices]
+        return [self.types[i] if similarity >= cutoff else None for i, similarity in zip(indices.tolist(), best.tolist())]
+
+
+@functools.lru_cache(maxsize=HEALING_INDICES_MAX)
+def cachedTypeEmbeddingIndex(types: tuple[tuple[str, str, str], ...]) -> TypeEmbeddingIndex:
+    return TypeEmbeddingIndex(types)
+
+
+def typeEmbeddingIndex(types: list[TypeContext]) -> TypeEmbeddingIndex:
+    """🧭 The embedding index of a set of types. It is built once and reused as long as the names, variants and descriptions stay the same."""
+    return cachedTypeEmbeddingIndex(tuple((t.name, t.variant, t.description) for t in types))
+
+
 # TODO: Replace prototype healing with one that makes more for every single property.
-def healDesign(design: DesignPrediction, types: list[TypeContext]):
-    """🩺 Heal a design by replacing missing type variants with the first variant."""
+def healDesign(design: DesignPrediction, types: list[TypeContext], largestComponent: bool = False):
+    """🩺 Heal a design by replacing unknown types with the types of the closest embeddings and unknown variants, pieces and ports with the closest known ones.
+    Pieces without a similar enough type, connections of a piece to itself and pieces without connections are removed. Optionally only the largest group of connected pieces is kept."""
     designClone = design.model_copy(deep=True)
-    typeD = {}
-    portD = {}
+    index = healingIndex(types)
     pieceD = {}
-    for type in types:
-        if type.name not in typeD:
-            typeD[type.name] = {}
-            portD[type.name] = {}
-        typeD[type.name][type.variant] = type
-        if type.variant not in portD[type.name]:
-            portD[type.name][type.variant] = {}
-        for port in type.ports:
-            portD[type.name][type.variant][port.id_] = port
-    # TODO: Try closest embedding instead of smallest Levenshtein distance.
+    unknownPieces = [p for p in designClone.pieces if p.type and p.type.name not in index.names]
+    unmatchedPieces = set()
+    for piece, nearest in zip(unknownPieces, typeEmbeddingIndex(types).nearest([f"{p.type.name} {p.type.variant}" for p in unknownPieces])):
+        if nearest is None:
+            unmatchedPieces.add(id(piece))
+        else:
+            piece.type.name, piece.type.variant = nearest
+    # remove pieces without a similar enough type and remember their ids to drop their connections
+    removedPieceIds = {p.id_ for p in designClone.pieces if id(p) in unmatchedPieces}
+    designClone.pieces = [p for p in designClone.pieces if id(p) not in unmatchedPieces]
     for piece in designClone.pieces:
         pieceD[piece.id_] = piece
-        if piece.type and piece.type.name not in typeD:
-            # TODO: Remove piece if type name is not found instead of taking the first.
-            try:
-                piece.type.name = difflib.get_close_matches(piece.type.name, typeD.keys(), n=1)[0]
-            except Error:  # TODO: Make more specific
-                piece.type.name = list(typeD.keys())[0]
-        if piece.type and piece.type.name and piece.type.variant not in typeD[piece.type.name]:
-            try:
-                piece.type.variant = difflib.get_close_matches(piece.type.variant, typeD[piece.type.name].keys(), n=1)[0]
-            except Error:  # TODO: Make more specific
-                piece.type.variant = list(typeD[piece.type.name].keys())[0]
+        if piece.type and piece.type.variant not in index.variants[piece.type.name]:
+            variants = index.variants[piece.type.name]
+            piece.type.variant = variants.closest(piece.type.variant) or next(iter(variants.keys), "")
+    pieceIds = FuzzyIndex(pieceD)
+    removedPieceIds -= pieceD.keys()
 
     validConnections = []
     for connection in designClone.connections:
-        if connection.connected.piece.id_ not in pieceD:
-            try:
-                connection.connected.piece.id_ = difflib.get_close_matches(connection.connected.piece.id_, pieceD.keys(), n=1)[0]
-            except Error:
-                continue
-        if connection.connecting.piece.id_ not in pieceD:
-            try:
-                connection.connecting.piece.id_ = difflib.get_close_matches(connection.connecting.piece.id_, pieceD.keys(), n=1)[0]
-            except Error:
-                continue
-        connectedType = typeD[pieceD[connection.connected.piece.id_].type.name][pieceD[connection.connected.piece.id_].type.variant]
-        connectingType = typeD[pieceD[connection.connecting.piece.id_].type.name][pieceD[connection.connecting.piece.id_].type.variant]
-
-        if connection.connected.port.id_ not in portD[connectedType.name][connectedType.variant]:
-            connection.connected.port.id_ = difflib.get_close_matches(
-                connection.connected.port.id_,
-                portD[connectedType.name][connectedType.variant].keys(),
-                n=1,
-            )[0]
-        if connection.connecting.port.id_ not in portD[connectingType.name][connectingType.variant]:
-            connection.connecting.port.id_ = difflib.get_close_matches(
-                connection.connecting.port.id_,
-                portD[connectingType.name][connectingType.variant].keys(),
-                n=1,
-            )[0]
+        if connection.connected.piece.id_ in removedPieceIds or connection.connecting.piece.id_ in removedPieceIds:
+            continue
+        connectedPieceId = pieceIds.closest(connection.connected.piece.id_)
+        connectingPieceId = pieceIds.closest(connection.connecting.piece.id_)
+        if connectedPieceId is None or connectingPieceId is None:
+            continue
+        connectedType = pieceD[connectedPieceId].type
+        connectingType = pieceD[connectingPieceId].type
+        connectedPortId = index.ports[(connectedType.name, connectedType.variant)].closest(connection.connected.port.id_)
+        connectingPortId = index.ports[(connectingType.name, connectingType.variant)].closest(connection.connecting.port.id_)
+        if connectedPortId is None or connectingPortId is None:
+            continue
+        connection.connected.piece.id_ = connectedPieceId
+        connection.connecting.piece.id_ = connectingPieceId
+        connection.connected.port.id_ = connectedPortId
+        connection.connecting.port.id_ = connectingPortId
         validConnections.append(connection)
-    designClone.connections = validConnections
-    # remove invalid connections
-    designClone.connections = [c for c in designClone.connections if c.connected.piece.id_ != c.connecting]
+    # remove connections of a piece to itself
+    designClone.connections = [c for c in validConnections if c.connected.piece.id_ != c.connecting.piece.id_]
+    indices = {id_: i for i, id_ in enumerate(pieceD)}
+    edges = [(indices[c.connected.piece.id_], indices[c.connecting.piece.id_]) for c in designClone.connections]
+    components = UnionFind(len(indices))
+    isConnected = [False] * len(indices)
+    for i, j in edges:
+        components.union(i, j)
+        isConnected[i] = isConnected[j] = True
+    if largestComponent and edges:
+        largest = max((i for i in range(len(indices)) if isConnected[i]), key=lambda i: components.sizes[components.find(i)])
+        root = components.find(largest)
+        isConnected = [isConnected[i] and components.find(i) == root for i in range(len(indices))]
+        designClone.connections = [c for c, (i, _) in zip(designClone.connections, edges) if isConnected[i]]
     # remove pieces with no connections
-    designClone.pieces = [p for p in designClone.pieces if any(c for c in designClone.connections if c.connected.piece.id_ == p.id_ or c.connecting.piece.id_ == p.id_)]
+    designClone.pieces = [p for p in designClone.pieces if isConnected[indices[p.id_]]]
     return designClone
 
 
-try:
-    openaiClient = openai.Client()
-except openai.OpenAIError:
-    openaiClient = None
+class PredictionProvider(abc.ABC):
+    """🤖 A language model that completes the prompts of the assistant."""
+
+    def __init__(self, model: str) -> None:
+        self.model = model
+
+    @abc.abstractmethod
+    async def complete(self, arguments: dict) -> openai.types.chat.ChatCompletion:
+        """💬 Complete the messages of a chat completion request."""
+        pass
+
+    @abc.abstractmethod
+    def stream(self, arguments: dict) -> typing.AsyncIterator[openai.types.chat.ChatCompletionChunk]:
+        """🌊 Complete the messages of a chat completion request chunk by chunk."""
+        pass
+
+    async def close(self) -> None:
+        """🔌 Close the connections that were opened in the running event loop."""
+        pass
+
+
+class OpenAIProvider(PredictionProvider):
+    """☁️ A model that is served by OpenAI or by any other server with an OpenAI compatible API."""
+
+    def __init__(self, model: str = PREDICTION_MODEL, baseUrl: typing.Optional[str] = None, apiKey: typing.Optional[str] = None) -> None:
+        super().__init__(model)
+        self.baseUrl = baseUrl
+        self.apiKey = apiKey
+        self.unboundClient: typing.Optional[openai.AsyncClient] = openai.AsyncClient(base_url=baseUrl, api_key=apiKey, max_retries=0)
+        """The client that is created right away to fail early without an api key and that is bound to the first event loop that uses it."""
+        self.clients: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, openai.AsyncClient] = weakref.WeakKeyDictionary()
+
+    @property
+    def client(self) -> openai.AsyncClient:
+        """🔌 The client of the running event loop. Every event loop needs its own client because connections are bound to the loop that opened them."""
+        loop = asyncio.get_running_loop()
+        client = self.clients.get(loop)
+        if client is None:
+            if self.unboundClient is not None:
+                client, self.unboundClient = self.unboundClient, None
+            else:
+                client = openai.AsyncClient(base_url=self.baseUrl, api_key=self.apiKey, max_retries=0)
+            self.clients[loop] = client
+        return client
+
+    async def close(self) -> None:
+        client = self.clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.close()
+
+    async def complete(self, arguments: dict) -> openai.types.chat.ChatCompletion:
+        return await self.client.chat.completions.create(**arguments, model=self.model)
+
+    async def stream(self, arguments: dict) -> typing.AsyncIterator[openai.types.chat.ChatCompletionChunk]:
+        stream = await self.client.chat.completions.create(**arguments, model=self.model, stream=True, stream_options={"include_usage": True})
+        async with stream:
+            async for chunk in stream:
+                yield chunk
+
+
+class LocalProvider(OpenAIProvider):
+    """🏠 A model that is served by a local server with an OpenAI compatible API like llama.cpp, vLLM or Ollama."""
+
+    def __init__(self, model: str = PREDICTION_MODEL, baseUrl: str = PREDICTION_LOCAL_URL) -> None:
+        super().__init__(model, baseUrl, apiKey="local")
+
+
+def completionRecordingKey(arguments: dict) -> str:
+    """🔑 A hash of the messages of a chat completion request."""
+    return hashlib.sha256(json.dumps(arguments["messages"], sort_keys=True).encode()).hexdigest()
+
+
+class RecordingProvider(PredictionProvider):
+    """⏺️ Record every completion of another provider to a JSON lines file that a `ReplayProvider` can replay."""
+
+    def __init__(self, provider: PredictionProvider, path: str) -> None:
+        super().__init__(provider.model)
+        self.provider = provider
+        self.path = pathlib.Path(path)
+
+    def record(self, arguments: dict, completion: openai.types.chat.ChatCompletion) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a", encoding="utf-8") as file:
+            file.write(json.dumps({"key": completionRecordingKey(arguments), "completion": completion.model_dump(mode="json")}) + "\n")
+
+    async def complete(self, arguments: dict) -> openai.types.chat.ChatCompletion:
+        completion = await self.provider.complete(arguments)
+        self.record(arguments, completion)
+        return completion
+
+    async def stream(self, arguments: dict) -> typing.AsyncIterator[openai.types.chat.ChatCompletionChunk]:
+        """🌊 Pass the chunks of the other provider through and record them as one completion when the stream finished."""
+        content = io.StringIO()
+        finishReason = None
+        usage = None
+        last = None
+        async for chunk in self.provider.stream(arguments):
+            last = chunk
+            usage = getattr(chunk, "usage", None) or usage
+            if chunk.choices:
+                choice = chunk.choices[0]
+                content.write(choice.delta.content or "")
+                finishReason = choice.finish_reason or finishReason
+            yield chunk
+        if last is None or finishReason is None:
+            return
+        message = {"role": "assistant", "content": content.getvalue()}
+        completion = {"id": last.id, "object": "chat.completion", "created": last.created, "model": last.model, "choices": [{"index": 0, "message": message, "finish_reason": finishReason}]}
+        if usage is not None:
+            completion["usage"] = usage.model_dump(mode="json")
+        self.record(arguments, openai.types.chat.ChatCompletion.model_validate(completion))
+
+    async def close(self) -> None:
+        await self.provider.close()
+
+
+class ReplayProvider(PredictionProvider):
+    """📼 Replay recorded completions without any network access.
+    A request gets the completion that was recorded for the same messages. Any other request gets the recordings one after the other."""
+
+    def __init__(self, path: str, model: str = "replay", chunkSize: int = 16) -> None:
+        super().__init__(model)
+        self.chunkSize = chunkSize
+        self.completions: list[openai.types.chat.ChatCompletion] = []
+        self.keys: dict[str, int] = {}
+        with open(path, encoding="utf-8") as file:
+            for line in file:
+                if not line.strip():
+                    continue
+                recording = json.loads(line)
+                self.keys.setdefault(recording["key"], len(self.completions))
+                self.completions.append(openai.types.chat.ChatCompletion.model_validate(recording["completion"]))
+        self.replayed = 0
+
+    async def complete(self, arguments: dict) -> openai.types.chat.ChatCompletion:
+        if not self.completions:
+            raise FeatureNotYetSupported("No recorded completions to replay")
+        index = self.keys.get(completionRecordingKey(arguments))
+        if index is None:
+            index = self.replayed % len(self.completions)
+            self.replayed += 1
+        return self.completions[index]
+
+    async def stream(self, arguments: dict) -> typing.AsyncIterator[openai.types.chat.ChatCompletionChunk]:
+        completion = await self.complete(arguments)
+        choice = completion.choices[0]
+        content = choice.message.content or ""
+        deltas = [({"content": content[i : i + self.chunkSize]}, None) for i in range(0, len(content), self.chunkSize)] + [({}, choice.finish_reason)]
+        for delta, finishReason in deltas:
+            yield openai.types.chat.ChatCompletionChunk.model_validate(
+                {
+                    "id": completion.id,
+                    "object": "chat.completion.chunk",
+                    "created": completion.created,
+                    "model": completion.model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finishReason}],
+                }
+            )
+        if completion.usage is not None:
+            yield openai.types.chat.ChatCompletionChunk.model_validate(
+                {
+                    "id": completion.id,
+                    "object": "chat.completion.chunk",
+                    "created": completion.created,
+                    "model": completion.model,
+                    "choices": [],
+                    "usage": completion.usage.model_dump(mode="json"),
+                }
+            )
+
+
+def predictionProviderFromEnvs() -> typing.Optional[PredictionProvider]:
+    """🤖 The provider that is configured with `SEMIO_PREDICTION_PROVIDER` or `None` if it is not available."""
+    try:
+        match PREDICTION_PROVIDER:
+            case "openai":
+                provider = OpenAIProvider()
+            case "local":
+                provider = LocalProvider()
+            case "replay":
+                provider = ReplayProvider(PREDICTION_REPLAY_FILE)
+            case _:
+                logger.error("Unknown prediction provider: {}", PREDICTION_PROVIDER)
+                return None
+    except (openai.OpenAIError, OSError) as e:
+        logger.info("Prediction provider {} is not available: {}", PREDICTION_PROVIDER, e)
+        return None
+    if PREDICTION_RECORD_FILE:
+        provider = RecordingProvider(provider, PREDICTION_RECORD_FILE)
+    return provider
+
+
+predictionProvider = predictionProviderFromEnvs()
+
+
+class PredictionCache:
+    """🗃️ Predicted designs on disk by the hash of their inputs.
+    Every entry keeps the raw response and the healed design. Entries expire after a time to live and the least recently used ones are evicted when the cache grows too big.
+    The size of the folder is only scanned once and then tracked in memory. The folder is scanned again when the cache grows too big."""
+
+    def __init__(self, folder: str = PREDICTION_CACHE_FOLDER, ttl: float = PREDICTION_CACHE_TTL, sizeMax: int = PREDICTION_CACHE_SIZE_MAX) -> None:
+        self.folder = pathlib.Path(folder)
+        self.ttl = ttl
+        self.sizeMax = sizeMax
+        self.size: typing.Optional[int] = None
+        """The size of all entries in bytes or `None` if the folder was not scanned yet."""
+        self.lock = threading.Lock()
+
+    def path(self, key: str) -> pathlib.Path:
+        return self.folder / f"{key}.json"
+
+    def get(self, key: str) -> typing.Optional[DesignPrediction]:
+        """🔍 The cached design or `None` if there is none, it expired, it was evicted while it was read or it is not valid."""
+        path = self.path(key)
+        try:
+            entry = json.loads(path.read_text(encoding="utf-8"))
+            if time.time() - entry["created"] > self.ttl:
+                self.remove(path)
+                return None
+            os.utime(path)
+            return DesignPrediction.model_validate(entry["design"])
+        except (OSError, KeyError, TypeError, ValueError):
+            return None
+
+    def put(self, key: str, model: str, response: str, design: DesignPrediction) -> None:
+        """💾 Cache a response and its healed design and evict entries until the cache fits."""
+        os.makedirs(self.folder, exist_ok=True)
+        entry = json.dumps({"created": time.time(), "model": model, "response": response, "design": design.model_dump(mode="json")}).encode()
+        path = self.path(key)
+        temporaryPath = path.with_name(f"{key}.{os.getpid()}.{threading.get_ident()}.{time.time_ns()}.tmp")
+        temporaryPath.write_bytes(entry)
+        with self.lock:
+            if self.size is None:
+                self.size = self.scan()
+            self.size += len(entry) - self.entrySize(path)
+            os.replace(temporaryPath, path)
+            if self.size > self.sizeMax:
+                self.evict()
+
+    def entrySize(self, path: pathlib.Path) -> int:
+        try:
+            return path.stat().st_size
+        except OSError:
+            return 0
+
+    def remove(self, path: pathlib.Path) -> None:
+        with self.lock:
+            if self.size is not None:
+                self.size -= self.entrySize(path)
+            path.unlink(missing_ok=True)
+
+    def scan(self) -> int:
+        """📏 The size of all entries on disk."""
+        return sum(self.entrySize(path) for path in self.folder.glob("*.json"))
+
+    def evict(self) -> None:
+        """🧹 Remove expired entries and the least recently used ones that do not fit anymore and update the size to the entries that are kept."""
+        now = time.time()
+        entries = []
+        for path in self.folder.glob("*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        size = 0
+        kept = 0
+        for modified, entrySize, path in sorted(entries, key=lambda e: e[0], reverse=True):
+            size += entrySize
+            if size > self.sizeMax or now - modified > self.ttl:
+                path.unlink(missing_ok=True)
+            else:
+                kept += entrySize
+        self.size = kept
+
+
+predictionCache = PredictionCache()
+
+
+class HistogramOutput(Output):
+    bounds: list[float] = sqlmodel.Field(default_factory=list)
+    counts: list[int] = sqlmodel.Field(default_factory=list)
+    count: int = sqlmodel.Field(default=0)
+    sum: float = sqlmodel.Field(default=0)
+    p50: typing.Optional[float] = sqlmodel.Field(default=None)
+    p95: typing.Optional[float] = sqlmodel.Field(default=None)
+    p99: typing.Optional[float] = sqlmodel.Field(default=None)
+
+
+class PredictionMetricsOutput(Output):
+    models: dict[str, dict[str, HistogramOutput]] = sqlmodel.Field(default_factory=dict)
+
+
+class Histogram:
+    """📊 The number of observations up to every bound, the number above the last bound and the count and sum of all observations."""
+
+    def __init__(self, bounds: typing.Sequence[float]) -> None:
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> typing.Optional[float]:
+        """📐 Estimate a quantile by interpolating linearly inside its bucket. Observations above the last bound are estimated as the last bound."""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if count and cumulative + count >= rank:
+                if i == len(self.bounds):
+                    return self.bounds[-1]
+                lower = self.bounds[i - 1] if i > 0 else 0.0
+                return lower + (self.bounds[i] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.bounds[-1]
+
+    def dump(self) -> HistogramOutput:
+        return HistogramOutput(
+            bounds=self.bounds, counts=self.counts, count=self.count, sum=self.sum, p50=self.quantile(0.5), p95=self.quantile(0.95), p99=self.quantile(0.99)
+        )
+
+
+class PredictionMetrics:
+    """📈 Histograms of the latencies, tokens and healing of predictions by model.
+    Durations are in seconds."""
+
+    BOUNDS: dict[str, typing.Sequence[float]] = {
+        "promptRenderTime": DURATION_BOUNDS,
+        "completionLatency": DURATION_BOUNDS,
+        "promptTokens": TOKEN_BOUNDS,
+        "completionTokens": TOKEN_BOUNDS,
+        "decodeTime": DURATION_BOUNDS,
+        "healTime": DURATION_BOUNDS,
+        "healedPieces": COUNT_BOUNDS,
+        "healedPorts": COUNT_BOUNDS,
+    }
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.histograms: dict[str, dict[str, Histogram]] = {}
+
+    def observe(self, model: str, metric: str, value: float) -> None:
+        with self.lock:
+            histograms = self.histograms.setdefault(model, {})
+            if metric not in histograms:
+                histograms[metric] = Histogram(self.BOUNDS[metric])
+            histograms[metric].observe(value)
+
+    def record(self, model: str, **values: float) -> None:
+        """📝 Observe the values of one stage of a prediction and log them."""
+        logger.info("Prediction metrics for {}: {}", model, values)
+        for metric, value in values.items():
+            self.observe(model, metric, value)
+
+    def dump(self) -> PredictionMetricsOutput:
+        with self.lock:
+            return PredictionMetricsOutput(models={m: {n: h.dump() for n, h in hs.items()} for m, hs in self.histograms.items()})
+
+
+predictionMetrics = PredictionMetrics()
+
+
+def healedCounts(design: DesignPrediction, healedDesign: DesignPrediction) -> tuple[int, int]:
+    """🩹 The number of pieces and ports of connections of a predicted design that were replaced or removed by healing.
+    A piece counts if its type was replaced or if it was removed and pieces that healing left as they were do not count."""
+    healedTypes = {p.id_: (p.type.name, p.type.variant) for p in healedDesign.pieces if p.type}
+    pieces = sum(1 for p in design.pieces if p.type and healedTypes.get(p.id_) != (p.type.name, p.type.variant))
+
+    def sides(d: DesignPrediction) -> collections.Counter:
+        return collections.Counter((s.piece.id_, s.port.id_) for c in d.connections for s in (c.connected, c.connecting))
+
+    return pieces, sum((sides(design) - sides(healedDesign)).values())
+
+
+def predictionKey(description: str, typesKey: str, design: DesignInput | None, model: str) -> str:
+    """🔑 A hash of everything that changes a prediction. Whitespace in the description is normalized."""
+    inputs = {
+        "description": " ".join(description.split()),
+        "types": typesKey,
+        "design": design.model_dump(mode="json") if design is not None else None,
+        "model": model,
+        "systemPrompt": systemPrompt,
+        "encoding": PREDICTION_PROMPT_ENCODING,
+        "typeFilter": PREDICTION_TYPE_FILTER,
+        "largestComponent": PREDICTION_LARGEST_COMPONENT,
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
 
 systemPrompt = """You are a kit-of-parts design assistant.
 Rules:
@@ -3844,7 +6464,7 @@ When a piece is [on, next to, above, below, ...] another piece, there SHOULD be
 When a piece fits to a port of another piece, there SHOULD be a connecting between the pieces."""
 # logger.debug("System prompt: {}", systemPrompt)
 
-designGenerationPromptTemplate = jinja2.Template(
+designGenerationTypesPromptTemplate = jinja2.Template(
     """Your task is to help to puzzle together a design.
 
 TYPE{NAME;VARIANT;DESCRIPTION;PORTS}
@@ -3864,12 +6484,140 @@ Available types:
 {%- raw %}}{% endraw -%}
 {%- endfor -%}
 {%- raw %}}{% endraw -%}
-{% endfor %}
+{% endfor %}"""
+)
+
+designGenerationDescriptionPromptTemplate = jinja2.Template(
+    """
 
 The generated design should match this description:
 {{ description }}"""
 )
 
+
+def typesHash(types: list[TypeContext]) -> str:
+    """#️⃣ A hash of the content of a list of types."""
+    return hashlib.sha256(json.dumps([t.model_dump(mode="json") for t in types], sort_keys=True).encode()).hexdigest()
+
+
+compactDesignGenerationTypesPromptTemplate = jinja2.Template(
+    """Your task is to help to puzzle together a design.
+
+FAMILY{CODE;NAME}
+PORTS{CODE;PORT...}
+PORT{ID;DESCRIPTION;FAMILYCODE;COMPATIBLEFAMILYCODES}
+TYPE{NAME;VARIANT;DESCRIPTION;PORTSCODE}
+Families and ports are referenced by their code.
+
+Families:
+{% for code, name in families -%}
+{{ "{" }}{{ code }};{{ name }}{{ "}" }}
+{% endfor %}
+Ports:
+{% for code, ports in portBlocks -%}
+{{ "{" }}{{ code }};
+{%- for id_, description, family, compatibleFamilies in ports -%}
+{{ "{" }}{{ id_ }};{{ description }};{{ family }};{{ compatibleFamilies }}{{ "}" }}
+{%- endfor -%}
+{{ "}" }}
+{% endfor %}
+Available types:
+{% for name, variant, description, portBlock in types -%}
+{{ "{" }}{{ name }};{{ variant }};{{ description }};{{ portBlock }}{{ "}" }}
+{% endfor %}"""
+)
+
+
+def compactTypes(types: list[TypeContext]) -> dict:
+    """🗜️ Replace the family names of the ports of types with short codes and share identical port blocks between types."""
+    families: dict[str, str] = {}
+    portBlocks: dict[tuple, str] = {}
+    rows = []
+
+    def familyCode(family: str) -> str:
+        return families.setdefault(family, f"F{len(families)}")
+
+    for type in (encodeType(t) for t in types):
+        ports = tuple(
+            (
+                port.id_,
+                encodeForPrompt(port.description),
+                familyCode(port.family) if port.family else "",
+                ",".join(familyCode(f) for f in port.compatibleFamilies if f),
+            )
+            for port in type.ports
+        )
+        portBlock = portBlocks.setdefault(ports, f"P{len(portBlocks)}")
+        rows.append((type.name, type.variant, type.description, portBlock))
+    return {
+        "families": [(code, family) for family, code in families.items()],
+        "portBlocks": [(code, ports) for ports, code in portBlocks.items()],
+        "types": rows,
+    }
+
+
+STOP_WORDS = frozenset({"and", "are", "for", "from", "has", "have", "into", "its", "that", "the", "this", "with"})
+
+
+def words(text: str) -> set[str]:
+    """🔤 The lower case words of a text without stop words, short words and plural endings."""
+    return {w[:-1] if len(w) > 3 and w.endswith("s") else w for w in re.findall(r"[a-z0-9]+", text.lower()) if len(w) > 2 and w not in STOP_WORDS}
+
+
+def relevantTypes(description: str, types: list[TypeContext]) -> list[TypeContext]:
+    """🎯 The types that share a word with the description in their name, variant, description or concepts together with all other variants of the same name.
+    All types are kept if none does and the given list is returned if all types are kept."""
+    descriptionWords = words(description)
+    names = {t.name for t in types if descriptionWords & words(" ".join([t.name, t.variant, t.description, *t.concepts]))}
+    relevant = [t for t in types if t.name in names]
+    return relevant if 0 < len(relevant) < len(types) else types
+
+
+def estimateTokens(text: str) -> int:
+    """🪙 A rough estimate of the number of tokens of a text. Every word and every symbol counts as a token and long words count as several."""
+    return sum(1 + len(w) // 8 for w in re.findall(r"\w+|[^\w\s]", text))
+
+
+typesPrompts: collections.OrderedDict[tuple[str, str], str] = collections.OrderedDict()
+"""🗃️ The recently rendered types sections of the prompt by the hash of their types and their encoding."""
+typesPromptsLock = threading.Lock()
+"""🔒 Guards the recently rendered types sections because prompts are rendered from several threads."""
+
+
+def renderTypesPrompt(types: list[TypeContext], encoding: str = PREDICTION_PROMPT_ENCODING, typesKey: typing.Optional[str] = None) -> str:
+    """📝 Render the types section of the prompt in the full or the compact encoding. It is only rendered again when the content of the types changes.
+    A caller that already hashed the types passes the hash as `typesKey`."""
+    key = (typesKey or typesHash(types), encoding)
+    with typesPromptsLock:
+        prompt = typesPrompts.get(key)
+        if prompt is not None:
+            typesPrompts.move_to_end(key)
+            return prompt
+    match encoding:
+        case "full":
+            prompt = designGenerationTypesPromptTemplate.render(types=[encodeType(t) for t in types])
+        case "compact":
+            prompt = compactDesignGenerationTypesPromptTemplate.render(**compactTypes(types))
+        case _:
+            raise FeatureNotYetSupported(f"Unknown prompt encoding {encoding}")
+    with typesPromptsLock:
+        typesPrompts[key] = prompt
+        if len(typesPrompts) > TYPES_PROMPTS_MAX:
+            typesPrompts.popitem(last=False)
+    return prompt
+
+
+def promptTypes(description: str, types: list[TypeContext]) -> list[TypeContext]:
+    """🎯 The types that are listed in the prompt for a description."""
+    return relevantTypes(description, types) if PREDICTION_TYPE_FILTER else types
+
+
+def renderPrompt(description: str, types: list[TypeContext], typesKey: typing.Optional[str] = None) -> str:
+    """📝 Render the prompt for a description and the types that should be used. `typesKey` is the hash of all the types if it is known."""
+    listedTypes = promptTypes(description, types)
+    return renderTypesPrompt(listedTypes, typesKey=typesKey if listedTypes is types else None) + designGenerationDescriptionPromptTemplate.render(description=description)
+
+
 designResponseFormat = json.loads(
     """
 {
@@ -3984,101 +6732,299 @@ designResponseFormat = json.loads(
 #     designResponseFormat = json.load(f)
 
 
-def predictDesign(description: str, types: list[TypeContext], design: DesignInput | None = None) -> DesignPrediction:
-    """🔮 Predict a design based on a description, the types that should be used and an optional base design."""
-    if openaiClient is None:
-        raise FeatureNotYetSupported("OpenAI client not available")
+def completionArguments(prompt: str) -> dict:
+    """💬 The arguments of a chat completion that predicts a design for a prompt. The model is chosen by the provider."""
+    return {
+        "messages": [
+            {
+                "role": "system",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": systemPrompt,
+                    }
+                ],
+            },
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": prompt,
+                    }
+                ],
+            },
+        ],
+        "response_format": {
+            "type": "json_schema",
+            "json_schema": designResponseFormat,
+        },
+        # "temperature": 1,
+        # "max_completion_tokens": 16383,
+        # "top_p": 1,
+        # "frequency_penalty": 0,
+        # "presence_penalty": 0,
+        "timeout": PREDICTION_TIMEOUT,
+    }
+
+
+def renderPredictionPrompt(description: str, types: list[TypeContext], model: str, typesKey: typing.Optional[str] = None) -> str:
+    start = time.perf_counter()
+    prompt = renderPrompt(description, types, typesKey)
+    predictionMetrics.record(model, promptRenderTime=time.perf_counter() - start)
+    logger.info(
+        "Rendered {} prompt of {} characters and about {} tokens for {} types in {:.2f} ms",
+        PREDICTION_PROMPT_ENCODING,
+        len(prompt),
+        estimateTokens(prompt),
+        len(types),
+        (time.perf_counter() - start) * 1000,
+    )
+    logger.debug("Generated prompt: {}", prompt)
+    return prompt
+
+
+def logResponse(response: typing.Any) -> None:
+    if response.usage:
+        responseDump = {
+            "id": response.id,
+            "created": response.created,
+            "model": response.model,
+            "object": response.object,
+            "system_fingerprint": response.system_fingerprint,
+            "usage": {
+                "completion_tokens": response.usage.completion_tokens,
+                "prompt_tokens": response.usage.prompt_tokens,
+                "total_tokens": response.usage.total_tokens,
+            },
+            "_request_id": response._request_id,
+            "choices": [
+                {
+                    "finish_reason": c.finish_reason,
+                    "message": {
+                        "content": c.message.content,
+                        "refusal": c.message.refusal,
+                        "role": c.message.role,
+                    },
+                }
+                for c in response.choices
+            ],
+        }
+        logger.debug("Received response: {}", responseDump)
+
+
+def healPrediction(key: str, content: str, types: list[TypeContext], model: str) -> DesignPrediction:
+    """🩹 Decode, heal and cache the content of a complete response."""
+    logger.opt(lazy=True).debug("Schema: {}", lambda: json.dumps(designResponseFormat, indent=4))
+    logger.debug("System Prompt: {}", systemPrompt)
+    logger.opt(lazy=True).debug("Predicted Design Raw: {}", lambda: json.dumps(json.loads(content), indent=4))
+    start = time.perf_counter()
+    design = decodeDesign(json.loads(content))
+    decodeTime = time.perf_counter() - start
+    logger.opt(lazy=True).debug("Predicted Design: {}", lambda: json.dumps(design.model_dump(), indent=4))
+    # piece healing of variants that do not exist
+    start = time.perf_counter()
+    healedDesign = healDesign(typing.cast(DesignPrediction, design), types, PREDICTION_LARGEST_COMPONENT)
+    healTime = time.perf_counter() - start
+    healedPieces, healedPorts = healedCounts(typing.cast(DesignPrediction, design), healedDesign)
+    predictionMetrics.record(model, decodeTime=decodeTime, healTime=healTime, healedPieces=healedPieces, healedPorts=healedPorts)
+    logger.opt(lazy=True).debug("Predicted Design Healed: {}", lambda: json.dumps(healedDesign.model_dump(), indent=4))
+    predictionCache.put(key, model, content, healedDesign)
+    return healedDesign
+
+
+def healResponse(key: str, response: typing.Any, types: list[TypeContext], model: str) -> DesignPrediction:
+    result = response.choices[0] if response.choices else None
+    if result and result.finish_reason == "stop" and result.message.refusal is None and result.message.content:
+        return healPrediction(key, result.message.content, types, model)
+    raise FeatureNotYetSupported("Completion was invalid or incomplete")
+
+
+def recordCompletion(model: str, latency: float, usage: typing.Any) -> None:
+    """⏱️ Record the latency of a completion and its tokens if the provider reported them."""
+    if usage:
+        predictionMetrics.record(model, completionLatency=latency, promptTokens=usage.prompt_tokens, completionTokens=usage.completion_tokens)
+    else:
+        predictionMetrics.record(model, completionLatency=latency)
+
+
+async def completeWithRetries(provider: PredictionProvider, arguments: dict, retries: int = PREDICTION_RETRIES, backoff: float = PREDICTION_BACKOFF) -> typing.Any:
+    """🔁 Request a chat completion and retry transient failures with an exponential backoff and jitter."""
+    for attempt in range(retries + 1):
+        try:
+            return await provider.complete(arguments)
+        except (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError) as e:
+            if attempt == retries:
+                raise
+            delay = backoff * 2**attempt * random.uniform(0.5, 1.0)
+            logger.warning("Retrying completion request in {:.2f} s after: {}", delay, e)
+            await asyncio.sleep(delay)
+
+
+async def streamWithRetries(
+    provider: PredictionProvider, arguments: dict, retries: int = PREDICTION_RETRIES, backoff: float = PREDICTION_BACKOFF
+) -> typing.AsyncIterator[typing.Any]:
+    """🔁 Stream a chat completion and retry transient failures until the first chunk arrives with an exponential backoff and jitter.
+    A failure after the first chunk is raised because the chunks before it were already yielded."""
+    for attempt in range(retries + 1):
+        started = False
+        try:
+            async for chunk in provider.stream(arguments):
+                started = True
+                yield chunk
+            return
+        except (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError) as e:
+            if started or attempt == retries:
+                raise
+            delay = backoff * 2**attempt * random.uniform(0.5, 1.0)
+            logger.warning("Retrying completion stream in {:.2f} s after: {}", delay, e)
+            await asyncio.sleep(delay)
+
 
-    prompt = designGenerationPromptTemplate.render(description=description, types=[encodeType(t) for t in types])
-    logger.debug("Generated prompt: {}", prompt)
+async def completePrediction(
+    key: str, prompt: str, types: list[TypeContext], provider: typing.Optional[PredictionProvider], retries: int = PREDICTION_RETRIES, backoff: float = PREDICTION_BACKOFF
+) -> DesignPrediction:
+    """🔮 Request, heal and cache the design for a rendered prompt."""
+    if provider is None:
+        raise FeatureNotYetSupported("No prediction provider available")
+    start = time.perf_counter()
     try:
-        response = openaiClient.chat.completions.create(
-            # model="o1-mini",
-            model="gpt-4o",
-            # model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": systemPrompt,
-                        }
-                    ],
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": prompt,
-                        }
-                    ],
-                },
-            ],
-            response_format={
-                "type": "json_schema",
-                "json_schema": designResponseFormat,
-            },
-            # temperature=1,
-            # max_completion_tokens=16383,
-            # top_p=1,
-            # frequency_penalty=0,
-            # presence_penalty=0,
-        )
-        if response.usage:
-            responseDump = {
-                "id": response.id,
-                "created": response.created,
-                "model": response.model,
-                "object": response.object,
-                "system_fingerprint": response.system_fingerprint,
-                "usage": {
-                    "completion_tokens": response.usage.completion_tokens,
-                    "prompt_tokens": response.usage.prompt_tokens,
-                    "total_tokens": response.usage.total_tokens,
-                },
-                "_request_id": response._request_id,
-                "choices": [
-                    {
-                        "finish_reason": c.finish_reason,
-                        "message": {
-                            "content": c.message.content,
-                            "refusal": c.message.refusal,
-                            "role": c.message.role,
-                        },
-                    }
-                    for c in response.choices
-                ],
-            }
-            logger.debug("Received response: {}", responseDump)
-    except Error:
-        logger.error("Error occurred during OpenAI request")
-        raise FeatureNotYetSupported("OpenAI request failed")
+        response = await completeWithRetries(provider, completionArguments(prompt), retries, backoff)
+    except openai.OpenAIError as e:
+        logger.error("Error occurred during completion request: {}", e)
+        raise FeatureNotYetSupported("Completion request failed")
+    recordCompletion(provider.model, time.perf_counter() - start, response.usage)
+    logResponse(response)
+    return healResponse(key, response, types, provider.model)
 
-    logger.debug("Schema: {}", json.dumps(designResponseFormat, indent=4))
-    logger.debug("Prompt: {}", prompt)
-    logger.debug("System Prompt: {}", systemPrompt)
 
-    result = response.choices[0] if response.choices else None
-    if result and result.message.content:
-        logger.debug("Predicted Design Raw: {}", json.dumps(json.loads(result.message.content), indent=4))
+def predictDesign(description: str, types: list[TypeContext], design: DesignInput | None = None, provider: typing.Optional[PredictionProvider] = None) -> DesignPrediction:
+    """🔮 Predict a design based on a description, the types that should be used and an optional base design.
+    The connections of the provider are closed together with the event loop of the prediction."""
+    provider = provider or predictionProvider
 
-    if result and result.finish_reason == "stop" and result.message.refusal is None and result.message.content:
-        design = decodeDesign(json.loads(result.message.content))
+    async def predict() -> DesignPrediction:
+        try:
+            return await predictDesignAsync(description, types, design, provider)
+        finally:
+            if provider is not None:
+                await provider.close()
 
-        if hasattr(design, "model_dump"):
-            logger.debug("Predicted Design: {}", json.dumps(design.model_dump(), indent=4))
+    return asyncio.run(predict())
 
-        # piece healing of variants that do not exist
-        healedDesign = healDesign(typing.cast(DesignPrediction, design), types)
-        logger.debug(
-            "Predicted Design Healed: {}",
-            json.dumps(healedDesign.model_dump(), indent=4),
-        )
-        return healedDesign
 
-    raise FeatureNotYetSupported("OpenAI response was invalid or incomplete")
+async def predictDesignAsync(
+    description: str, types: list[TypeContext], design: DesignInput | None = None, provider: typing.Optional[PredictionProvider] = None
+) -> DesignPrediction:
+    """🔮 Predict a design without blocking the event loop. Cancelling the task cancels the request."""
+    provider = provider or predictionProvider
+    model = provider.model if provider is not None else ""
+    typesKey = typesHash(types)
+    key = predictionKey(description, typesKey, design, model)
+    cachedDesign = predictionCache.get(key)
+    if cachedDesign is not None:
+        logger.info("Prediction cache hit: {}", key)
+        return cachedDesign
+    return await completePrediction(key, renderPredictionPrompt(description, types, model, typesKey), types, provider)
+
+
+async def predictDesigns(
+    descriptions: list[str],
+    types: list[TypeContext],
+    design: DesignInput | None = None,
+    provider: typing.Optional[PredictionProvider] = None,
+    concurrency: int = PREDICTION_CONCURRENCY,
+    retries: int = PREDICTION_RETRIES,
+    backoff: float = PREDICTION_BACKOFF,
+) -> typing.AsyncIterator[tuple[int, DesignPrediction | Exception]]:
+    """🔮 Predict a design for every description with the same types.
+    The types section of the prompt is rendered once. At most `concurrency` requests run at the same time.
+    Every design or error is yielded together with the index of its description as soon as it is done."""
+    provider = provider or predictionProvider
+    model = provider.model if provider is not None else ""
+    typesKey = typesHash(types)
+    typesPrompt = renderTypesPrompt(types, typesKey=typesKey) if not PREDICTION_TYPE_FILTER else None
+    logger.info("Predicting {} designs for {} types", len(descriptions), len(types))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def predict(index: int, description: str) -> tuple[int, DesignPrediction | Exception]:
+        try:
+            key = predictionKey(description, typesKey, design, model)
+            cachedDesign = predictionCache.get(key)
+            if cachedDesign is not None:
+                return index, cachedDesign
+            start = time.perf_counter()
+            prompt = typesPrompt + designGenerationDescriptionPromptTemplate.render(description=description) if typesPrompt else renderPrompt(description, types, typesKey)
+            predictionMetrics.record(model, promptRenderTime=time.perf_counter() - start)
+            async with semaphore:
+                return index, await completePrediction(key, prompt, types, provider, retries, backoff)
+        except Exception as e:
+            return index, e
+
+    tasks = [asyncio.ensure_future(predict(i, d)) for i, d in enumerate(descriptions)]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def streamDesign(
+    description: str,
+    types: list[TypeContext],
+    design: DesignInput | None = None,
+    provider: typing.Optional[PredictionProvider] = None,
+    retries: int = PREDICTION_RETRIES,
+    backoff: float = PREDICTION_BACKOFF,
+) -> typing.AsyncIterator[dict]:
+    """🌊 Predict a design and yield every piece and connection as soon as it is decoded and the healed design at the end.
+    Pieces and connections have the same shape whether they come from the cache or from the response. Closing the iterator closes the request."""
+    provider = provider or predictionProvider
+    typesKey = typesHash(types)
+    key = predictionKey(description, typesKey, design, provider.model if provider is not None else "")
+    cachedDesign = predictionCache.get(key)
+    if cachedDesign is not None:
+        logger.info("Prediction cache hit: {}", key)
+        for piece in cachedDesign.pieces:
+            yield {"piece": piece.model_dump(mode="json")}
+        for connection in cachedDesign.connections:
+            yield {"connection": connection.model_dump(mode="json")}
+        yield {"design": cachedDesign.model_dump(mode="json")}
+        return
+    if provider is None:
+        raise FeatureNotYetSupported("No prediction provider available")
+    prompt = renderPredictionPrompt(description, types, provider.model, typesKey)
+    splitter = JsonArrayStreamSplitter(("pieces", "connections"))
+    content = io.StringIO()
+    finishReason = None
+    usage = None
+    # only the time that is spent waiting for the provider counts and not the time that the consumer holds the iterator
+    latency = 0.0
+    try:
+        resumed = time.perf_counter()
+        async for chunk in streamWithRetries(provider, completionArguments(prompt), retries, backoff):
+            latency += time.perf_counter() - resumed
+            usage = getattr(chunk, "usage", None) or usage
+            if chunk.choices:
+                choice = chunk.choices[0]
+                finishReason = choice.finish_reason or finishReason
+                delta = choice.delta.content or ""
+                content.write(delta)
+                for arrayKey, item in splitter.feed(delta.encode()):
+                    if arrayKey == "pieces":
+                        yield {"piece": PiecePrediction.parse(decodePiece(json.loads(item))).model_dump(mode="json")}
+                    else:
+                        yield {"connection": ConnectionPrediction.parse(decodeConnection(json.loads(item))).model_dump(mode="json")}
+            resumed = time.perf_counter()
+        latency += time.perf_counter() - resumed
+    except openai.OpenAIError as e:
+        logger.error("Error occurred during completion request: {}", e)
+        raise FeatureNotYetSupported("Completion request failed")
+    recordCompletion(provider.model, latency, usage)
+    if finishReason != "stop":
+        raise FeatureNotYetSupported("Completion was invalid or incomplete")
+    yield {"design": healPrediction(key, content.getvalue(), types, provider.model).model_dump(mode="json")}
 
 
 # endregion Assistant
@@ -4329,6 +7275,11 @@ class PlaneInputNode(InputNode):
         model = PlaneInput
 
 
+class PlaneOutputNode(Node):
+    class Meta:
+        model = PlaneOutput
+
+
 class PortNode(TableEntityNode):
     class Meta:
         model = Port
@@ -4487,6 +7438,76 @@ class KitNode(TableEntityNode):
         model = Kit
 
 
+class PieceIdNode(Node):
+    class Meta:
+        model = PieceId
+
+
+class ScenePieceNode(Node):
+    class Meta:
+        model = ScenePieceOutput
+
+
+class SceneNode(Node):
+    class Meta:
+        model = SceneOutput
+
+
+class SpatialQueryNode(Node):
+    class Meta:
+        model = SpatialQueryOutput
+
+
+class FlatScenePieceNode(Node):
+    class Meta:
+        model = FlatScenePieceOutput
+
+
+class FlatSceneNode(Node):
+    class Meta:
+        model = FlatSceneOutput
+
+
+class ClashNode(Node):
+    class Meta:
+        model = ClashOutput
+
+
+class ClashesNode(Node):
+    class Meta:
+        model = ClashesOutput
+
+
+class RepresentationUrlNode(Node):
+    class Meta:
+        model = RepresentationUrlOutput
+
+
+class RepresentationUrlsNode(Node):
+    class Meta:
+        model = RepresentationUrlsOutput
+
+
+class TypeIdNode(Node):
+    class Meta:
+        model = TypeId
+
+
+class PortIdNode(Node):
+    class Meta:
+        model = PortId
+
+
+class CompatiblePortNode(Node):
+    class Meta:
+        model = CompatiblePortOutput
+
+
+class CompatiblePortsNode(Node):
+    class Meta:
+        model = CompatiblePortsOutput
+
+
 # # Can't use SQLAlchemyConnectionField because only supports one database.
 # # https://github.com/graphql-python/graphene-sqlalchemy/issues/180
 # class KitConnection(graphene.relay.Connection):
@@ -4497,11 +7518,106 @@ class KitNode(TableEntityNode):
 class Query(graphene.ObjectType):
     node = RelayNode.Field()
     kit = graphene.Field(KitNode, uri=graphene.String(required=True))
+    scene = graphene.Field(
+        SceneNode,
+        kitUri=graphene.String(required=True),
+        designName=graphene.String(required=True),
+        designVariant=graphene.String(default_value=""),
+        designView=graphene.String(default_value=""),
+    )
+    flatScene = graphene.Field(
+        FlatSceneNode,
+        kitUri=graphene.String(required=True),
+        designName=graphene.String(required=True),
+        designVariant=graphene.String(default_value=""),
+        designView=graphene.String(default_value=""),
+    )
+    clashes = graphene.Field(
+        ClashesNode,
+        kitUri=graphene.String(required=True),
+        designName=graphene.String(required=True),
+        designVariant=graphene.String(default_value=""),
+        designView=graphene.String(default_value=""),
+    )
+    representationUrls = graphene.Field(
+        RepresentationUrlsNode,
+        kitUri=graphene.String(required=True),
+        designName=graphene.String(required=True),
+        designVariant=graphene.String(default_value=""),
+        designView=graphene.String(default_value=""),
+        tags=graphene.List(graphene.NonNull(graphene.String), default_value=[]),
+    )
+    compatiblePorts = graphene.Field(
+        CompatiblePortsNode,
+        kitUri=graphene.String(required=True),
+        typeName=graphene.String(required=True),
+        typeVariant=graphene.String(default_value=""),
+        portId=graphene.String(required=True),
+    )
+    nearestPieces = graphene.Field(
+        SpatialQueryNode,
+        kitUri=graphene.String(required=True),
+        designName=graphene.String(required=True),
+        designVariant=graphene.String(default_value=""),
+        designView=graphene.String(default_value=""),
+        x=graphene.Float(required=True),
+        y=graphene.Float(required=True),
+        z=graphene.Float(required=True),
+        count=graphene.Int(default_value=1),
+    )
+    piecesInRadius = graphene.Field(
+        SpatialQueryNode,
+        kitUri=graphene.String(required=True),
+        designName=graphene.String(required=True),
+        designVariant=graphene.String(default_value=""),
+        designView=graphene.String(default_value=""),
+        x=graphene.Float(required=True),
+        y=graphene.Float(required=True),
+        z=graphene.Float(required=True),
+        radius=graphene.Float(required=True),
+    )
+    piecesInBox = graphene.Field(
+        SpatialQueryNode,
+        kitUri=graphene.String(required=True),
+        designName=graphene.String(required=True),
+        designVariant=graphene.String(default_value=""),
+        designView=graphene.String(default_value=""),
+        minX=graphene.Float(required=True),
+        minY=graphene.Float(required=True),
+        minZ=graphene.Float(required=True),
+        maxX=graphene.Float(required=True),
+        maxY=graphene.Float(required=True),
+        maxZ=graphene.Float(required=True),
+    )
     # kits = graphene.relay.ConnectionField(KitConnection)
 
     def resolve_kit(self, info, uri):
         return get(encode(uri))
 
+    def resolve_scene(self, info, kitUri, designName, designVariant, designView):
+        return getScene(f"{encode(kitUri)}/designs/{encode(designName)},{encode(designVariant)},{encode(designView)}")
+
+    def resolve_flatScene(self, info, kitUri, designName, designVariant, designView):
+        return getFlatScene(f"{encode(kitUri)}/designs/{encode(designName)},{encode(designVariant)},{encode(designView)}")
+
+    def resolve_clashes(self, info, kitUri, designName, designVariant, designView):
+        return getClashes(f"{encode(kitUri)}/designs/{encode(designName)},{encode(designVariant)},{encode(designView)}")
+
+    def resolve_representationUrls(self, info, kitUri, designName, designVariant, designView, tags):
+        return getRepresentationUrls(f"{encode(kitUri)}/designs/{encode(designName)},{encode(designVariant)},{encode(designView)}", tags)
+
+    def resolve_compatiblePorts(self, info, kitUri, typeName, typeVariant, portId):
+        return getCompatiblePorts(f"{encode(kitUri)}/types/{encode(typeName)},{encode(typeVariant)}", portId)
+
+    def resolve_nearestPieces(self, info, kitUri, designName, designVariant, designView, x, y, z, count):
+        return getNearestPieces(f"{encode(kitUri)}/designs/{encode(designName)},{encode(designVariant)},{encode(designView)}", Point(x, y, z), count)
+
+    def resolve_piecesInRadius(self, info, kitUri, designName, designVariant, designView, x, y, z, radius):
+        return getPiecesInRadius(f"{encode(kitUri)}/designs/{encode(designName)},{encode(designVariant)},{encode(designView)}", Point(x, y, z), radius)
+
+    def resolve_piecesInBox(self, info, kitUri, designName, designVariant, designView, minX, minY, minZ, maxX, maxY, maxZ):
+        return getPiecesInBox(f"{encode(kitUri)}/designs/{encode(designName)},{encode(designVariant)},{encode(designView)}", Point(minX, minY, minZ), Point(maxX, maxY, maxZ))
+
 
 class Mutation(graphene.ObjectType):
     createKit = graphene.Field(KitNode, kit=KitInputNode(required=True))
@@ -4516,7 +7632,103 @@ graphqlSchema = graphene.Schema(
 
 # region Rest
 
-rest = fastapi.FastAPI(max_request_body_size=MAX_REQUEST_BODY_SIZE)
+
+class CollectionLimitsScanner(JsonTokenizer):
+    """🔢 Scan a JSON document chunk by chunk and raise as soon as an array under a limited key has more items than allowed."""
+
+    def __init__(self, limits: dict[str, int] = COLLECTION_LIMITS) -> None:
+        super().__init__()
+        self.limits = {key.encode(): limit for key, limit in limits.items()}
+        self.frames: list[list] = []
+        """🗂️ The open containers as [isArray, key, limit, commas, expectsKey]."""
+
+    def feed(self, chunk: bytes) -> None:
+        """🍽️ Scan the next chunk of the document."""
+        for i, token in self.tokens(chunk):
+            frame = self.frames[-1] if self.frames else None
+            match token:
+                case 0x22:  # "
+                    self.isKey = frame is not None and not frame[0] and frame[4]
+                case 0x7B:  # {
+                    self.frames.append([False, None, None, 0, True])
+                case 0x5B:  # [
+                    key = self.lastKey if frame is not None and not frame[0] else None
+                    self.frames.append([True, key, self.limits.get(key), 0, False])
+                case 0x5D | 0x7D:  # ] }
+                    if self.frames:
+                        self.frames.pop()
+                case 0x3A:  # :
+                    if frame is not None:
+                        frame[4] = False
+                case 0x2C:  # ,
+                    if frame is None:
+                        continue
+                    if frame[0]:
+                        frame[3] += 1
+                        if frame[2] is not None and frame[3] + 1 > frame[2]:
+                            raise CollectionTooLarge(frame[1].decode(), frame[2])
+                    else:
+                        frame[4] = True
+
+
+class RequestLimitsMiddleware:
+    """🚧 Reject requests whose body is larger than the maximum size or contains too many items of a limited collection while the body is streamed."""
+
+    def __init__(self, app, maxBodySize: int = MAX_REQUEST_BODY_SIZE, limits: dict[str, int] = COLLECTION_LIMITS) -> None:
+        self.app = app
+        self.maxBodySize = maxBodySize
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        contentLength = headers.get(b"content-length", b"")
+        if contentLength.isdigit() and int(contentLength) > self.maxBodySize:
+            await fastapi.Response(content=str(RequestBodyTooLarge(self.maxBodySize)), status_code=413)(scope, receive, send)
+            return
+        scanner = CollectionLimitsScanner(self.limits) if b"json" in headers.get(b"content-type", b"") else None
+        receivedSize = 0
+        error: typing.Optional[RequestTooLarge] = None
+        responseStarted = False
+
+        async def limitedReceive():
+            nonlocal receivedSize, error
+            message = await receive()
+            if message["type"] == "http.request":
+                body = message.get("body", b"")
+                receivedSize += len(body)
+                try:
+                    if receivedSize > self.maxBodySize:
+                        raise RequestBodyTooLarge(self.maxBodySize)
+                    if scanner is not None:
+                        scanner.feed(body)
+                except RequestTooLarge as e:
+                    error = e
+                    raise e
+            return message
+
+        async def limitedSend(message):
+            nonlocal responseStarted
+            # The app answers the aborted body with its own error which is replaced by the one of the limit.
+            if error is not None and not responseStarted:
+                return
+            if message["type"] == "http.response.start":
+                responseStarted = True
+            await send(message)
+
+        try:
+            await self.app(scope, limitedReceive, limitedSend)
+        except Exception as e:
+            if error is None or responseStarted:
+                raise e
+        if error is not None and not responseStarted:
+            await fastapi.Response(content=str(error), status_code=413)(scope, receive, send)
+
+
+rest = fastapi.FastAPI()
+rest.add_middleware(RequestLimitsMiddleware)
 
 
 @rest.get("/kits/{encodedKitUri}")
@@ -4553,6 +7765,30 @@ async def create_kit(
     return fastapi.Response(content=str(error), status_code=statusCode)
 
 
+@rest.put("/stream/kits/{encodedKitUri}")
+async def stream_kit(
+    request: fastapi.Request,
+    encodedKitUri: ENCODED_PATH,
+) -> None:
+    try:
+        stream = putStream(request.url.path.removeprefix("/api/stream/kits/"))
+        try:
+            async for chunk in request.stream():
+                stream.feed(chunk)
+        except Exception as e:
+            stream.abort()
+            raise e
+        stream.close()
+        return None
+    except ClientError as e:
+        statusCode = 400
+        error = e
+    except Exception as e:
+        statusCode = 500
+        error = e
+    return fastapi.Response(content=str(error), status_code=statusCode)
+
+
 @rest.delete("/kits/{encodedKitUri}")
 async def delete_kit(
     request: fastapi.Request,
@@ -4607,6 +7843,24 @@ async def delete_type(
     return fastapi.Response(content=str(error), status_code=statusCode)
 
 
+@rest.get("/kits/{encodedKitUri}/types/{encodedTypeNameAndVariant}/ports/{encodedPortId}/compatibles")
+async def type_port_compatibles(
+    request: fastapi.Request,
+    encodedKitUri: ENCODED_PATH,
+    encodedTypeNameAndVariant: ENCODED_NAME_AND_VARIANT_PATH,
+    encodedPortId: ENCODED_PATH,
+) -> CompatiblePortsOutput:
+    try:
+        return getCompatiblePorts(request.url.path.removeprefix("/api/kits/").removesuffix(f"/ports/{encodedPortId}/compatibles"), decode(encodedPortId))
+    except ClientError as e:
+        statusCode = 400
+        error = e
+    except Exception as e:
+        statusCode = 500
+        error = e
+    return fastapi.Response(content=str(error), status_code=statusCode)
+
+
 @rest.put("/kits/{encodedKitUri}/designs/{encodedDesignNameAndVariantAndView}")
 async def put_design(
     request: fastapi.Request,
@@ -4626,6 +7880,140 @@ async def put_design(
     return fastapi.Response(content=str(error), status_code=statusCode)
 
 
+@rest.get("/kits/{encodedKitUri}/designs/{encodedDesignNameAndVariantAndView}/scene")
+async def design_scene(
+    request: fastapi.Request,
+    encodedKitUri: ENCODED_PATH,
+    encodedDesignNameAndVariantAndView: ENCODED_NAME_AND_VARIANT_AND_VIEW_PATH,
+) -> SceneOutput:
+    try:
+        return getScene(request.url.path.removeprefix("/api/kits/").removesuffix("/scene"))
+    except ClientError as e:
+        statusCode = 400
+        error = e
+    except Exception as e:
+        statusCode = 500
+        error = e
+    return fastapi.Response(content=str(error), status_code=statusCode)
+
+
+@rest.get("/kits/{encodedKitUri}/designs/{encodedDesignNameAndVariantAndView}/scene/flat")
+async def design_scene_flat(
+    request: fastapi.Request,
+    encodedKitUri: ENCODED_PATH,
+    encodedDesignNameAndVariantAndView: ENCODED_NAME_AND_VARIANT_AND_VIEW_PATH,
+) -> FlatSceneOutput:
+    try:
+        return getFlatScene(request.url.path.removeprefix("/api/kits/").removesuffix("/scene/flat"))
+    except ClientError as e:
+        statusCode = 400
+        error = e
+    except Exception as e:
+        statusCode = 500
+        error = e
+    return fastapi.Response(content=str(error), status_code=statusCode)
+
+
+@rest.get("/kits/{encodedKitUri}/designs/{encodedDesignNameAndVariantAndView}/scene/clashes")
+async def design_scene_clashes(
+    request: fastapi.Request,
+    encodedKitUri: ENCODED_PATH,
+    encodedDesignNameAndVariantAndView: ENCODED_NAME_AND_VARIANT_AND_VIEW_PATH,
+) -> ClashesOutput:
+    try:
+        return getClashes(request.url.path.removeprefix("/api/kits/").removesuffix("/scene/clashes"))
+    except ClientError as e:
+        statusCode = 400
+        error = e
+    except Exception as e:
+        statusCode = 500
+        error = e
+    return fastapi.Response(content=str(error), status_code=statusCode)
+
+
+@rest.get("/kits/{encodedKitUri}/designs/{encodedDesignNameAndVariantAndView}/representations")
+async def design_representations(
+    request: fastapi.Request,
+    encodedKitUri: ENCODED_PATH,
+    encodedDesignNameAndVariantAndView: ENCODED_NAME_AND_VARIANT_AND_VIEW_PATH,
+    tags: str = "",
+) -> RepresentationUrlsOutput:
+    try:
+        return getRepresentationUrls(request.url.path.removeprefix("/api/kits/").removesuffix("/representations"), decodeList(tags) if tags else [])
+    except ClientError as e:
+        statusCode = 400
+        error = e
+    except Exception as e:
+        statusCode = 500
+        error = e
+    return fastapi.Response(content=str(error), status_code=statusCode)
+
+
+@rest.get("/kits/{encodedKitUri}/designs/{encodedDesignNameAndVariantAndView}/scene/nearest")
+async def design_scene_nearest(
+    request: fastapi.Request,
+    encodedKitUri: ENCODED_PATH,
+    encodedDesignNameAndVariantAndView: ENCODED_NAME_AND_VARIANT_AND_VIEW_PATH,
+    x: float,
+    y: float,
+    z: float,
+    count: int = 1,
+) -> SpatialQueryOutput:
+    try:
+        return getNearestPieces(request.url.path.removeprefix("/api/kits/").removesuffix("/scene/nearest"), Point(x, y, z), count)
+    except ClientError as e:
+        statusCode = 400
+        error = e
+    except Exception as e:
+        statusCode = 500
+        error = e
+    return fastapi.Response(content=str(error), status_code=statusCode)
+
+
+@rest.get("/kits/{encodedKitUri}/designs/{encodedDesignNameAndVariantAndView}/scene/radius")
+async def design_scene_radius(
+    request: fastapi.Request,
+    encodedKitUri: ENCODED_PATH,
+    encodedDesignNameAndVariantAndView: ENCODED_NAME_AND_VARIANT_AND_VIEW_PATH,
+    x: float,
+    y: float,
+    z: float,
+    radius: float,
+) -> SpatialQueryOutput:
+    try:
+        return getPiecesInRadius(request.url.path.removeprefix("/api/kits/").removesuffix("/scene/radius"), Point(x, y, z), radius)
+    except ClientError as e:
+        statusCode = 400
+        error = e
+    except Exception as e:
+        statusCode = 500
+        error = e
+    return fastapi.Response(content=str(error), status_code=statusCode)
+
+
+@rest.get("/kits/{encodedKitUri}/designs/{encodedDesignNameAndVariantAndView}/scene/box")
+async def design_scene_box(
+    request: fastapi.Request,
+    encodedKitUri: ENCODED_PATH,
+    encodedDesignNameAndVariantAndView: ENCODED_NAME_AND_VARIANT_AND_VIEW_PATH,
+    minX: float,
+    minY: float,
+    minZ: float,
+    maxX: float,
+    maxY: float,
+    maxZ: float,
+) -> SpatialQueryOutput:
+    try:
+        return getPiecesInBox(request.url.path.removeprefix("/api/kits/").removesuffix("/scene/box"), Point(minX, minY, minZ), Point(maxX, maxY, maxZ))
+    except ClientError as e:
+        statusCode = 400
+        error = e
+    except Exception as e:
+        statusCode = 500
+        error = e
+    return fastapi.Response(content=str(error), status_code=statusCode)
+
+
 @rest.delete("/kits/{encodedKitUri}/designs/{encodedDesignNameAndVariantAndView}")
 async def delete_design(
     request: fastapi.Request,
@@ -4644,6 +8032,21 @@ async def delete_design(
     return fastapi.Response(content=str(error), status_code=statusCode)
 
 
+async def cancelOnDisconnect(request: fastapi.Request, coroutine: typing.Awaitable) -> typing.Any:
+    """🔌 Await a coroutine and cancel it as soon as the client disconnects. A disconnect raises `ClientDisconnected`."""
+    task = asyncio.ensure_future(coroutine)
+    try:
+        while not task.done():
+            await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if not task.done() and await request.is_disconnected():
+                task.cancel()
+                await asyncio.wait({task})
+                raise ClientDisconnected()
+        return await task
+    finally:
+        task.cancel()
+
+
 @rest.get("/assistant/predictDesign")
 async def predict_design(
     request: fastapi.Request,
@@ -4652,7 +8055,69 @@ async def predict_design(
     design: DesignContext | None = None,
 ) -> DesignPrediction:
     try:
-        return predictDesign(description, types, design)
+        return await cancelOnDisconnect(request, predictDesignAsync(description, types, design))
+    except ClientError as e:
+        statusCode = 400
+        error = e
+    except Exception as e:
+        statusCode = 500
+        error = e
+    return fastapi.Response(content=str(error), status_code=statusCode)
+
+
+@rest.get("/assistant/streamDesign")
+async def stream_design(
+    request: fastapi.Request,
+    description: str = fastapi.Body(...),
+    types: list[TypeContext] = fastapi.Body(...),
+    design: DesignContext | None = None,
+) -> fastapi.responses.StreamingResponse:
+    async def lines():
+        events = streamDesign(description, types, design)
+        try:
+            async for event in events:
+                if await request.is_disconnected():
+                    break
+                yield json.dumps(event) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": str(e)}) + "\n"
+        finally:
+            await events.aclose()
+
+    return fastapi.responses.StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@rest.get("/assistant/predictDesigns")
+async def predict_designs(
+    request: fastapi.Request,
+    descriptions: list[str] = fastapi.Body(...),
+    types: list[TypeContext] = fastapi.Body(...),
+    design: DesignContext | None = None,
+    concurrency: int = PREDICTION_CONCURRENCY,
+) -> fastapi.responses.StreamingResponse:
+    if len(descriptions) > DESCRIPTIONS_MAX:
+        return fastapi.Response(content=str(CollectionTooLarge("descriptions", DESCRIPTIONS_MAX)), status_code=413)
+
+    async def lines():
+        results = predictDesigns(descriptions, types, design, concurrency=max(1, min(concurrency, PREDICTION_CONCURRENCY)))
+        try:
+            async for index, result in results:
+                if await request.is_disconnected():
+                    break
+                if isinstance(result, Exception):
+                    yield json.dumps({"index": index, "error": str(result)}) + "\n"
+                else:
+                    yield json.dumps({"index": index, "design": result.model_dump(mode="json")}) + "\n"
+        finally:
+            await results.aclose()
+
+    return fastapi.responses.StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@rest.get("/assistant/metrics")
+async def prediction_metrics(request: fastapi.Request) -> PredictionMetricsOutput:
+    try:
+        return predictionMetrics.dump()
     except ClientError as e:
         statusCode = 400
         error = e
@@ -4822,8 +8287,8 @@ def restart_engine():
 
 
 def run():
-    logger.debug("Starting engine")
     multiprocessing.freeze_support()  # needed for pyinstaller on Windows
+    logger.debug("Starting engine")
 
     parser = argparse.ArgumentParser(description="semio ⋅ engine")
     parser.add_argument("-d", "--debug", help="debug mode", action="store_true")
@@ -4889,6 +8354,7 @@ def dev():
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # frozen workers of the parse pool start here and must not run the engine
     run()
 
 # endregion Engine
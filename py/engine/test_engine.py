@@ -1,6 +1,14 @@
+import asyncio
+import http.server
+import json
+import os
+import threading
+import time
 import pytest
 import graphene
 import deepdiff
+import fastapi.testclient
+import numpy
 import engine
 
 
@@ -54,6 +62,993 @@ def test_planeFromYAxis(yAxis, phi, expectedXAxis):
     assert plane.isClose(expectedPlane)
 
 
+def test_planesFromYAxes():
+    yAxes = [[0.0, 1.0, 0.0], [0, 0.866025, -0.5], [0.707107, -0.612372, 0.353553], [0, -1, 0], [0, 0, 1]]
+    thetas = [135, 45, 45, 30, 0]
+    origins = numpy.arange(15, dtype=float).reshape(5, 3)
+    planes = engine.planesFromYAxes(yAxes, thetas, origins)
+    expected = numpy.array(
+        [
+            [[p.origin.x, p.origin.y, p.origin.z], [p.xAxis.x, p.xAxis.y, p.xAxis.z], [p.yAxis.x, p.yAxis.y, p.yAxis.z]]
+            for p in (engine.Plane.fromYAxis(engine.Vector(*y), t, engine.Point(*o)) for y, t, o in zip(yAxes, thetas, origins.tolist()))
+        ]
+    )
+    assert engine.arePlanesClose(planes, expected).all()
+    assert not engine.arePlanesClose(planes, expected + [[0, 0, 0], [0, 0, 0], [0, 0, 2 * engine.TOLERANCE]]).any()
+    with pytest.raises(engine.VectorNotNormalized):
+        engine.planesFromYAxes([[0, 2, 0]])
+
+
+WORLD_PLANE = {"origin": {"x": 0, "y": 0, "z": 0}, "xAxis": {"x": 1, "y": 0, "z": 0}, "yAxis": {"x": 0, "y": 1, "z": 0}}
+
+BEAM = {
+    "name": "Beam",
+    "ports": [
+        {"id_": "bottom", "point": {"x": 0, "y": 0, "z": 0}, "direction": {"x": 0, "y": -1, "z": 0}},
+        {"id_": "top", "point": {"x": 0, "y": 1, "z": 0}, "direction": {"x": 0, "y": 1, "z": 0}},
+    ],
+}
+
+
+def columnDesignInput(pieces: int, gap: float = 0.0, rotation: float = 0.0) -> dict:
+    """🏛️ A column of beams that are stacked on top of each other and start from a fixed beam on the world plane."""
+    return {
+        "name": "Column",
+        "pieces": [{"id_": f"b{i}", "type": {"name": "Beam"}, "plane": WORLD_PLANE if i == 0 else None} for i in range(pieces)],
+        "connections": [
+            {
+                "connected": {"piece": {"id_": f"b{i}"}, "port": {"id_": "top"}},
+                "connecting": {"piece": {"id_": f"b{i + 1}"}, "port": {"id_": "bottom"}},
+                "gap": gap,
+                "rotation": rotation,
+            }
+            for i in range(pieces - 1)
+        ],
+    }
+
+
+def columnDesign(pieces: int, gap: float = 0.0, rotation: float = 0.0) -> engine.Design:
+    return engine.Design.parse(columnDesignInput(pieces, gap, rotation), [engine.Type.parse(BEAM)])
+
+
+REPRESENTED_BEAM = {**BEAM, "representations": [{"url": "beam.json", "tags": []}, {"url": "beam-low.glb", "tags": ["low", "glb"]}]}
+
+
+def putColumnKit(path, pieces: int = 3, gap: float = 0.0, beam: dict = BEAM) -> str:
+    """🏛️ Put a local kit with the beam type and a column design and return the code of the kit."""
+    kit = engine.encode(str(path))
+    engine.put(kit, engine.KitInput.model_validate({"name": "Columns", "types": [beam], "designs": [columnDesignInput(pieces, gap)]}))
+    return kit
+
+
+@pytest.mark.parametrize(
+    "direction",
+    [
+        pytest.param((0, 0, 1), id="along z"),
+        pytest.param((0, 0, -1), id="against z"),
+        pytest.param((1, 0, 0), id="along x"),
+        pytest.param((0, 1, 0), id="along y"),
+        pytest.param((1, 2, 3), id="oblique"),
+    ],
+)
+def test_transformFromOppositeDirections(direction):
+    start = engine.Vector(*direction).normalize()
+    transform = engine.Transform.fromDirections(start, start.revert())
+    assert transform.transformVector(start).isClose(start.revert())
+    assert numpy.allclose(transform.rotation @ transform.rotation.T, numpy.eye(3))
+
+
+def test_scene():
+    scene = engine.Scene(columnDesign(3, gap=0.5, rotation=90))
+    assert scene.depths == {"b0": 0, "b1": 1, "b2": 2}
+    assert scene.plane("b1").isClose(engine.Plane(engine.Point(0, 1.5, 0), engine.Vector(0, 0, 1), engine.Vector(0, 1, 0)))
+    assert scene.plane("b2").isClose(engine.Plane(engine.Point(0, 3, 0), engine.Vector(-1, 0, 0), engine.Vector(0, 1, 0)))
+
+
+TOWER = {
+    "name": "Tower",
+    "pieces": [{"id_": "c0", "designPiece": {"name": "Column"}, "plane": WORLD_PLANE}, {"id_": "c1", "designPiece": {"name": "Column"}}],
+    "connections": [
+        {
+            "connected": {"piece": {"id_": "c0"}, "designPiece": {"id_": "b1"}, "port": {"id_": "top"}},
+            "connecting": {"piece": {"id_": "c1"}, "designPiece": {"id_": "b0"}, "port": {"id_": "bottom"}},
+            "gap": 0.5,
+        }
+    ],
+}
+
+
+def test_sceneNestedDesigns():
+    column = columnDesign(2)
+    beam = column.pieces[0].type
+    tower = engine.Design.parse(TOWER, [beam], {"Column": {"": {"": column}}})
+    flattener = engine.DesignFlattener()
+    instance = engine.Scene(tower, flattener).instance()
+    assert instance.paths == [("c0", "b0"), ("c0", "b1"), ("c1", "b0"), ("c1", "b1")]
+    assert numpy.allclose(instance.transforms[:, 1, 3], [0, 1, 2.5, 3.5], atol=engine.TOLERANCE)
+    assert len(flattener.instances) == 1
+    tower.pieces[1].designPiece = tower
+    with pytest.raises(engine.DesignNestingCycle):
+        engine.Scene(tower)
+
+
+def test_portFrames(tmp_path):
+    kit = putColumnKit(tmp_path)
+    ids, frames = engine.getPortFrames(kit)
+    assert ids == [("Beam", "", "bottom"), ("Beam", "", "top")]
+    assert numpy.allclose(frames, [[[0, 0, 0], [0, -1, 0]], [[0, 1, 0], [0, 1, 0]]])
+    frames[1, 0] = [0, 2, 0]
+    engine.putPortFrames(kit, ids, frames)
+    assert numpy.allclose(engine.getPortFrames(kit)[1], frames)
+    with pytest.raises(engine.ArrayShapeNotValid):
+        engine.putPortFrames(kit, ids, frames[:1])
+    with pytest.raises(engine.PortsNotFound):
+        engine.putPortFrames(kit, [("Beam", "", "side")], frames[:1])
+
+
+def test_piecePlanes(tmp_path):
+    design = f"{putColumnKit(tmp_path)}/designs/{engine.encode('Column')},,"
+    ids, planes, centers = engine.getPiecePlanes(design)
+    assert ids == ["b0", "b1", "b2"]
+    assert numpy.allclose(planes[0], [[0, 0, 0], [1, 0, 0], [0, 1, 0]])
+    assert numpy.isnan(planes[1:]).all() and numpy.isnan(centers).all()
+    planes[0, 0] = [1, 0, 0]
+    planes[1] = [[0, 5, 0], [1, 0, 0], [0, 1, 0]]
+    engine.putPiecePlanes(design, ids, planes, [[0, 0], [1, 1], [numpy.nan, 2]])
+    _, newPlanes, newCenters = engine.getPiecePlanes(design)
+    assert numpy.allclose(newPlanes[:2], planes[:2]) and numpy.isnan(newPlanes[2]).all()
+    assert numpy.allclose(newCenters[:2], [[0, 0], [1, 1]]) and numpy.isnan(newCenters[2]).all()
+    with pytest.raises(engine.ArrayShapeNotValid):
+        engine.putPiecePlanes(design, ids, planes[:, :2])
+    with pytest.raises(engine.ArrayShapeNotValid):
+        engine.putPiecePlanes(design, ids, planes, [[0, 0]])
+    with pytest.raises(engine.PiecesNotFound):
+        engine.putPiecePlanes(design, ["b9"], planes[:1])
+
+
+def test_kitParseInParallel():
+    kit = {
+        "uri": "columns",
+        "name": "Columns",
+        "types": [BEAM, {**BEAM, "variant": "steel"}],
+        "designs": [columnDesignInput(3, gap=0.5), {**columnDesignInput(2, rotation=90), "variant": "short"}],
+    }
+    sequential = engine.Kit.parse(kit, 1).dump().model_dump(mode="json")
+    parallel = engine.Kit.parse(kit, 2).dump().model_dump(mode="json")
+    assert deepdiff.DeepDiff(sequential, parallel, exclude_regex_paths=[r"\['(created|updated)_at'\]"]) == {}
+    pool = engine.parsePool(2)
+    again = engine.Kit.parse(kit, 2).dump().model_dump(mode="json")
+    assert engine.parsePool(2) is pool
+    assert deepdiff.DeepDiff(parallel, again, exclude_regex_paths=[r"\['(created|updated)_at'\]"]) == {}
+
+
+def test_sceneCache(tmp_path):
+    design = f"{putColumnKit(tmp_path, gap=0.5)}/designs/{engine.encode('Column')},,"
+    store, _ = engine.storeAndOperationFromCode(design)
+    assert engine.storeAndOperationFromCode(design)[0] is store
+    first = engine.getScene(design)
+    (scene,) = store.scenes.scenes.values()
+    assert engine.getScene(design) == first
+    engine.putPiecePlanes(design, ["b0"], [[[0, 10, 0], [1, 0, 0], [0, 1, 0]]])
+    moved = engine.getScene(design)
+    assert [s is scene for s in store.scenes.scenes.values()] == [True]
+    assert [p.plane.origin.y for p in moved.pieces] == pytest.approx([10, 11.5, 13])
+
+
+@pytest.mark.parametrize("method", ["put", "stream", "parallel"])
+def test_kitNestedDesigns(tmp_path, method):
+    # The tower comes first to check that designs are parsed after the designs that they use.
+    kit = {"name": "Towers", "types": [BEAM], "designs": [TOWER, columnDesignInput(2)]}
+    code = engine.encode(str(tmp_path))
+    match method:
+        case "put":
+            engine.put(code, engine.KitInput.model_validate(kit))
+            output = engine.get(code).dump()
+        case "stream":
+            streamKit(code, kit)[0].close()
+            output = engine.get(code).dump()
+        case "parallel":
+            output = engine.Kit.parse({**kit, "uri": str(tmp_path)}, 2).dump()
+    assert [d.name for d in output.designs] == ["Tower", "Column"]
+    assert [p.designPiece.name for p in output.designs[0].pieces] == ["Column", "Column"]
+    assert [(c.connected.designPiece.id_, c.connecting.designPiece.id_) for c in output.designs[0].connections] == [("b1", "b0")]
+    roundTrip = engine.Kit.parse(output.model_dump()).dump()
+    assert deepdiff.DeepDiff(output.model_dump(mode="json"), roundTrip.model_dump(mode="json"), exclude_regex_paths=[r"\['(created|updated)_at'\]"]) == {}
+
+
+def test_kitNestedDesignsNotValid():
+    with pytest.raises(engine.DesignNotFound):
+        engine.Kit.parse({"uri": "towers", "name": "Towers", "types": [BEAM], "designs": [TOWER]})
+    selfNested = {"name": "Column", "pieces": [{"id_": "c0", "designPiece": {"name": "Column"}}]}
+    with pytest.raises(engine.DesignNestingCycle):
+        engine.Kit.parse({"uri": "towers", "name": "Towers", "types": [BEAM], "designs": [selfNested]})
+
+
+@pytest.mark.parametrize(
+    "tags, expectedUrl",
+    [
+        pytest.param([], "beam.json", id="no tags"),
+        pytest.param(["glb"], "beam-high.glb", id="tie"),
+        pytest.param(["low", "glb"], "beam-low.glb", id="exact"),
+        pytest.param(["ifc"], "beam.json", id="no match"),
+    ],
+)
+def test_findRepresentation(tags, expectedUrl):
+    representations = [
+        engine.Representation.parse({"url": "beam.json", "tags": []}),
+        engine.Representation.parse({"url": "beam-high.glb", "tags": ["high", "glb"]}),
+        engine.Representation.parse({"url": "beam-low.glb", "tags": ["low", "glb"]}),
+    ]
+    assert engine.findRepresentation(representations, tags).url == expectedUrl
+
+
+def test_representationCache(tmp_path):
+    kit = putColumnKit(tmp_path, beam=REPRESENTED_BEAM)
+    design = f"{kit}/designs/{engine.encode('Column')},,"
+    store, _ = engine.storeAndOperationFromCode(design)
+    assert [r.url for r in engine.getRepresentationUrls(design, ["glb"]).representations] == ["beam-low.glb"]
+    (urls,) = store.representations.urls.values()
+    assert [r.url for r in engine.getRepresentationUrls(design, []).representations] == ["beam.json"]
+    assert [u is urls for u in store.representations.urls.values()] == [True]
+    engine.put(f"{kit}/types/{engine.encode('Beam')},", engine.TypeInput.model_validate({**BEAM, "representations": [{"url": "beam-high.glb", "tags": ["glb"]}]}))
+    assert [r.url for r in engine.getRepresentationUrls(design, ["glb"]).representations] == ["beam-high.glb"]
+
+
+@pytest.mark.parametrize(
+    "mutate, expectedTags",
+    [
+        pytest.param(lambda r: r.tags_.append(engine.Tag(name="c", order=-1)), ["c", "a", "b"], id="append"),
+        pytest.param(lambda r: r.tags_.remove(r.tags_[0]), ["b"], id="remove"),
+        pytest.param(lambda r: setattr(r, "tags", ["x", "y", "z"]), ["x", "y", "z"], id="bulk replace"),
+        pytest.param(lambda r: setattr(r.tags_[0], "name", "d"), ["d", "b"], id="child name"),
+        pytest.param(lambda r: setattr(r.tags_[0], "order", 2), ["b", "a"], id="child order"),
+    ],
+)
+def test_orderedNames(mutate, expectedTags):
+    representation = engine.Representation.parse({"url": "beam.glb", "tags": ["a", "b"]})
+    assert representation.tags == ["a", "b"]
+    mutate(representation)
+    assert representation.tags == expectedTags
+
+
+def test_portCompatibleFamilies():
+    port = engine.Port.parse({"id_": "top", "compatibleFamilies": ["b", "a", "c"], "point": {"x": 0, "y": 0, "z": 0}, "direction": {"x": 0, "y": 1, "z": 0}})
+    assert port.compatibleFamilies == ["b", "a", "c"]
+    port.compatibleFamilies_[0].order = 3
+    assert port.compatibleFamilies == ["a", "c", "b"]
+
+
+@pytest.mark.parametrize("gap, expectedClashes", [pytest.param(0, [], id="touching"), pytest.param(-0.5, [(("b0",), ("b1",)), (("b1",), ("b2",))], id="overlapping")])
+def test_sceneClashes(gap, expectedClashes):
+    design = columnDesign(3, gap=gap, rotation=45)
+    design.pieces[0].type.representations = [engine.Representation.parse({"url": "beam.glb", "attributes": [{"name": "bounds", "value": "-0.1,0,-0.1,0.1,1,0.1"}]})]
+    assert engine.Scene(design).clashes() == expectedClashes
+
+
+def test_designGraph():
+    design = columnDesign(4)
+    design.connections.append(engine.Connection(connectedPiece=design.pieces[3], connectingPiece=design.pieces[1]))
+    graph = engine.DesignGraph(design)
+    assert graph.neighbors[graph.offsets[1] : graph.offsets[2]].tolist() == [0, 2, 3]
+    assert graph.neighborEdges[graph.offsets[1] : graph.offsets[2]].tolist() == [0, 1, 3]
+    assert graph.components().tolist() == [0, 0, 0, 0]
+    forest = graph.spanningForest()
+    assert forest.roots == [0]
+    assert forest.parents.tolist() == [-1, 0, 1, 1]
+    assert forest.parentEdges.tolist() == [-1, 0, 1, 3]
+    assert forest.depths.tolist() == [0, 1, 2, 2]
+    assert forest.redundantEdges == [2]
+    assert graph.spanningForest([2]).redundantEdges == [3]
+
+
+def test_sceneUpdate():
+    design = columnDesign(4, gap=0.5, rotation=90)
+    scene = engine.Scene(design)
+    design.connections[1].gap = 2
+    design.connections[1].tilt = 30
+    scene.invalidate("b2")
+    scene.update()
+    assert numpy.allclose(scene.transforms, engine.Scene(design).transforms, atol=engine.TOLERANCE)
+    assert scene.stale == set()
+
+
+def test_sceneSpatialIndex():
+    scene = engine.Scene(columnDesign(3, gap=0.5))
+    assert scene.nearest(engine.Point(0, 2.9, 0), 2) == ["b2", "b1"]
+    assert scene.radius(engine.Point(0, 1.2, 0), 0.25) == ["b0"]
+    assert scene.box(engine.Point(-1, 0.5, -1), engine.Point(1, 1.6, 1)) == ["b0", "b1"]
+    scene.design.connections[0].gap = 2
+    scene.invalidate("b1")
+    scene.update()
+    assert scene.nearest(engine.Point(0, 2.9, 0), 2) == ["b1", "b2"]
+
+
+def test_spatialIndex():
+    rng = numpy.random.default_rng(0)
+    minima = rng.uniform(-10, 10, (200, 3))
+    bounds = numpy.stack([minima, minima + rng.exponential(1, (200, 3))], axis=1)
+    index = engine.SpatialIndex(bounds)
+    point = numpy.array([1.0, -2.0, 3.0])
+    distances = engine.boundsDistances(bounds, point)
+    order = numpy.lexsort((numpy.arange(200), distances))
+    assert index.nearest(point, 5) == order[:5].tolist()
+    assert index.radius(point, 2.5) == [i for i in order.tolist() if distances[i] <= 2.5]
+    overlaps = ((bounds[:, 0] <= point + 4) & (bounds[:, 1] >= point)).all(axis=1)
+    assert index.box(point, point + 4) == numpy.flatnonzero(overlaps).tolist()
+    moved = bounds.copy()
+    moved[:10] += 50
+    index.move(list(range(10)), moved[:10])
+    farPoint = numpy.array([55.0, 48.0, 53.0])
+    assert index.nearest(farPoint, 5) == engine.SpatialIndex(moved, index.cellSize).nearest(farPoint, 5)
+
+
+@pytest.mark.parametrize("distance", [100, 1000, 10000, 1e9])
+def test_spatialIndexFarAway(distance):
+    rng = numpy.random.default_rng(0)
+    minima = rng.uniform(0, 40, (50, 3))
+    bounds = numpy.stack([minima, minima + rng.uniform(1, 5, (50, 3))], axis=1)
+    index = engine.SpatialIndex(bounds)
+    point = numpy.full(3, float(distance))
+    order = numpy.lexsort((numpy.arange(50), engine.boundsDistances(bounds, point)))
+    start = time.perf_counter()
+    assert index.nearest(point, 3) == order[:3].tolist()
+    assert time.perf_counter() - start < 0.1
+
+
+def test_spatialQueryCache(tmp_path):
+    design = f"{putColumnKit(tmp_path, gap=0.5)}/designs/{engine.encode('Column')},,"
+    store, _ = engine.storeAndOperationFromCode(design)
+    assert [p.id_ for p in engine.getNearestPieces(design, engine.Point(0, 2.9, 0), 2).pieces] == ["b2", "b1"]
+    (scene,) = store.scenes.scenes.values()
+    index = scene.spatialIndex
+    engine.putPiecePlanes(design, ["b0"], [[[0, 10, 0], [1, 0, 0], [0, 1, 0]]])
+    assert [p.id_ for p in engine.getNearestPieces(design, engine.Point(0, 2.9, 0), 1).pieces] == ["b0"]
+    assert scene.spatialIndex is index
+
+
+def test_portCompatibilityIndex():
+    def type(name, ports):
+        return engine.Type.parse(
+            {
+                "name": name,
+                "ports": [
+                    {"id_": id_, "family": family, "compatibleFamilies": compatibleFamilies, "point": {"x": 0, "y": 0, "z": 0}, "direction": {"x": 0, "y": 1, "z": 0}}
+                    for id_, family, compatibleFamilies in ports
+                ],
+            }
+        )
+
+    index = engine.PortCompatibilityIndex(
+        [type("Column", [("top", "pin", []), ("bottom", "hole", ["pin"])]), type("Joint", [("any", "", []), ("plug", "plug", []), ("pair", "pair", ["pair"])])]
+    )
+    assert index.compatibles(("Column", "", "top")) == [("Column", "", "bottom"), ("Joint", "", "any")]
+    assert index.compatibles(("Joint", "", "plug")) == [("Joint", "", "any")]
+    assert index.compatibles(("Joint", "", "any")) == sorted(index.families)
+    assert index.compatibles(("Joint", "", "pair")) == [("Joint", "", "any"), ("Joint", "", "pair")]
+    assert index.areCompatible(("Joint", "", "pair"), ("Joint", "", "pair"))
+    assert not index.areCompatible(("Joint", "", "plug"), ("Joint", "", "plug"))
+    index.update(type("Joint", [("plug", "plug", ["hole"])]))
+    assert index.compatibles(("Column", "", "bottom")) == [("Column", "", "top"), ("Joint", "", "plug")]
+    assert not index.areCompatible(("Column", "", "top"), ("Joint", "", "plug"))
+
+
+def test_portCompatibilityCache(tmp_path):
+    kit = putColumnKit(tmp_path)
+    beam = f"{kit}/types/{engine.encode('Beam')},"
+    store, operation = engine.storeAndOperationFromCode(beam)
+    assert [(p.type.name, p.port.id_) for p in engine.getCompatiblePorts(beam, "top").ports] == [("Beam", "bottom"), ("Beam", "top")]
+    index = store.portCompatibilities.get(store.kitOrNotFound(operation["kitUri"]))
+    joint = {"name": "Joint", "ports": [{"id_": "pin", "family": "pin", "point": {"x": 0, "y": 0, "z": 0}, "direction": {"x": 0, "y": 1, "z": 0}}]}
+    engine.put(f"{kit}/types/{engine.encode('Joint')},", engine.TypeInput.model_validate(joint))
+    assert [(p.type.name, p.port.id_) for p in engine.getCompatiblePorts(beam, "top").ports] == [("Beam", "bottom"), ("Beam", "top"), ("Joint", "pin")]
+    assert store.portCompatibilities.get(store.kitOrNotFound(operation["kitUri"])) is index
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        pytest.param("bottom", "bottom", id="exact"),
+        pytest.param("botom", "bottom", id="deletion"),
+        pytest.param("Top", "top", id="case"),
+        pytest.param("left", None, id="no match"),
+    ],
+)
+def test_fuzzyIndex(query, expected):
+    assert engine.FuzzyIndex(["top", "bottom", "side"]).closest(query) == expected
+
+
+def test_healDesign():
+    port = {"point": {"x": 0, "y": 0, "z": 0}, "direction": {"x": 0, "y": 1, "z": 0}}
+    types = [engine.TypeContext.model_validate({"name": "Column", "variant": variant, "ports": [{"id_": "top", **port}, {"id_": "bottom", **port}]}) for variant in ["", "steel"]]
+    connection = {"gap": 0, "shift": 0, "rise": 0, "rotation": 0, "turn": 0, "tilt": 0, "x": 0, "y": 0}
+    design = engine.decodeDesign(
+        {
+            "pieces": [{"id": "c1", "typeName": "Colum", "typeVariant": "DEFAULT"}, {"id": "c2", "typeName": "Column", "typeVariant": "stel"}],
+            "connections": [
+                {"connectedPieceId": "c1", "connectedPieceTypePortId": "tpo", "connectingPieceId": "c22", "connectingPieceTypePortId": "botom", **connection},
+                {"connectedPieceId": "c1", "connectedPieceTypePortId": "top", "connectingPieceId": "zz", "connectingPieceTypePortId": "bottom", **connection},
+            ],
+        }
+    )
+    healed = engine.healDesign(design, types)
+    assert [(p.id_, p.type.name, p.type.variant) for p in healed.pieces] == [("c1", "Column", ""), ("c2", "Column", "steel")]
+    assert [(c.connected.piece.id_, c.connected.port.id_, c.connecting.piece.id_, c.connecting.port.id_) for c in healed.connections] == [("c1", "top", "c2", "bottom")]
+
+
+@pytest.mark.parametrize(
+    "ids",
+    [
+        pytest.param(("c1", "c2", "b1"), id="short"),
+        pytest.param(("column1", "column2", "column3"), id="similar"),
+    ],
+)
+def test_healDesignWithoutSimilarTypes(ids):
+    port = {"point": {"x": 0, "y": 0, "z": 0}, "direction": {"x": 0, "y": 1, "z": 0}}
+    types = [engine.TypeContext.model_validate({"name": "Column", "ports": [{"id_": "top", **port}, {"id_": "bottom", **port}]})]
+    connection = {"gap": 0, "shift": 0, "rise": 0, "rotation": 0, "turn": 0, "tilt": 0, "x": 0, "y": 0}
+    first, second, banana = ids
+    design = engine.decodeDesign(
+        {
+            "pieces": [{"id": id_, "typeName": typeName, "typeVariant": "DEFAULT"} for id_, typeName in [(first, "Column"), (second, "Colum"), (banana, "Banana")]],
+            "connections": [
+                {"connectedPieceId": first, "connectedPieceTypePortId": "top", "connectingPieceId": second, "connectingPieceTypePortId": "bottom", **connection},
+                {"connectedPieceId": second, "connectedPieceTypePortId": "top", "connectingPieceId": banana, "connectingPieceTypePortId": "bottom", **connection},
+            ],
+        }
+    )
+    healed = engine.healDesign(design, types)
+    assert [(p.id_, p.type.name) for p in healed.pieces] == [(first, "Column"), (second, "Column")]
+    assert [(c.connected.piece.id_, c.connecting.piece.id_) for c in healed.connections] == [(first, second)]
+    healed = engine.healDesign(design, [])
+    assert (healed.pieces, healed.connections) == ([], [])
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        pytest.param("Columm", ("Column", ""), id="typo"),
+        pytest.param("Column Steel", ("Column", "steel"), id="variant"),
+        pytest.param("Floor", ("Slab", ""), id="description"),
+        pytest.param("Banana", None, id="no match"),
+    ],
+)
+def test_typeEmbeddingIndex(query, expected):
+    types = [
+        engine.TypeContext.model_validate({"name": "Column", "description": "A vertical wooden post."}),
+        engine.TypeContext.model_validate({"name": "Column", "variant": "steel", "description": "A vertical steel post."}),
+        engine.TypeContext.model_validate({"name": "Slab", "description": "A concrete floor plate."}),
+    ]
+    index = engine.typeEmbeddingIndex(types)
+    assert engine.typeEmbeddingIndex([t.model_copy(deep=True) for t in types]) is index
+    assert index.nearest([query]) == [expected]
+    assert engine.typeEmbeddingIndex([]).nearest([query]) == [None]
+
+
+def test_renderTypesPrompt():
+    types = [engine.TypeContext.model_validate({"name": "Column", "description": "A column."})]
+    prompt = engine.renderTypesPrompt(types)
+    assert engine.renderTypesPrompt([t.model_copy(deep=True) for t in types]) is prompt
+    types[0].description = "A round column."
+    assert "A round column." in engine.renderTypesPrompt(types)
+    assert engine.renderPrompt("A tower.", types).endswith("A tower.")
+
+
+def test_predictionCache(tmp_path):
+    design = engine.decodeDesign({"pieces": [{"id": "c1", "typeName": "Column", "typeVariant": "DEFAULT"}], "connections": []})
+    cache = engine.PredictionCache(str(tmp_path), ttl=60, sizeMax=1024 * 1024)
+    assert cache.get("a") is None
+    cache.put("a", "gpt-4o", "{}", design)
+    assert cache.get("a") == design
+    cache.sizeMax = cache.path("a").stat().st_size + 64
+    older = cache.path("a").stat().st_mtime - 10
+    os.utime(cache.path("a"), (older, older))
+    cache.put("b", "gpt-4o", "{}", design)
+    assert cache.get("a") is None
+    assert cache.get("b") == design
+    cache.ttl = 0
+    assert cache.get("b") is None
+
+
+@pytest.mark.parametrize(
+    "entry",
+    [
+        pytest.param("[]", id="not an object"),
+        pytest.param('{"design": {}}', id="no created"),
+        pytest.param('{"created": 1e12, "design": {"pieces": 5}}', id="design not valid"),
+    ],
+)
+def test_predictionCacheEntryNotValid(tmp_path, entry):
+    cache = engine.PredictionCache(str(tmp_path), ttl=1e12)
+    cache.path("a").write_text(entry, encoding="utf-8")
+    assert cache.get("a") is None
+
+
+def test_predictionCacheEvictedWhileRead(tmp_path, monkeypatch):
+    design = engine.decodeDesign({"pieces": [{"id": "c1", "typeName": "Column", "typeVariant": "DEFAULT"}], "connections": []})
+    cache = engine.PredictionCache(str(tmp_path), ttl=60)
+    cache.put("a", "gpt-4o", "{}", design)
+
+    def evicted(path, *args):
+        os.remove(path)
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr(engine.os, "utime", evicted)
+    assert cache.get("a") is None
+
+
+def test_predictionCacheSize(tmp_path, monkeypatch):
+    design = engine.decodeDesign({"pieces": [{"id": "c1", "typeName": "Column", "typeVariant": "DEFAULT"}], "connections": []})
+    cache = engine.PredictionCache(str(tmp_path), ttl=60, sizeMax=1024 * 1024)
+    evictions = []
+    evict = cache.evict
+    monkeypatch.setattr(cache, "evict", lambda: evictions.append(cache.size) or evict())
+    for key in "abc":
+        cache.put(key, "gpt-4o", "{}", design)
+    entrySize = cache.path("a").stat().st_size
+    assert evictions == []
+    assert cache.size == cache.scan()
+    cache.put("a", "gpt-4o", "{}", design)
+    assert cache.size == cache.scan()
+    cache.sizeMax = cache.size + entrySize // 2
+    cache.put("d", "gpt-4o", "{}", design)
+    assert len(evictions) == 1
+    assert cache.size == cache.scan()
+    assert len(list(tmp_path.glob("*.json"))) == 3
+
+    threads = [threading.Thread(target=cache.put, args=("e", "gpt-4o", "{}", design)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache.get("e") == design
+    assert list(tmp_path.glob("*.tmp")) == []
+
+
+PREDICTED_DESIGN = {
+    "pieces": [{"id": "c1", "typeName": "Column", "typeVariant": "DEFAULT"}, {"id": "c2", "typeName": "Column", "typeVariant": "DEFAULT"}],
+    "connections": [
+        {"connectedPieceId": "c1", "connectedPieceTypePortId": "top", "connectingPieceId": "c2", "connectingPieceTypePortId": "bottom", "gap": 0, "shift": 0, "rise": 0, "rotation": 0, "turn": 0, "tilt": 0, "x": 0, "y": 1}
+    ],
+}
+
+
+class MockCompletionHandler(http.server.BaseHTTPRequestHandler):
+    """A chat completion endpoint that always predicts the same design and streams it in small chunks."""
+
+    lock = threading.Lock()
+    active = 0
+    maxActive = 0
+    failures = 0
+    """The number of the next requests that fail with a server error."""
+    delay = 0.0
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        handler = MockCompletionHandler
+        with handler.lock:
+            handler.active += 1
+            handler.maxActive = max(handler.maxActive, handler.active)
+            fails = handler.failures > 0
+            handler.failures -= fails
+        try:
+            time.sleep(handler.delay)
+            if fails:
+                self.sendJson(500, {"error": {"message": "Mock failure.", "type": "server_error"}})
+            else:
+                self.complete(request)
+        finally:
+            with handler.lock:
+                handler.active -= 1
+
+    def complete(self, request):
+        content = json.dumps(PREDICTED_DESIGN)
+        if request.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            deltas = [({"content": content[i : i + 16]}, None) for i in range(0, len(content), 16)] + [({}, "stop")]
+            chunks = [{"choices": [{"index": 0, "delta": delta, "finish_reason": finishReason}]} for delta, finishReason in deltas]
+            if request.get("stream_options", {}).get("include_usage"):
+                chunks.append({"choices": [], "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}})
+            for chunk in chunks:
+                chunk = {"id": "mock", "object": "chat.completion.chunk", "created": 0, "model": request["model"], **chunk}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.write(b"data: [DONE]\n\n")
+            return
+        message = {"role": "assistant", "content": content, "refusal": None}
+        self.sendJson(
+            200,
+            {
+                "id": "mock",
+                "object": "chat.completion",
+                "created": 0,
+                "model": request["model"],
+                "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+            },
+        )
+
+    def sendJson(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def mockCompletionServer():
+    MockCompletionHandler.active = MockCompletionHandler.maxActive = MockCompletionHandler.failures = 0
+    MockCompletionHandler.delay = 0.0
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), MockCompletionHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def columnTypeContexts():
+    port = {"point": {"x": 0, "y": 0, "z": 0}, "direction": {"x": 0, "y": 1, "z": 0}}
+    return [engine.TypeContext.model_validate({"name": "Column", "ports": [{"id_": "top", **port}, {"id_": "bottom", **port}]})]
+
+
+@pytest.fixture
+def isolatedPredictionCache(tmp_path, monkeypatch):
+    cache = engine.PredictionCache(str(tmp_path / "predictions"))
+    monkeypatch.setattr(engine, "predictionCache", cache)
+    return cache
+
+
+@pytest.fixture
+def localProvider(mockCompletionServer):
+    return engine.LocalProvider(model="mock", baseUrl=mockCompletionServer)
+
+
+def collect(iterator) -> list:
+    """Run an async iterator to its end in a new event loop."""
+
+    async def gather():
+        return [item async for item in iterator]
+
+    return asyncio.run(gather())
+
+
+def test_predictDesignAsync(isolatedPredictionCache, localProvider):
+    design = asyncio.run(engine.predictDesignAsync("A column on a column.", columnTypeContexts(), provider=localProvider))
+    assert [p.id_ for p in design.pieces] == ["c1", "c2"]
+    assert [(c.connected.port.id_, c.connecting.port.id_) for c in design.connections] == [("top", "bottom")]
+
+
+def test_predictionHashesTypesOnce(isolatedPredictionCache, localProvider, monkeypatch):
+    monkeypatch.setattr(engine, "typesPrompts", engine.collections.OrderedDict())
+    monkeypatch.setattr(engine, "PREDICTION_TYPE_FILTER", True)
+    hashes = []
+    typesHash = engine.typesHash
+    monkeypatch.setattr(engine, "typesHash", lambda types: hashes.append(len(types)) or typesHash(types))
+    asyncio.run(engine.predictDesignAsync("A column on a column.", columnTypeContexts(), provider=localProvider))
+    collect(engine.streamDesign("Two columns.", columnTypeContexts(), provider=localProvider))
+    assert hashes == [1, 1]
+    assert len(engine.typesPrompts) == 1
+
+
+def test_streamDesign(isolatedPredictionCache, localProvider):
+    events = collect(engine.streamDesign("A column on a column.", columnTypeContexts(), provider=localProvider))
+    assert [next(iter(e)) for e in events] == ["piece", "piece", "connection", "design"]
+    assert (events[0]["piece"]["id_"], events[0]["piece"]["type"]["name"]) == ("c1", "Column")
+    assert [p["id_"] for p in events[-1]["design"]["pieces"]] == ["c1", "c2"]
+    assert events[:-1] == [{"piece": p} for p in events[-1]["design"]["pieces"]] + [{"connection": c} for c in events[-1]["design"]["connections"]]
+    assert collect(engine.streamDesign("A column on a column.", columnTypeContexts(), provider=localProvider)) == events
+
+
+class DisconnectingRequest:
+    """A request whose client disconnects after a number of polls."""
+
+    def __init__(self, polls: int = 2) -> None:
+        self.polls = polls
+
+    async def is_disconnected(self) -> bool:
+        self.polls -= 1
+        return self.polls < 0
+
+
+def test_cancelOnDisconnect(monkeypatch):
+    monkeypatch.setattr(engine, "DISCONNECT_POLL_INTERVAL", 0.01)
+    cancelled = []
+
+    async def work():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def cancel():
+        with pytest.raises(engine.ClientDisconnected):
+            await engine.cancelOnDisconnect(DisconnectingRequest(), work())
+        return await engine.cancelOnDisconnect(DisconnectingRequest(), asyncio.sleep(0, "done"))
+
+    assert asyncio.run(cancel()) == "done"
+    assert cancelled == [True]
+
+
+def test_assistantEndpoints(isolatedPredictionCache, localProvider, monkeypatch):
+    monkeypatch.setattr(engine, "predictionProvider", localProvider)
+    types = [t.model_dump(mode="json") for t in columnTypeContexts()]
+    with fastapi.testclient.TestClient(engine.engine) as client:
+        response = client.request("GET", "/api/assistant/predictDesign", json={"description": "A column on a column.", "types": types})
+        assert response.status_code == 200
+        assert [p["id_"] for p in response.json()["pieces"]] == ["c1", "c2"]
+        streams = [client.request("GET", "/api/assistant/streamDesign", json={"description": "Two columns.", "types": types}) for _ in range(2)]
+    missed, hit = ([json.loads(line) for line in stream.text.splitlines()] for stream in streams)
+    assert [next(iter(e)) for e in missed] == ["piece", "piece", "connection", "design"]
+    assert missed == hit
+
+
+def test_assistantEndpointCancellation(isolatedPredictionCache, localProvider, monkeypatch):
+    monkeypatch.setattr(engine, "predictionProvider", localProvider)
+    monkeypatch.setattr(engine, "DISCONNECT_POLL_INTERVAL", 0.01)
+    MockCompletionHandler.delay = 0.5
+    start = time.perf_counter()
+    response = asyncio.run(engine.predict_design(DisconnectingRequest(), "A column on a column.", columnTypeContexts()))
+    assert time.perf_counter() - start < MockCompletionHandler.delay
+    assert response.status_code == 400
+    assert response.body.decode() == str(engine.ClientDisconnected())
+    assert list(isolatedPredictionCache.folder.glob("*.json")) == []
+
+
+def test_predictDesigns(isolatedPredictionCache, localProvider):
+    MockCompletionHandler.failures = 1
+    MockCompletionHandler.delay = 0.05
+    descriptions = [f"A column on a column number {i}." for i in range(6)]
+    results = collect(engine.predictDesigns(descriptions, columnTypeContexts(), provider=localProvider, concurrency=2, backoff=0.01))
+    assert sorted(index for index, _ in results) == list(range(6))
+    assert all([p.id_ for p in design.pieces] == ["c1", "c2"] for _, design in results)
+    assert MockCompletionHandler.maxActive == 2
+
+
+def test_streamDesignRetries(isolatedPredictionCache, localProvider):
+    MockCompletionHandler.failures = 2
+
+    def stream(retries):
+        return collect(engine.streamDesign("A column on a column.", columnTypeContexts(), provider=localProvider, retries=retries, backoff=0.01))
+
+    with pytest.raises(engine.FeatureNotYetSupported):
+        stream(0)
+    assert [next(iter(e)) for e in stream(1)] == ["piece", "piece", "connection", "design"]
+
+
+def test_predictDesignsEndpoint(isolatedPredictionCache, localProvider, monkeypatch):
+    monkeypatch.setattr(engine, "predictionProvider", localProvider)
+    monkeypatch.setattr(engine, "PREDICTION_CONCURRENCY", 2)
+    MockCompletionHandler.delay = 0.05
+    types = [t.model_dump(mode="json") for t in columnTypeContexts()]
+    with fastapi.testclient.TestClient(engine.engine) as client:
+        descriptions = [f"A column on a column number {i}." for i in range(6)]
+        response = client.request("GET", "/api/assistant/predictDesigns", params={"concurrency": 100}, json={"descriptions": descriptions, "types": types})
+        assert response.status_code == 200
+        assert sorted(json.loads(line)["index"] for line in response.text.splitlines()) == list(range(6))
+        assert MockCompletionHandler.maxActive == 2
+        descriptions = [f"A column number {i}." for i in range(engine.DESCRIPTIONS_MAX + 1)]
+        response = client.request("GET", "/api/assistant/predictDesigns", json={"descriptions": descriptions, "types": types})
+        assert response.status_code == 413
+        assert MockCompletionHandler.maxActive == 2
+
+
+def test_replayProvider(isolatedPredictionCache, localProvider, tmp_path):
+    recordings = str(tmp_path / "recordings.jsonl")
+    recording = engine.RecordingProvider(localProvider, recordings)
+    recorded = asyncio.run(engine.predictDesignAsync("A column on a column.", columnTypeContexts(), provider=recording))
+    replay = engine.ReplayProvider(recordings)
+    assert engine.predictDesign("A column on a column.", columnTypeContexts(), provider=replay) == recorded
+    events = collect(engine.streamDesign("Two columns.", columnTypeContexts(), provider=replay))
+    assert [next(iter(e)) for e in events] == ["piece", "piece", "connection", "design"]
+
+
+def test_predictDesignTwice(isolatedPredictionCache, localProvider):
+    designs = [engine.predictDesign(f"A column on a column number {i}.", columnTypeContexts(), provider=localProvider) for i in range(2)]
+    assert [[p.id_ for p in design.pieces] for design in designs] == [["c1", "c2"], ["c1", "c2"]]
+    assert len(list(isolatedPredictionCache.folder.glob("*.json"))) == 2
+
+
+def test_recordingProviderStream(isolatedPredictionCache, localProvider, tmp_path):
+    recordings = str(tmp_path / "recordings.jsonl")
+    streamed = collect(engine.streamDesign("A column on a column.", columnTypeContexts(), provider=engine.RecordingProvider(localProvider, recordings)))
+    with open(recordings, encoding="utf-8") as file:
+        completions = [json.loads(line)["completion"] for line in file]
+    assert len(completions) == 1
+    assert json.loads(completions[0]["choices"][0]["message"]["content"]) == PREDICTED_DESIGN
+    assert completions[0]["choices"][0]["finish_reason"] == "stop"
+    replayed = engine.predictDesign("A column on a column.", columnTypeContexts(), provider=engine.ReplayProvider(recordings))
+    assert replayed.model_dump(mode="json") == streamed[-1]["design"]
+
+
+def test_histogram():
+    histogram = engine.Histogram([1, 2, 4])
+    assert histogram.quantile(0.5) is None
+    for value in [0.5, 1.5, 1.5, 3, 8]:
+        histogram.observe(value)
+    assert histogram.counts == [1, 2, 1, 1]
+    assert (histogram.count, histogram.sum) == (5, 14.5)
+    assert histogram.quantile(0.5) == pytest.approx(1.75)
+    assert histogram.quantile(0.99) == 4
+
+
+def test_predictionMetrics(isolatedPredictionCache, localProvider, monkeypatch):
+    monkeypatch.setattr(engine, "predictionMetrics", engine.PredictionMetrics())
+    engine.predictDesign("A column on a column.", columnTypeContexts(), provider=localProvider)
+    engine.predictDesign("A column on a column.", columnTypeContexts(), provider=localProvider)
+    metrics = engine.predictionMetrics.dump().models["mock"]
+    assert {m: h.count for m, h in metrics.items()} == {m: 1 for m in engine.PredictionMetrics.BOUNDS}
+    assert (metrics["promptTokens"].sum, metrics["completionTokens"].sum) == (1, 1)
+    assert (metrics["healedPieces"].sum, metrics["healedPorts"].sum) == (0, 0)
+    misspelled = json.loads(json.dumps(PREDICTED_DESIGN))
+    misspelled["pieces"][0]["typeName"] = "Colum"
+    misspelled["connections"][0]["connectedPieceTypePortId"] = "tpo"
+    healed = engine.healPrediction("misspelled", json.dumps(misspelled), columnTypeContexts(), "mock")
+    assert [(p.type.name, p.type.variant) for p in healed.pieces] == [("Column", ""), ("Column", "")]
+    assert healed.connections[0].connected.port.id_ == "top"
+    metrics = engine.predictionMetrics.dump().models["mock"]
+    assert (metrics["healedPieces"].sum, metrics["healedPorts"].sum) == (1, 1)
+
+
+def test_streamDesignMetrics(isolatedPredictionCache, localProvider, monkeypatch):
+    monkeypatch.setattr(engine, "predictionMetrics", engine.PredictionMetrics())
+    pause = 0.1
+
+    async def stream():
+        events = []
+        async for event in engine.streamDesign("A column on a column.", columnTypeContexts(), provider=localProvider):
+            events.append(event)
+            await asyncio.sleep(pause)
+        return events
+
+    events = asyncio.run(stream())
+    metrics = engine.predictionMetrics.dump().models["mock"]
+    assert (metrics["promptTokens"].sum, metrics["completionTokens"].sum) == (1, 1)
+    assert metrics["completionLatency"].count == 1
+    assert metrics["completionLatency"].sum < pause * (len(events) - 1)
+
+
+def test_compactTypesPrompt():
+    port = {"point": {"x": 0, "y": 0, "z": 0}, "direction": {"x": 0, "y": 1, "z": 0}}
+    ports = [{"id_": "top", "family": "pin", "compatibleFamilies": ["hole"], **port}, {"id_": "bottom", "family": "hole", **port}]
+    types = [
+        engine.TypeContext.model_validate({"name": "Column", "variant": variant, "description": "A column.", "ports": ports}) for variant in ["", "steel"]
+    ] + [engine.TypeContext.model_validate({"name": "Slab", "description": "A floor slab.", "concepts": ["floor"]})]
+    compact = engine.renderTypesPrompt(types, "compact")
+    assert "{F0;pin}\n{F1;hole}" in compact
+    assert "{P0;{top;;F0;F1}{bottom;;F1;}}" in compact
+    assert "{Column;DEFAULT;A column.;P0}\n{Column;steel;A column.;P0}\n{Slab;DEFAULT;A floor slab.;P1}" in compact
+    assert engine.estimateTokens(compact) < engine.estimateTokens(engine.renderTypesPrompt(types, "full"))
+    assert [(t.name, t.variant) for t in engine.relevantTypes("Three columns on a roof", types)] == [("Column", ""), ("Column", "steel")]
+    assert engine.relevantTypes("A tower", types) == types
+
+
+@pytest.mark.parametrize(
+    "largestComponent, expectedPieces, expectedConnections",
+    [
+        pytest.param(False, ["a", "b", "c", "d", "e"], [("a", "b"), ("b", "c"), ("d", "e")], id="all components"),
+        pytest.param(True, ["a", "b", "c"], [("a", "b"), ("b", "c")], id="largest component"),
+    ],
+)
+def test_healDesignComponents(largestComponent, expectedPieces, expectedConnections):
+    connection = {"gap": 0, "shift": 0, "rise": 0, "rotation": 0, "turn": 0, "tilt": 0, "x": 0, "y": 0}
+    pairs = [("a", "b"), ("b", "c"), ("d", "e"), ("e", "e")]
+    design = engine.decodeDesign(
+        {
+            "pieces": [{"id": id_, "typeName": "Column", "typeVariant": "DEFAULT"} for id_ in "abcdef"],
+            "connections": [
+                {"connectedPieceId": i, "connectedPieceTypePortId": "top", "connectingPieceId": j, "connectingPieceTypePortId": "bottom", **connection} for i, j in pairs
+            ],
+        }
+    )
+    healed = engine.healDesign(design, columnTypeContexts(), largestComponent)
+    assert [p.id_ for p in healed.pieces] == expectedPieces
+    assert [(c.connected.piece.id_, c.connecting.piece.id_) for c in healed.connections] == expectedConnections
+
+
+@pytest.mark.parametrize(
+    "connectedDirection, connectingDirection",
+    [
+        pytest.param((0, 1, 0), (0, -1, 0), id="facing"),
+        pytest.param((0, 1, 0), (0, 1, 0), id="same"),
+        pytest.param((0, 0, 1), (0, 0, 1), id="same along z"),
+        pytest.param((0.6, 0, 0.8), (0.6, 0, 0.8), id="same oblique"),
+        pytest.param((1, 0, 0), (0, 0, 1), id="orthogonal"),
+    ],
+)
+def test_connectionTransforms(connectedDirection, connectingDirection):
+    def port(id_, point, direction):
+        return engine.Port.parse({"id_": id_, "point": dict(zip("xyz", point)), "direction": dict(zip("xyz", direction))})
+
+    connection = engine.Connection(
+        connectedPort=port("a", (1, 2, 3), connectedDirection),
+        connectingPort=port("b", (-1, 0, 2), connectingDirection),
+        gap=0.5,
+        shift=-0.25,
+        rise=1,
+        rotation=30,
+        turn=45,
+        tilt=60,
+    )
+    transform = engine.connectionTransform(connection.connectedPort, connection.connectingPort, connection)
+    transforms = engine.connectionTransforms(*engine.connectionArrays([connection]))
+    assert numpy.allclose(transforms[0], transform, atol=engine.TOLERANCE)
+    assert numpy.allclose(engine.invertTransforms(transforms)[0] @ transforms[0], numpy.eye(4), atol=engine.TOLERANCE)
+
+
+@pytest.mark.parametrize(
+    "body, limits, chunkSize, expectedKey",
+    [
+        pytest.param(b'{"types": [{}, {}, {}]}', {"types": 3}, 1024, None, id="at the limit"),
+        pytest.param(b'{"types": [{}, {}, {}, {}]}', {"types": 3}, 1024, "types", id="above the limit"),
+        pytest.param(b'{"types": [{}, {}, {}, {}]}', {"types": 3}, 1, "types", id="above the limit, byte by byte"),
+        pytest.param(b'{"types": [{"attributes": [{}, {}, {}]}]}', {"attributes": 2}, 5, "attributes", id="nested above the limit"),
+        pytest.param(b'{"description": "\\"types\\": [,,,,]", "types": []}', {"types": 3}, 3, None, id="inside string"),
+        pytest.param(b'{"notes": ["types", [1, 2, 3, 4]]}', {"types": 3}, 2, None, id="array without key"),
+    ],
+)
+def test_collectionLimitsScanner(body, limits, chunkSize, expectedKey):
+    scanner = engine.CollectionLimitsScanner(limits)
+    try:
+        for i in range(0, len(body), chunkSize):
+            scanner.feed(body[i : i + chunkSize])
+    except engine.CollectionTooLarge as e:
+        assert e.key == expectedKey
+    else:
+        assert expectedKey is None
+
+
+@pytest.mark.parametrize("chunkSize", [1, 3, 1024])
+def test_jsonArrayStreamSplitter(chunkSize):
+    body = b'{"name": "Kit \\"[\\"", "types": [{"name": "A", "ports": [{"id_": "}"}]}, {"name": "B"}], "designs": [], "concepts": ["types"]}'
+    splitter = engine.JsonArrayStreamSplitter(("types", "designs"))
+    items = []
+    for i in range(0, len(body), chunkSize):
+        items += splitter.feed(body[i : i + chunkSize])
+    assert items == [("types", b'{"name": "A", "ports": [{"id_": "}"}]}'), ("types", b'{"name": "B"}')]
+    assert splitter.close() == {"name": 'Kit "["', "types": [], "designs": [], "concepts": ["types"]}
+
+
+def streamKit(kit: str, body: dict, chunkSize: int = 7) -> tuple[engine.KitStream, int]:
+    """🌊 Stream a kit body in small chunks with a batch size of one and return the stream and the maximum number of designs that waited for the types."""
+    store, operation = engine.storeAndOperationFromCode(kit)
+    stream = engine.KitStream(store, operation["kitUri"], batchSize=1)
+    data = json.dumps(body).encode()
+    pending = 0
+    for i in range(0, len(data), chunkSize):
+        stream.feed(data[i : i + chunkSize])
+        pending = max(pending, len(stream.pendingDesigns))
+    return stream, pending
+
+
+@pytest.mark.parametrize("designsFirst", [pytest.param(False, id="types first"), pytest.param(True, id="designs first")])
+def test_kitStream(tmp_path, designsFirst):
+    kit = engine.encode(str(tmp_path))
+    body = {"designs": [columnDesignInput(3)], "types": [BEAM]} if designsFirst else {"types": [BEAM], "designs": [columnDesignInput(3)]}
+    stream, pending = streamKit(kit, {"name": "Columns", **body})
+    assert pending == (1 if designsFirst else 0)
+    assert stream.kit.name == ""
+    stream.close()
+    output = engine.get(kit).dump()
+    assert output.name == "Columns"
+    assert [t.name for t in output.types] == ["Beam"]
+    assert [[p.id_ for p in d.pieces] for d in output.designs] == [["b0", "b1", "b2"]]
+
+
+def test_kitStreamAbort(tmp_path):
+    kit = engine.encode(str(tmp_path))
+    with pytest.raises(engine.StreamNotValid):
+        streamKit(kit, {"name": "Columns", "types": [BEAM, 1]})
+    with pytest.raises(engine.KitNotFound):
+        engine.get(kit)
+    stream, _ = streamKit(kit, {"name": "Columns", "types": [BEAM]})
+    assert stream.close().name == "Columns"
+
+
 # @pytest.mark.parametrize(
 #     "code, entity",
 #     [
@@ -73,6 +1068,44 @@ def test_integration_graphql_local_kit_crud(tmp_path):
     pass
 
 
-@pytest.mark.skip
 def test_integration_graphql_local_kit_designToScene(tmp_path):
-    pass
+    putColumnKit(tmp_path, gap=0.5)
+    result = engine.graphqlSchema.execute(
+        'query Scene($kitUri: String!) { scene(kitUri: $kitUri, designName: "Column") { pieces { id_ depth fixedPiece { id_ } plane { origin { y } } } } }',
+        variable_values={"kitUri": str(tmp_path)},
+    )
+    assert result.errors is None
+    pieces = result.data["scene"]["pieces"]
+    assert [(p["id_"], p["depth"], p["fixedPiece"]["id_"]) for p in pieces] == [("b0", 0, "b0"), ("b1", 1, "b0"), ("b2", 2, "b0")]
+    assert [p["plane"]["origin"]["y"] for p in pieces] == pytest.approx([0, 1.5, 3])
+
+
+def test_integration_rest_local_kit_designToScene(tmp_path):
+    kit = putColumnKit(tmp_path, gap=0.5)
+    client = fastapi.testclient.TestClient(engine.engine)
+    response = client.get(f"/api/kits/{engine.encode(kit)}/designs/Column,,/scene")
+    assert response.status_code == 200
+    pieces = response.json()["pieces"]
+    assert [p["depth"] for p in pieces] == [0, 1, 2]
+    assert [p["plane"]["origin"]["y"] for p in pieces] == pytest.approx([0, 1.5, 3])
+    assert client.get(f"/api/kits/{engine.encode(kit)}/designs/Beam,,/scene").status_code == 400
+
+
+def test_integration_rest_local_kit_representationUrls(tmp_path):
+    kit = putColumnKit(tmp_path, beam=REPRESENTED_BEAM)
+    client = fastapi.testclient.TestClient(engine.engine)
+    url = f"/api/kits/{engine.encode(kit)}/designs/Column,,/representations"
+    assert [r["url"] for r in client.get(url).json()["representations"]] == ["beam.json"]
+    response = client.get(url, params={"tags": engine.encodeList(["low", "glb"])})
+    assert response.status_code == 200
+    assert response.json()["representations"] == [{"type": {"name": "Beam", "variant": ""}, "url": "beam-low.glb"}]
+
+
+def test_integration_graphql_local_kit_representationUrls(tmp_path):
+    putColumnKit(tmp_path, beam=REPRESENTED_BEAM)
+    result = engine.graphqlSchema.execute(
+        'query RepresentationUrls($kitUri: String!, $tags: [String!]) { representationUrls(kitUri: $kitUri, designName: "Column", tags: $tags) { representations { type { name } url } } }',
+        variable_values={"kitUri": str(tmp_path), "tags": ["glb", "low"]},
+    )
+    assert result.errors is None
+    assert result.data["representationUrls"]["representations"] == [{"type": {"name": "Beam"}, "url": "beam-low.glb"}]